@@ -6,7 +6,12 @@ from memory_manager import MemoryManager
 from audio_manager import AudioManager
 from theme_manager import ThemeManager
 from openai_manager import OpenAIManager
-from components.interactive import typing_effect, animated_choice_buttons
+from generation_cache import get_generation_cache
+from llm_metrics import MODEL_PRICES, llm_metrics
+from prefetch import DEFAULT_MAX_SCENES
+from bridge_pool import bridge_pool
+from components.admin_view import display_bridge_pool, display_llm_metrics
+from components.interactive import typing_effect, streaming_text, animated_choice_buttons
 from components.stats_view import display_achievements, display_story_stats
 from audio_components import NarrationProgress, audio_settings
 from visual_components import (
@@ -18,7 +23,7 @@ from visual_components import (
     scene_filter
 )
 from prompts import INTRO_PROMPT, END_PROMPT, BADGE_PROMPT
-from utils import assign_badge
+from utils import assign_badge, detect_mood
 from streamlit_option_menu import option_menu
 from streamlit_custom_notification_box import custom_notification_box
 import time
@@ -26,6 +31,9 @@ import atexit
 import os
 import logging
 
+# How often the partial scene refreshes while it is written in the background
+GENERATION_REFRESH_SECONDS = 0.25
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -203,7 +211,9 @@ if "initialized" not in st.session_state:
     st.session_state.show_achievement = False
     st.session_state._is_running = True
     st.session_state.dynamic_generation = False
-    st.session_state.openai_manager = OpenAIManager()
+    st.session_state.openai_manager = OpenAIManager(cache=get_generation_cache())
+    st.session_state.generation_job = None
+    st.session_state.generation_choice = None
 
 # Prevent unnecessary theme reapplication
 if "last_theme" not in st.session_state:
@@ -230,8 +240,8 @@ with st.sidebar:
     st.image("assets/kuku_logo.png", width=100)
     selected = option_menu(
         "Story Settings",
-        ["Story", "Settings", "AI Settings", "Progress", "Statistics"],
-        icons=["book", "gear", "robot", "graph-up", "trophy"],
+        ["Story", "Settings", "AI Settings", "Progress", "Statistics", "Admin"],
+        icons=["book", "gear", "robot", "graph-up", "trophy", "speedometer"],
         default_index=0,
         styles={
             "nav-link-selected": {"background-color": st.session_state.theme_manager.get_theme_color("primary_color")}
@@ -310,24 +320,61 @@ with st.sidebar:
                 st.session_state.dynamic_generation = dynamic_generation
                 if dynamic_generation:
                     st.session_state.kuku.enable_dynamic_generation(st.session_state.openai_manager)
+                    # Scenes to splice in when a live one is late, written while the API is quiet
+                    st.session_state.kuku.enable_bridges()
                     st.success("AI story generation enabled!")
                 else:
                     st.info("AI story generation disabled")
         st.markdown('</div>', unsafe_allow_html=True)
         
+        # Speculative prefetch of the AI scenes behind the current choices
+        if st.session_state.dynamic_generation:
+            prefetch = st.toggle(
+                "Prefetch AI Scenes",
+                st.session_state.kuku.prefetch_limit > 0,
+                help="Write the next AI scenes while you read, so choices open instantly (uses more tokens)"
+            )
+            if prefetch:
+                max_scenes = st.slider("Prefetch budget (scenes per session)", 1, 50, DEFAULT_MAX_SCENES)
+                st.session_state.kuku.enable_prefetch(max_scenes)
+                stats = st.session_state.kuku.prefetch_budget.get_stats()
+                st.caption(
+                    f"Hit rate {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses) · "
+                    f"{stats['wasted_tokens']} of {stats['used_tokens'] + stats['wasted_tokens']} tokens wasted"
+                )
+            elif st.session_state.kuku.prefetch_limit:
+                st.session_state.kuku.disable_prefetch()
+        
+        if st.session_state.dynamic_generation:
+            st.session_state.openai_manager.structured = st.toggle(
+                "Structured AI Scenes",
+                st.session_state.openai_manager.structured,
+                help="Write each scene, its choices and its mood as one JSON reply (one API call per scene)"
+            )
+        
         # Model selection
         if st.session_state.dynamic_generation:
-            st.selectbox(
+            manager = st.session_state.openai_manager
+            models = list(dict.fromkeys([manager.model, *MODEL_PRICES]))
+            model = st.selectbox(
                 "OpenAI Model",
-                ["gpt-3.5-turbo"],
-                index=0,
-                disabled=True,
-                help="Currently only GPT-3.5-turbo is supported"
+                models,
+                index=models.index(manager.model),
+                help="Preferred model for calls without a route of their own (see KUKU_MODEL_ROUTES)"
             )
+            if model != manager.model:
+                manager.model = model
     
     elif selected == "Progress":
         progress = len(st.session_state.memory.get_path())
-        st.progress(min(progress / 5, 1.0), f"Story Progress: {progress} choices made")
+        fraction = st.session_state.kuku.get_progress(st.session_state.scene_id)
+        if fraction is None:
+            # Scene is outside the compiled graph (e.g. AI-generated)
+            fraction = min(progress / 5, 1.0)
+        st.progress(fraction, f"Story Progress: {progress} choices made")
+        endings = st.session_state.kuku.get_reachable_endings(st.session_state.scene_id)
+        if endings is not None:
+            st.caption(f"{endings} ending{'s' if endings != 1 else ''} still within reach")
         
         if progress > 0:
             st.markdown("""
@@ -350,29 +397,81 @@ with st.sidebar:
         
         st.markdown("### Achievements")
         display_achievements(stats["achievements"])
+    
+    elif selected == "Admin":
+        st.markdown("### Generation Performance")
+        display_llm_metrics(llm_metrics.summary(), llm_metrics.get_stats(),
+                            st.session_state.openai_manager.router.get_stats())
+        display_bridge_pool(bridge_pool.get_stats())
+        if st.button("Reset metrics"):
+            llm_metrics.reset()
+            st.session_state.openai_manager.router.health.reset()
+            st.rerun()
 
 # Main content area
 st.markdown(INTRO_PROMPT, unsafe_allow_html=True)
 
+@st.fragment(run_every=GENERATION_REFRESH_SECONDS)
+def generation_progress():
+    """Show a scene as it is written; only this fragment reruns until it is done"""
+    job = st.session_state.get("generation_job")
+    if job is None:
+        return
+    if job.done() or st.session_state.kuku.deadline_passed(job):
+        # The full run below moves the story on
+        st.rerun()
+    stream = job.progress
+    if stream is not None and stream.text:
+        # Show the scene as the model writes it; choices wait for the finished scene
+        streaming_text(stream.text)
+        if stream.question:
+            st.markdown(f"**{stream.question}**")
+    else:
+        st.markdown(
+            "<div class='story-text fade-in'>✍️ Writing the next scene...</div>",
+            unsafe_allow_html=True
+        )
+    if st.button("Choose a different path", key="cancel_generation"):
+        st.session_state.kuku.cancel_generation()
+        st.session_state.generation_job = None
+        st.rerun()
+
+# A scene being written in the background: refresh its progress without rerunning the page
+generation_job = st.session_state.get("generation_job")
+if generation_job is not None:
+    overdue = st.session_state.kuku.deadline_passed(generation_job)
+    if generation_job.done() or overdue:
+        st.session_state.generation_job = None
+        next_id, next_scene = None, None
+        if not overdue:
+            next_id, next_scene = st.session_state.kuku.finish_generation(generation_job)
+        written = next_id is not None
+        if not written:
+            # Too slow or failed: carry on in the written story
+            next_id, next_scene = st.session_state.kuku.fall_back(generation_job)
+        if next_id:
+            st.session_state.memory.update(st.session_state.scene_id, st.session_state.generation_choice)
+            st.session_state.scene_id = next_id
+            st.session_state.last_narrated = None
+            # The reader already watched streamed text being written; don't type it out again
+            st.session_state.current_text = next_scene["text"] if written and generation_job.progress else None
+            if not written:
+                st.info("The storyteller took a shortcut: that path couldn't be written in time.")
+        else:
+            st.warning("The next scene couldn't be written. Please choose again.")
+    else:
+        generation_progress()
+        # The current scene and its choices wait for the new one
+        st.stop()
+
 # Current Scene with enhanced presentation
 scene = st.session_state.kuku.get_scene(st.session_state.scene_id)
 if scene:
-    # Detect scene mood based on content
-    def detect_mood(text):
-        keywords = {
-            "tense": ["sudden", "quickly", "danger", "scared", "rush", "chase", "escape", "hurry"],
-            "mysterious": ["strange", "curious", "wonder", "mystery", "unknown", "suspicious", "clue"],
-            "peaceful": ["calm", "quiet", "gentle", "safe", "peaceful", "steady", "careful"],
-            "dramatic": ["dramatic", "intense", "shocking", "reveal", "twist", "surprise", "discover"]
-        }
-        
-        text = text.lower()
-        mood_scores = {mood: sum(1 for word in words if word in text)
-                      for mood, words in keywords.items()}
-        return max(mood_scores.items(), key=lambda x: x[1])[0] if any(mood_scores.values()) else "mysterious"
-
-    # Update current mood and effects
-    new_mood = detect_mood(scene["text"])
+    # Start on the AI scenes behind this scene's choices while it is read
+    st.session_state.kuku.prefetch_choices(st.session_state.scene_id, st.session_state.memory.get_path())
+    
+    # Update current mood and effects; structured AI scenes name their own mood
+    new_mood = scene.get("mood") or detect_mood(scene["text"])
     if new_mood != st.session_state.current_mood:
         st.session_state.current_mood = new_mood
         if st.session_state.effects_enabled:
@@ -434,14 +533,24 @@ if scene:
             def handle_choice(next_id, choice_text):
                 st.session_state.theme_manager.play_effect("button_click")
                 cleanup_audio()
-                st.session_state.memory.update(st.session_state.scene_id, choice_text)
                 
                 # If dynamic generation is enabled, potentially generate new content
                 if st.session_state.dynamic_generation and next_id == "generate_new":
                     next_id = st.session_state.kuku.generate_choice_scene(
-                        st.session_state.scene_id, choice_text
+                        st.session_state.scene_id, choice_text, st.session_state.memory.get_path()
                     )
+                else:
+                    # Scenes still to be written come back as a job the next runs poll
+                    resolved_id, _, job = st.session_state.kuku.request_next_scene(
+                        st.session_state.scene_id, choice_text, st.session_state.memory.get_path()
+                    )
+                    if job is not None:
+                        st.session_state.generation_job = job
+                        st.session_state.generation_choice = choice_text
+                        st.rerun()
+                    next_id = resolved_id or next_id
                 
+                st.session_state.memory.update(st.session_state.scene_id, choice_text)
                 st.session_state.scene_id = next_id
                 st.session_state.last_narrated = None
                 st.session_state.current_text = None
@@ -456,6 +565,10 @@ if scene:
             story_time = time.time() - st.session_state.start_time
             st.session_state.memory.complete_story(story_time)
             st.session_state.memory.add_mood(st.session_state.current_mood)
+            if not st.session_state.get("story_cost_recorded"):
+                # What this reader's model calls cost over the whole story
+                llm_metrics.record_story(st.session_state.openai_manager.take_cost())
+                st.session_state.story_cost_recorded = True
             
             st.session_state.theme_manager.play_effect("story_end")
             st.markdown(END_PROMPT, unsafe_allow_html=True)
@@ -486,10 +599,14 @@ if scene:
             """, unsafe_allow_html=True)
             
             if st.button("Start New Story", key="restart"):
+                st.session_state.kuku.cancel_generation()
+                st.session_state.generation_job = None
                 st.session_state.start_time = time.time()
                 st.session_state.theme_manager.play_effect("button_click")
                 cleanup_audio()
                 st.session_state.memory.reset()
+                st.session_state.openai_manager.take_cost()
+                st.session_state.story_cost_recorded = False
                 st.session_state.current_text = None
                 scene, scene_id = st.session_state.kuku.get_start_scene()
                 st.session_state.scene_id = scene_id
@@ -0,0 +1,85 @@
+"""Compare cold load time and memory of JSON and compiled (.kbs) stories.
+
+Each measurement runs in a fresh interpreter: it opens the story with
+KukuBuddy, reads the start scene and follows a few choices, then reports
+wall time and the growth of the process's resident set size.
+
+    python benchmarks/bench_binary.py --scenes 1000 100000 500000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from story_binary import compile_story
+from story_generator import write_story
+
+PROBE = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+
+def rss_kib():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return 0
+
+import logging
+logging.disable(logging.CRITICAL)
+from kuku_buddy import KukuBuddy
+before = rss_kib()
+started = time.perf_counter()
+kuku = KukuBuddy({path!r})
+scene, scene_id = kuku.get_start_scene()
+for _ in range(3):
+    scene_id, scene = kuku.get_next_scene(scene_id, next(iter(scene["choices"])))
+elapsed = time.perf_counter() - started
+print(json.dumps({{"backend": type(kuku.store).__name__, "seconds": elapsed, "rss_kib": rss_kib() - before}}))
+"""
+
+
+def probe(path: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, path=path)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", type=int, nargs="+", default=[1000, 100000, 500000])
+    args = parser.parse_args()
+
+    print(f"{'scenes':>8} | {'json ms':>9} {'json RSS MiB':>12} | {'kbs ms':>8} {'kbs RSS MiB':>11} | "
+          f"{'json MiB':>8} {'kbs MiB':>8} {'compile s':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scene_count in args.scenes:
+            json_path = os.path.join(tmp, f"story_{scene_count}.json")
+            write_story(json_path, scene_count, indent=True)
+            json_result = probe(json_path)
+
+            started = time.perf_counter()
+            binary_path = str(compile_story(json_path))
+            compile_seconds = time.perf_counter() - started
+            binary_result = probe(binary_path)
+            assert binary_result["backend"] == "BinaryStoryStore"
+
+            print(f"{scene_count:>8} | {json_result['seconds'] * 1000:>9.1f} "
+                  f"{json_result['rss_kib'] / 1024:>12.1f} | {binary_result['seconds'] * 1000:>8.2f} "
+                  f"{binary_result['rss_kib'] / 1024:>11.2f} | {os.path.getsize(json_path) / 2**20:>8.1f} "
+                  f"{os.path.getsize(binary_path) / 2**20:>8.1f} {compile_seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Time near-duplicate choice lookups as the number of indexed branches grows.
+
+Each scene gets ``--choices`` generated branches; lookups then reword
+choices of random scenes ("Check in to the motel" becomes "check into the
+motel!"). Because the LSH buckets are keyed by scene as well as by band,
+the time per lookup and the candidates checked per lookup should stay
+flat however many branches are indexed. The index is sized to keep every
+scene, so nothing is evicted while measuring.
+
+    python benchmarks/bench_choice_index.py --branches 10000 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from choice_index import ChoiceIndex
+
+VERBS = ["Open", "Follow", "Search", "Hide in", "Run to", "Call", "Climb", "Check", "Leave", "Ask about"]
+OBJECTS = ["the door", "the stranger", "the cellar", "the old truck", "the motel", "the radio",
+           "the ridge", "the letter", "the sheriff", "the basement"]
+
+
+def reword(choice: str) -> str:
+    return choice.lower().replace(" the ", " that ") + "!"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branches", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--choices", type=int, default=4, help="Branches written per scene")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    print(f"{'branches':>10} {'index s':>9} {'lookup us':>10} {'candidates':>11} {'matched':>8}")
+    for count in args.branches:
+        scenes = count // args.choices
+        index = ChoiceIndex(max_scenes=scenes)
+        written = []
+        started = time.perf_counter()
+        for scene in range(scenes):
+            choices = rng.sample([f"{verb} {obj}" for verb in VERBS for obj in OBJECTS], args.choices)
+            for choice in choices:
+                index.add(f"scene_{scene}", choice, f"{scene}_{len(index)}_ai")
+            written.append(choices[0])
+        indexed = time.perf_counter() - started
+
+        queries = []
+        for _ in range(args.lookups):
+            scene = rng.randrange(scenes)
+            queries.append((f"scene_{scene}", reword(written[scene])))
+        started = time.perf_counter()
+        matched = sum(index.find(scene, choice) is not None for scene, choice in queries)
+        per_lookup = (time.perf_counter() - started) / args.lookups
+        print(f"{len(index):>10} {indexed:>9.1f} {per_lookup * 1e6:>10.1f} "
+              f"{index.get_stats()['candidates_per_lookup']:>11.2f} {matched / args.lookups:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
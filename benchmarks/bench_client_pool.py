@@ -0,0 +1,84 @@
+"""Compare a new OpenAI client per request with the shared client pool.
+
+Requests go to the stand-in server (fake_openai_server.py). Because a
+local connection costs almost nothing to open, ``--handshake-ms`` delays
+every new connection to stand in for the TCP and TLS setup a real
+endpoint needs; kept-alive connections skip it.
+
+Scene generation always streams, so each client is also run with
+streamed requests, read the way OpenAIManager reads them (through
+``iter_chunks``, which drains the response to EOF). The pooled streamed
+run must reuse a single connection; the benchmark fails otherwise.
+
+    python benchmarks/bench_client_pool.py --requests 200 --handshake-ms 40
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openai
+
+from client_pool import ClientPool, iter_chunks
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig
+
+
+def run(requests: int, get_client, stream: bool = False) -> list:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client = get_client()
+        response = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "Go"}],
+                                                  stream=stream)
+        if stream:
+            for _ in iter_chunks(response):
+                pass
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list, connections: int) -> None:
+    latencies = sorted(latencies)
+    print(f"{name:<20} mean {statistics.mean(latencies) * 1000:7.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f} ms  connections {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=40.0, help="delay added to each new connection")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(FakeServerConfig(connect_ms=args.handshake_ms)) as server:
+        for stream in (False, True):
+            kind = "streamed" if stream else "plain"
+            fresh = []
+
+            def new_client():
+                client = openai.OpenAI(api_key="bench", base_url=server.base_url, max_retries=0)
+                fresh.append(client)
+                return client
+
+            before = server.get_stats()["connections"]
+            latencies = run(args.requests, new_client, stream)
+            report(f"per-request {kind}", latencies, server.get_stats()["connections"] - before)
+            for client in fresh:
+                client.close()
+
+            before = server.get_stats()["connections"]
+            pool = ClientPool()
+            latencies = run(args.requests, lambda: pool.get("bench", server.base_url), stream)
+            connections = server.get_stats()["connections"] - before
+            report(f"pooled {kind}", latencies, connections)
+            pool.close_all()
+            if connections != 1:
+                sys.exit(f"pooled {kind} requests opened {connections} connections, expected 1")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare save latency of full-story JSON rewrites with journal appends.
+
+The "rewrite" column is the old _save_story (json.dump of the whole story
+per generated scene), the "journal" column appends one scene record plus
+its rewired choice, with and without an fsync on every save.
+
+    python benchmarks/bench_journal.py --scenes 100 10000 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_generator import generate_story
+from story_journal import SceneJournal
+
+SCENE_TEXT = ("The rain beats against your windshield as you drive down the isolated "
+              "mountain road. Your GPS lost signal twenty minutes ago.")
+
+
+def time_rewrites(story: dict, path: str, repeats: int) -> float:
+    """Average seconds per save when the whole story is rewritten"""
+    started = time.perf_counter()
+    for i in range(repeats):
+        story["scenes"][f"new_{i}_ai"] = {"text": SCENE_TEXT, "question": "Now what?"}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(story, f, indent=2)
+    return (time.perf_counter() - started) / repeats
+
+
+def time_appends(path: str, repeats: int, fsync_interval: float) -> float:
+    """Average seconds per save when one scene delta is journaled"""
+    journal = SceneJournal(path, fsync_interval=fsync_interval)
+    started = time.perf_counter()
+    for i in range(repeats):
+        journal.append_delta({
+            "scenes": {f"new_{i}_ai": {"text": SCENE_TEXT, "question": "Now what?"}},
+            "choices": {"scene_0": {"Option 1": f"new_{i}_ai"}}
+        })
+    elapsed = time.perf_counter() - started
+    journal.close()
+    return elapsed / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--appends", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'scenes':>8} | {'rewrite ms':>10} | {'journal ms':>10} {'fsync each ms':>13} | {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scene_count in args.scenes:
+            story = generate_story(scene_count)
+            repeats = max(3, min(50, 200000 // max(scene_count, 1)))
+            rewrite = time_rewrites(story, os.path.join(tmp, f"story_{scene_count}.json"), repeats)
+            batched = time_appends(os.path.join(tmp, f"batched_{scene_count}.jsonl"), args.appends, 1.0)
+            synced = time_appends(os.path.join(tmp, f"synced_{scene_count}.jsonl"), min(args.appends, 200), 0.0)
+            print(f"{scene_count:>8} | {rewrite * 1000:>10.3f} | {batched * 1000:>10.3f} "
+                  f"{synced * 1000:>13.3f} | {rewrite / batched:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compare get_stats cost over a long reader path, recomputed versus counted.
+
+The "recompute" column is the old MemoryManager.get_stats, which rebuilt
+the set of unique choices, recounted moods and rescanned the path three
+times for the playstyle on every call; the "counters" column is the
+current get_stats, which reads counts kept up to date by update and
+add_mood.
+
+    python benchmarks/bench_memory_stats.py --choices 1000 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_manager import PLAYSTYLE_KEYWORDS, MemoryManager
+
+CHOICES = ["Investigate the cellar", "Run for the truck", "Wait and observe", "Open the door", "Search the desk"]
+MOODS = ["tense", "mysterious", "peaceful", "tense", "scary"]
+
+
+def recompute(memory: MemoryManager) -> dict:
+    """The path-derived stats as get_stats used to compute them"""
+    unique_choices = len(set(choice for _, choice in memory.path))
+    mood_counts = {}
+    for _, mood in memory.stats["mood_transitions"]:
+        mood_counts[mood] = mood_counts.get(mood, 0) + 1
+    styles = {
+        style: sum(1 for _, choice in memory.path if any(word in choice.lower() for word in keywords))
+        for style, keywords in PLAYSTYLE_KEYWORDS.items()
+    }
+    return {
+        "unique_choices": unique_choices,
+        "favorite_mood": max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else "mysterious",
+        "playstyle": max(styles.items(), key=lambda x: x[1])[0] if any(styles.values()) else "Balanced Explorer",
+    }
+
+
+def per_call(func, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--choices", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'choices':>10} {'recompute ms':>13} {'counters ms':>12} {'speedup':>8}")
+    for count in args.choices:
+        memory = MemoryManager()
+        for i in range(count):
+            memory.update(f"scene_{i}", f"{CHOICES[i % len(CHOICES)]} {i % 50}")
+            memory.add_mood(MOODS[i % len(MOODS)])
+        expected = recompute(memory)
+        stats = memory.get_stats()
+        assert all(stats[key] == value for key, value in expected.items()), "counters disagree with a rescan"
+
+        old = per_call(lambda: recompute(memory), args.repeats)
+        new = per_call(memory.get_stats, args.repeats)
+        print(f"{count:>10} {old * 1000:>13.2f} {new * 1000:>12.4f} {old / new:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Route scene calls between a slow and a fast stand-in endpoint.
+
+Two fake_openai_server instances play a large model (``--slow-ms`` to
+first token) and a small one (``--fast-ms``). The scene route prefers the
+slow one under a p95 SLO of ``--slo-ms``; once it breaks the SLO the
+router moves to the fast one, and tries the slow one again after
+``--cooldown`` seconds. Each call reports which model answered and how
+long it took.
+
+    python benchmarks/bench_model_router.py --calls 200 --slow-ms 300 --fast-ms 50 --slo-ms 250
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client_pool import ClientPool
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig
+from llm_metrics import LLMMetrics, percentile
+from llm_scheduler import LLMScheduler
+from model_router import ModelRouter, RouteHealth
+from openai_manager import OpenAIManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--slow-ms", type=float, default=300.0)
+    parser.add_argument("--fast-ms", type=float, default=50.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--slo-ms", type=float, default=250.0, help="p95 latency the scene route must keep under")
+    parser.add_argument("--min-samples", type=int, default=20, help="Calls observed before judging an endpoint")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="Seconds an endpoint is routed around")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    slow = FakeOpenAIServer(FakeServerConfig(args.slow_ms, args.latency_sigma, seed=1)).start()
+    fast = FakeOpenAIServer(FakeServerConfig(args.fast_ms, args.latency_sigma, seed=2)).start()
+    router = ModelRouter.from_config({
+        "scene": {"models": [{"model": "gpt-4o", "base_url": slow.base_url},
+                             {"model": "gpt-4o-mini", "base_url": fast.base_url}],
+                  "slo_p95": args.slo_ms / 1000},
+    }, RouteHealth(min_samples=args.min_samples, cooldown=args.cooldown))
+    metrics = LLMMetrics()
+    manager = OpenAIManager(api_key="bench", pool=ClientPool(), router=router, metrics=metrics,
+                            scheduler=LLMScheduler(sleep=lambda delay: None))
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(args.calls):
+        call_started = time.perf_counter()
+        # A new choice each time, so no two prompts are alike
+        manager.generate_scene_with_usage({}, "s", f"Choice {i}")
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    served = Counter()
+    for row in metrics.summary():
+        served[row["model"]] += row["calls"]
+    print(f"{args.calls} scene calls in {elapsed:.1f}s, served by {dict(served)}")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms")
+    print(f"downgrades: {router.health.downgrades}")
+    for row in router.get_stats():
+        print(f"  {row['model']:<12} p95 {row['p95'] * 1000:6.0f} ms  errors {row['error_rate']:.0%}  "
+              f"{'routed around' if row['down'] else 'active'}")
+    manager.pool.close_all()
+    slow.stop()
+    fast.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compare per-session story loading with the shared StoryRegistry.
+
+The "private" column is the old behaviour (one json.load per session), the
+"shared" column creates KukuBuddy sessions backed by a single registry.
+
+    python benchmarks/bench_sessions.py --scenes 2000 --sessions 1 10 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kuku_buddy import KukuBuddy
+from story_generator import write_story
+from story_registry import StoryRegistry
+
+
+def measure(create_session, sessions: int):
+    """Create sessions and return (elapsed seconds, bytes held by them)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    held = [create_session() for _ in range(sessions)]
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return elapsed, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        story_file = os.path.join(tmp, "story.json")
+        write_story(story_file, args.scenes, indent=True)
+        size_kb = os.path.getsize(story_file) / 1024
+        print(f"Story: {args.scenes} scenes, {size_kb:.0f} KiB on disk")
+        print(f"{'sessions':>8} | {'private ms':>10} {'private MiB':>11} {'sess/s':>9} | "
+              f"{'shared ms':>9} {'shared MiB':>10} {'sess/s':>9}")
+
+        def private_session():
+            with open(story_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        for sessions in args.sessions:
+            registry = StoryRegistry()
+            private_time, private_mem = measure(private_session, sessions)
+            shared_time, shared_mem = measure(lambda: KukuBuddy(story_file, registry=registry), sessions)
+            print(f"{sessions:>8} | {private_time * 1000:>10.1f} {private_mem / 2**20:>11.2f} "
+                  f"{sessions / private_time:>9.0f} | {shared_time * 1000:>9.1f} "
+                  f"{shared_mem / 2**20:>10.2f} {sessions / shared_time:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
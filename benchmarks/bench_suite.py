@@ -0,0 +1,130 @@
+"""Scaling benchmark suite driven by the synthetic story generator.
+
+For each story size it times KukuBuddy load, get_next_scene hops,
+MemoryManager.update and get_stats, utils.assign_badge and utils.detect_mood,
+prints a table and writes all results to a JSON file for regression tracking.
+
+    python benchmarks/bench_suite.py --scenes 1000 100000 --output bench_results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kuku_buddy import KukuBuddy
+from memory_manager import MemoryManager
+from story_generator import write_story
+from story_registry import StoryRegistry
+from utils import assign_badge, detect_mood
+
+
+def timed(name: str, scenes: int, ops: int, func) -> dict:
+    """Run ``func`` once and describe how long each of its ``ops`` operations took"""
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    return {"name": name, "scenes": scenes, "ops": ops, "seconds": seconds,
+            "us_per_op": seconds / ops * 1e6 if ops else 0.0}
+
+
+def random_walk(kuku: KukuBuddy, hops: int, seed: int):
+    """Follow random choices from the start, restarting at endings"""
+    rng = random.Random(seed)
+    scene, scene_id = kuku.get_start_scene()
+    path = []
+    for _ in range(hops):
+        choices = scene.get("choices")
+        if not choices:
+            scene, scene_id = kuku.get_start_scene()
+            choices = scene["choices"]
+        choice = rng.choice(list(choices))
+        path.append((scene_id, choice))
+        scene_id, scene = kuku.get_next_scene(scene_id, choice)
+    return path
+
+
+def run_size(story_file: str, scenes: int, args) -> list:
+    results = []
+    holder = {}
+
+    def load():
+        holder["kuku"] = KukuBuddy(story_file, registry=StoryRegistry())
+    results.append(timed("kuku_load", scenes, 1, load))
+    kuku = holder["kuku"]
+
+    results.append(timed("get_next_scene", scenes, args.hops,
+                         lambda: holder.update(path=random_walk(kuku, args.hops, args.seed))))
+    path = holder["path"]
+
+    memory = MemoryManager()
+    results.append(timed("memory_update", scenes, len(path),
+                         lambda: [memory.update(scene_id, choice) for scene_id, choice in path]))
+    results.append(timed("memory_get_stats", scenes, args.calls,
+                         lambda: [memory.get_stats() for _ in range(args.calls)]))
+    results.append(timed("assign_badge", scenes, args.calls,
+                         lambda: [assign_badge(path) for _ in range(args.calls)]))
+
+    texts = [kuku.get_scene(scene_id)["text"] for scene_id, _ in path[:args.hops]]
+    results.append(timed("detect_mood", scenes, len(texts),
+                         lambda: [detect_mood(text) for text in texts]))
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--text-words", type=int, default=60)
+    parser.add_argument("--mood-density", type=float, default=0.05)
+    parser.add_argument("--hops", type=int, default=10000, help="Choices made per size")
+    parser.add_argument("--calls", type=int, default=100, help="get_stats/assign_badge calls per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenes in args.scenes:
+            story_file = os.path.join(tmp, f"story_{scenes}.json")
+            write_story(story_file, scenes, args.branching, args.text_words, args.mood_density, args.seed)
+            results.extend(run_size(story_file, scenes, args))
+
+    print(f"{'benchmark':<18} {'scenes':>9} {'ops':>7} {'total s':>9} {'us/op':>11}")
+    for result in results:
+        print(f"{result['name']:<18} {result['scenes']:>9} {result['ops']:>7} "
+              f"{result['seconds']:>9.3f} {result['us_per_op']:>11.2f}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Drive many simulated readers through AI generation against the stand-in server.
+
+Each reader is a KukuBuddy session with its own OpenAIManager, as in the
+app; they share the generation queue, scheduler and client pool. Readers
+repeatedly open a scene, pick one of its AI branches and wait for it to be
+written, pausing ``--think-ms`` between clicks. Without ``--base-url`` a
+fake_openai_server is started in-process with the given behaviour.
+
+    python benchmarks/load_test.py --readers 50 --clicks 10 --latency-ms 400 \\
+        --tokens-per-second 80 --burst-every 100 --burst-length 10
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig
+from generation_jobs import GenerationQueue
+from kuku_buddy import KukuBuddy
+from llm_scheduler import LLMScheduler
+from openai_manager import OpenAIManager
+from story_store import MemoryStoryStore
+
+BRANCHES_PER_SCENE = 3
+
+
+def build_story(scenes: int) -> dict:
+    """Pre-authored scenes whose choices all lead to scenes still to be written"""
+    return {
+        "title": "Load Test",
+        "genre": "Thriller",
+        "start": "s0",
+        "scenes": {
+            f"s{i}": {
+                "text": f"Scene {i}. The corridor is dark and the door at the end is open.",
+                "question": "What do you do?",
+                "choices": {f"Option {c}": f"s{i}_{c}_ai" for c in range(BRANCHES_PER_SCENE)}
+            }
+            for i in range(scenes)
+        }
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def reader(index: int, args, store, queue, scheduler, base_url, latencies, failures, lock):
+    rng = random.Random(index)
+    manager = OpenAIManager(api_key="load-test", scheduler=scheduler, base_url=base_url,
+                            structured=args.structured)
+    kuku = KukuBuddy(store=store, queue=queue)
+    kuku.enable_dynamic_generation(manager)
+    for _ in range(args.clicks):
+        scene_id = f"s{rng.randrange(args.scenes)}"
+        choice = f"Option {rng.randrange(BRANCHES_PER_SCENE)}"
+        started = time.perf_counter()
+        next_id, _ = kuku.get_next_scene(scene_id, choice, [("s0", "Option 0")])
+        elapsed = time.perf_counter() - started
+        with lock:
+            if next_id:
+                latencies.append(elapsed)
+            else:
+                failures.append(elapsed)
+        time.sleep(args.think_ms / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=5, help="Choices made by each reader")
+    parser.add_argument("--scenes", type=int, default=200, help="Scenes readers start from (3 branches each)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a reader's clicks")
+    parser.add_argument("--workers", type=int, default=16, help="Generation worker threads")
+    parser.add_argument("--rpm", type=float, default=3500)
+    parser.add_argument("--tpm", type=float, default=90000)
+    parser.add_argument("--structured", action="store_true", help="Use structured (JSON) scenes")
+    parser.add_argument("--base-url", help="Use a server that is already running instead")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=int, default=0)
+    parser.add_argument("--burst-length", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = FakeOpenAIServer(FakeServerConfig(
+            args.latency_ms, args.latency_sigma, args.tokens_per_second, args.error_rate,
+            args.burst_every, args.burst_length, args.retry_after
+        )).start()
+        base_url = server.base_url
+
+    store = MemoryStoryStore(build_story(args.scenes))
+    queue = GenerationQueue(max_workers=args.workers, max_pending=args.readers * 2)
+    scheduler = LLMScheduler(args.rpm, args.tpm, max_in_flight=args.workers)
+    latencies, failures, lock = [], [], threading.Lock()
+    threads = [
+        threading.Thread(target=reader, args=(i, args, store, queue, scheduler, base_url, latencies, failures, lock))
+        for i in range(args.readers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    clicks = len(latencies) + len(failures)
+    print(f"{args.readers} readers, {clicks} clicks in {elapsed:.1f}s ({clicks / elapsed:.1f} clicks/s), "
+          f"{len(failures)} failed")
+    if latencies:
+        print(f"click latency: mean {statistics.mean(latencies) * 1000:.0f} ms, "
+              f"p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms")
+    print(f"queue: {queue.get_stats()}")
+    print(f"scheduler: {scheduler.get_stats()}")
+    if server is not None:
+        print(f"server: {server.get_stats()}")
+        server.stop()
+    queue.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# bridge_pool.py
+
+import logging
+import os
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Mapping, Optional, Sequence
+
+from llm_scheduler import BATCH
+from scene_schema import MOODS
+
+# Bridge scenes kept ready per story and mood (0 turns the pool off)
+DEFAULT_POOL_SIZE = int(os.getenv("KUKU_BRIDGE_POOL_SIZE", "2"))
+# Seconds the filler sleeps when the pool is full, the API is busy or a bridge failed
+DEFAULT_REFILL_INTERVAL = 30.0
+
+
+def off_peak(manager) -> bool:
+    """Whether the manager's scheduler has spare room: nobody queued and half the slots free"""
+    stats = manager.scheduler.get_stats()
+    return stats["waiting"] == 0 and stats["in_flight"] < manager.scheduler.max_in_flight / 2
+
+
+class BridgePool:
+    """Pre-written, mood-tagged scenes to splice in when a live scene is late.
+
+    Each registered story keeps up to ``size`` bridge scenes per mood,
+    written through its OpenAIManager by one background thread at batch
+    priority, and only while ``idle(manager)`` says the API has room. A
+    reader whose scene missed its deadline ``take``s one in the current
+    scene's mood (any mood when that one has run dry) and the filler is
+    woken to replace it. The pool lives in memory and is written again
+    after a restart.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, moods: Sequence[str] = MOODS,
+                 idle: Callable[[object], bool] = off_peak, interval: float = DEFAULT_REFILL_INTERVAL):
+        self.size = size
+        self.moods = tuple(moods)
+        self.idle = idle
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pools: Dict[Hashable, Dict[str, Deque[Dict]]] = {}
+        self._stories: Dict[Hashable, Dict] = {}
+        self._managers: Dict[Hashable, object] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.mismatched = 0
+        self.misses = 0
+        self.depleted = 0
+        self.generated = 0
+        self.failed = 0
+        self.tokens = 0
+
+    def register(self, story_key: Hashable, story_context: Mapping, manager, start: bool = True) -> None:
+        """Keep bridges for a story, written from ``story_context`` (title, genre, summary) by ``manager``"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._pools.setdefault(story_key, {mood: deque() for mood in self.moods})
+            self._stories[story_key] = dict(story_context)
+            # The latest session's manager writes the story's bridges
+            self._managers[story_key] = manager
+        if start:
+            self.start()
+        self._wake.set()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._fill_forever, daemon=True, name="kuku-bridges")
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def take(self, story_key: Hashable, mood: Optional[str]) -> Optional[Dict]:
+        """A bridge scene for the story in ``mood`` if there is one, else in any mood, else None"""
+        with self._lock:
+            pools = self._pools.get(story_key)
+            if not pools:
+                self.misses += 1
+                return None
+            pool = pools.get(mood)
+            if not pool:
+                pool = max(pools.values(), key=len)
+                if not pool:
+                    self.misses += 1
+                    return None
+                self.mismatched += 1
+            scene = pool.popleft()
+            self.hits += 1
+            if not pool:
+                self.depleted += 1
+        self._wake.set()
+        return scene
+
+    def fill_once(self) -> bool:
+        """Write one bridge for the story and mood furthest below ``size``; False if none was written"""
+        with self._lock:
+            wanted = [
+                (len(pool), story_key, mood)
+                for story_key, pools in self._pools.items()
+                for mood, pool in pools.items()
+                if len(pool) < self.size and self.idle(self._managers[story_key])
+            ]
+            if not wanted:
+                return False
+            _, story_key, mood = min(wanted, key=lambda item: item[0])
+            manager = self._managers[story_key]
+            story_context = self._stories[story_key]
+
+        scene, tokens = manager.generate_bridge_scene(story_context, mood, BATCH)
+        with self._lock:
+            self.tokens += tokens
+            if scene is None:
+                self.failed += 1
+                return False
+            self._pools[story_key][mood].append(scene)
+            self.generated += 1
+        return True
+
+    def _fill_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                written = self.fill_once()
+            except Exception as e:
+                logging.error(f"Error filling bridge pool: {e}")
+                written = False
+            if not written:
+                # Full, busy or failing: wait for a take or try again later
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            size = sum(len(pool) for pools in self._pools.values() for pool in pools.values())
+            capacity = self.size * len(self.moods) * len(self._pools)
+            taken = self.hits + self.misses
+            return {
+                "stories": len(self._pools),
+                "size": size,
+                "capacity": capacity,
+                "fill": size / capacity if capacity else 0.0,
+                "hits": self.hits,
+                "mismatched": self.mismatched,
+                "misses": self.misses,
+                "hit_rate": self.hits / taken if taken else 0.0,
+                "depleted": self.depleted,
+                "generated": self.generated,
+                "failed": self.failed,
+                "tokens": self.tokens,
+            }
+
+
+# Shared by every session, so readers of a story draw on one pool
+bridge_pool = BridgePool()
@@ -0,0 +1,217 @@
+# choice_index.py
+
+import os
+import random
+import re
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Set, Tuple
+
+# Choices at least this similar (Jaccard of their shingles) share a branch
+DEFAULT_THRESHOLD = float(os.getenv("KUKU_CHOICE_SIMILARITY", "0.65"))
+# Scenes whose branches are kept; the least recently used are dropped beyond this
+DEFAULT_MAX_SCENES = int(os.getenv("KUKU_CHOICE_INDEX_SCENES", "100000"))
+NUM_PERM = 16
+# 8 bands of 2 rows: a pair at 0.65 similarity shares a band 99.9% of the time
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+_rng = random.Random(20240501)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# Words that carry no meaning of their own in a choice
+STOPWORDS = {
+    "a", "an", "the", "to", "in", "into", "on", "onto", "at", "of", "for", "from", "with", "and", "or",
+    "up", "out", "off", "over", "by", "my", "your", "his", "her", "their", "our", "its", "it", "this",
+    "that", "some", "any", "then", "just", "now", "again",
+}
+# ...and words that reverse it, which must agree between matching choices
+NEGATIONS = {"not", "dont", "never", "no", "without", "refuse", "ignore", "avoid", "stop"}
+_WORD = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ing", "ed", "es", "s")
+
+Branch = Tuple[str, str, str]
+
+
+def content_words(text: str) -> List[str]:
+    """Lowercased words of a choice without stopwords, with common suffixes stripped"""
+    words = []
+    for word in _WORD.findall(text.lower().replace("'", "")):
+        if word in STOPWORDS:
+            continue
+        for suffix in _SUFFIXES:
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.append(word)
+    return words
+
+
+def shingles(words: Iterable[str]) -> Set[str]:
+    """Character trigrams of each word, with word boundaries, so typos cost little"""
+    grams = set()
+    for word in words:
+        padded = f"#{word}#"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def minhash(grams: Iterable[str]) -> array:
+    """MinHash signature of a shingle set; the fraction of equal positions estimates Jaccard similarity"""
+    hashes = [zlib.crc32(gram.encode("utf-8")) for gram in grams] or [0]
+    return array("I", [min((a * h + b) % _PRIME for h in hashes) & _MASK for a, b in _PERMUTATIONS])
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    union = len(first | second)
+    return len(first & second) / union if union else 1.0
+
+
+class ChoiceIndex:
+    """Finds an existing branch whose choice means the same as a new one.
+
+    Each branch (parent scene, choice text, target scene) is indexed by the
+    MinHash signature of its choice's content words, split into bands that
+    are hashed together with the parent id into one table (locality-
+    sensitive hashing). A lookup only looks at branches of the same parent
+    sharing a band, so its cost does not grow with the number of branches
+    indexed. Those candidates are checked exactly: they must reach
+    ``threshold`` Jaccard similarity and agree on negation ("open the door"
+    never matches "don't open the door"). Everything runs locally.
+
+    Branches are kept per parent scene for at most ``max_scenes`` scenes;
+    the scenes least recently indexed or looked up are dropped first, and
+    are indexed again from the story the next time a reader reaches them.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_scenes: int = DEFAULT_MAX_SCENES):
+        self.threshold = threshold
+        self.max_scenes = max_scenes
+        self._lock = threading.Lock()
+        # Signatures are not kept: only their band keys, and the choice text to check candidates.
+        # Parent scene -> {choice: (target, band keys)}, least recently used first
+        self._parents: "OrderedDict[str, Dict[str, Tuple[str, List[int]]]]" = OrderedDict()
+        self._buckets: Dict[int, List[Tuple[str, str]]] = {}
+        self._size = 0
+        self.lookups = 0
+        self.matches = 0
+        self.candidates = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _shingles(self, choice: str) -> Tuple[Set[str], bool]:
+        words = content_words(choice)
+        negated = any(word in NEGATIONS for word in words)
+        return shingles(word for word in words if word not in NEGATIONS), negated
+
+    def _band_keys(self, parent: str, grams: Set[str]) -> List[int]:
+        signature = minhash(grams)
+        return [hash((parent, band, tuple(signature[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)]
+
+    def add(self, parent: str, choice: str, target: str) -> None:
+        """Index a written branch; re-adding a choice points it at the new target"""
+        grams, _ = self._shingles(choice)
+        keys = self._band_keys(parent, grams)
+        with self._lock:
+            branches = self._touch(parent)
+            if choice in branches:
+                branches[choice] = (target, branches[choice][1])
+                return
+            branches[choice] = (target, keys)
+            self._size += 1
+            for key in keys:
+                self._buckets.setdefault(key, []).append((parent, choice))
+
+    def add_scene(self, parent: str, choices: Mapping[str, str], written: Mapping) -> None:
+        """Index a scene's choices that lead to written scenes, once per scene"""
+        with self._lock:
+            if parent in self._parents:
+                self._parents.move_to_end(parent)
+                return
+            self._touch(parent)
+        for choice, target in choices.items():
+            if target in written:
+                self.add(parent, choice, target)
+
+    def _touch(self, parent: str) -> Dict[str, Tuple[str, List[int]]]:
+        """A parent's branches, marked as most recently used; called with the lock held"""
+        branches = self._parents.get(parent)
+        if branches is not None:
+            self._parents.move_to_end(parent)
+            return branches
+        branches = self._parents[parent] = {}
+        while len(self._parents) > max(self.max_scenes, 1):
+            self._evict()
+        return branches
+
+    def _evict(self) -> None:
+        parent, branches = self._parents.popitem(last=False)
+        for choice, (_, keys) in branches.items():
+            for key in keys:
+                bucket = self._buckets[key]
+                bucket.remove((parent, choice))
+                if not bucket:
+                    del self._buckets[key]
+        self._size -= len(branches)
+        self.evictions += 1
+
+    def find(self, parent: str, choice: str) -> Optional[Branch]:
+        """The most similar indexed branch of ``parent`` for ``choice``, as (parent, choice, target), or None"""
+        grams, negated = self._shingles(choice)
+        keys = self._band_keys(parent, grams)
+        with self._lock:
+            self.lookups += 1
+            candidates = {ref for key in keys for ref in self._buckets.get(key, ())}
+            self.candidates += len(candidates)
+            written = self._parents.get(parent)
+            if written is not None:
+                self._parents.move_to_end(parent)
+            # Band keys of different parents can collide
+            branches = [(parent, other, written[other][0]) for other_parent, other in candidates
+                        if other_parent == parent and written is not None]
+
+        best, best_score = None, self.threshold
+        for branch in branches:
+            _, other_choice, _ = branch
+            if other_choice == choice:
+                continue
+            other_grams, other_negated = self._shingles(other_choice)
+            if other_negated != negated:
+                continue
+            score = jaccard(grams, other_grams)
+            if score >= best_score:
+                best, best_score = branch, score
+        if best is not None:
+            with self._lock:
+                self.matches += 1
+        return best
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "branches": self._size,
+                "scenes": len(self._parents),
+                "evictions": self.evictions,
+                "buckets": len(self._buckets),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "candidates_per_lookup": self.candidates / self.lookups if self.lookups else 0.0,
+            }
+
+
+_indexes: Dict[Hashable, ChoiceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_choice_index(story_key: Hashable) -> ChoiceIndex:
+    """Process-wide index for a story, shared by every session reading it"""
+    index = _indexes.get(story_key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(story_key, ChoiceIndex())
+    return index
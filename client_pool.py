@@ -0,0 +1,144 @@
+# client_pool.py
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import openai
+from httpx import Limits
+from openai.types.chat import ChatCompletionChunk
+
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("KUKU_OPENAI_MAX_CONNECTIONS", "32"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("KUKU_OPENAI_MAX_KEEPALIVE", "16"))
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_TIMEOUT = float(os.getenv("KUKU_OPENAI_TIMEOUT", "60"))
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_IDLE_TTL = 600.0
+
+class ClientPool:
+    """Process-wide OpenAI clients, one per (API key, base URL).
+
+    Every session using the same key shares a client and so one HTTP
+    connection pool, which keeps connections alive between requests instead
+    of handshaking again for each session. Clients nobody has asked for in
+    ``idle_ttl`` seconds are closed and rebuilt on the next request.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 timeout: float = DEFAULT_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 idle_ttl: float = DEFAULT_IDLE_TTL):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, Optional[str]], Tuple[openai.OpenAI, float]] = {}
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+
+    def get(self, api_key: str, base_url: Optional[str] = None) -> openai.OpenAI:
+        """Return the shared client for a key and base URL, creating it if needed"""
+        now = time.monotonic()
+        key = (api_key, base_url)
+        with self._lock:
+            self._close_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients[key] = (entry[0], now)
+                self.reused += 1
+                return entry[0]
+
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=openai.Timeout(self.timeout, connect=self.connect_timeout),
+                # The SDK retries on its own; LLMScheduler does that with shared backoff instead
+                max_retries=0,
+                http_client=openai.DefaultHttpxClient(
+                    limits=Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_keepalive,
+                                  keepalive_expiry=self.keepalive_expiry)
+                )
+            )
+            self._clients[key] = (client, now)
+            self.created += 1
+            return client
+
+    def _close_idle(self, now: float) -> None:
+        for key, (client, last_used) in list(self._clients.items()):
+            if now - last_used > self.idle_ttl:
+                del self._clients[key]
+                self._close(client)
+
+    def _close(self, client: openai.OpenAI) -> None:
+        try:
+            client.close()
+        except Exception as e:
+            logging.error(f"Error closing OpenAI client: {e}")
+        self.closed += 1
+
+    def close_idle(self) -> None:
+        """Close clients that have not been used within the idle TTL"""
+        with self._lock:
+            self._close_idle(time.monotonic())
+
+    def close_all(self) -> None:
+        with self._lock:
+            for client, _ in self._clients.values():
+                self._close(client)
+            self._clients.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "created": self.created,
+                "reused": self.reused,
+                "closed": self.closed,
+            }
+
+
+def iter_chunks(stream: Iterable) -> Iterator[ChatCompletionChunk]:
+    """Chunks of a streamed chat completion, with the response read to its end.
+
+    Some openai releases stop reading at ``data: [DONE]`` and close the
+    response with the body's last chunk unread, so httpx drops the
+    connection instead of returning it to the pool. Reading the server-sent
+    events off the response here, on to EOF, lets streamed calls reuse
+    pooled connections like plain ones. Anything without a ``response``
+    (a list of chunks in tests, say) is iterated as is.
+    """
+    response = getattr(stream, "response", None)
+    if response is None:
+        yield from stream
+        return
+    try:
+        for line in response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            # Keep reading past [DONE]: the connection is only reusable at EOF
+            if not data or data.startswith("[DONE]"):
+                continue
+            payload = json.loads(data)
+            if isinstance(payload, dict) and payload.get("error"):
+                error = payload["error"]
+                message = error.get("message") if isinstance(error, dict) else None
+                raise openai.APIError(message or "An error occurred during streaming", response.request, body=error)
+            yield ChatCompletionChunk.model_validate(payload)
+    finally:
+        response.close()
+
+
+# Shared by every session in the process
+client_pool = ClientPool()
+atexit.register(client_pool.close_all)
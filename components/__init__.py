@@ -1,9 +1,13 @@
 from .stats_view import display_achievements, display_story_stats
-from .interactive import typing_effect, animated_choice_buttons
+from .interactive import typing_effect, streaming_text, animated_choice_buttons
+from .admin_view import display_bridge_pool, display_llm_metrics
 
 __all__ = [
     'display_achievements',
     'display_story_stats',
     'typing_effect',
-    'animated_choice_buttons'
+    'streaming_text',
+    'animated_choice_buttons',
+    'display_llm_metrics',
+    'display_bridge_pool'
 ]
\ No newline at end of file
@@ -0,0 +1,81 @@
+import streamlit as st
+
+def display_llm_metrics(rows, stats, routes=None):
+    """Display model call latency, tokens and cost per model and call type, and route health"""
+    cols = st.columns(5)
+    cols[0].metric("Model calls", stats["calls"], help=f"{stats['errors']} failed")
+    cols[1].metric("Cache hit rate", f"{stats['cache_hit_rate']:.0%}")
+    cols[2].metric("Total cost", f"${stats['cost']:.4f}")
+    cols[3].metric(
+        "Cost per story", f"${stats['cost_per_story']:.4f}",
+        help=f"{stats['stories']} finished stories, p95 ${stats['cost_per_story_p95']:.4f}"
+    )
+    cols[4].metric(
+        "Hedges won", f"{stats['hedges_won']}/{stats['hedges_fired']}",
+        help="Duplicate requests sent for slow scenes, and how many answered first"
+    )
+
+    if not rows:
+        st.info("No model calls yet")
+        return
+
+    st.markdown("#### Latency (seconds, last calls)")
+    st.dataframe([
+        {
+            "Model": row["model"],
+            "Call": row["kind"],
+            "Queue p95": round(row["queue_wait_p95"], 3),
+            "TTFT p50": round(row["ttft_p50"], 3),
+            "TTFT p95": round(row["ttft_p95"], 3),
+            "Latency p50": round(row["latency_p50"], 3),
+            "Latency p95": round(row["latency_p95"], 3),
+            "Latency p99": round(row["latency_p99"], 3),
+        }
+        for row in rows
+    ], use_container_width=True)
+
+    st.markdown("#### Volume and cost")
+    st.dataframe([
+        {
+            "Model": row["model"],
+            "Call": row["kind"],
+            "Calls": row["calls"],
+            "Errors": row["errors"],
+            "Cache hits": row["cache_hits"],
+            "Retries": row["retries"],
+            "Prompt tokens": row["prompt_tokens"],
+            "Completion tokens": row["completion_tokens"],
+            "Cost ($)": round(row["cost"], 4),
+        }
+        for row in rows
+    ], use_container_width=True)
+
+    if routes:
+        st.markdown("#### Model routes")
+        st.dataframe([
+            {
+                "Route": route["route"],
+                "Model": route["model"],
+                "Endpoint": route["base_url"] or "default",
+                "Calls": route["calls"],
+                "p95 (s)": round(route["p95"], 3),
+                "Error rate": f"{route['error_rate']:.0%}",
+                "Status": "routed around" if route["down"] else "active",
+            }
+            for route in routes
+        ], use_container_width=True)
+
+
+def display_bridge_pool(stats):
+    """Display the pool of bridge scenes kept for late AI scenes"""
+    st.markdown("#### Bridge scenes")
+    cols = st.columns(4)
+    cols[0].metric("Pool size", f"{stats['size']}/{stats['capacity']}", help=f"{stats['stories']} stories")
+    cols[1].metric(
+        "Hit rate", f"{stats['hit_rate']:.0%}",
+        help=f"{stats['hits']} spliced in ({stats['mismatched']} in another mood), {stats['misses']} found none"
+    )
+    cols[2].metric("Depleted", stats["depleted"], help="Times a story ran out of bridges in a mood")
+    cols[3].metric(
+        "Written", stats["generated"], help=f"{stats['failed']} failed, {stats['tokens']} tokens"
+    )
@@ -25,6 +25,17 @@ def typing_effect(text: str, speed: float = 0.03):
     )
     return container
 
+def streaming_text(text: str, done: bool = False):
+    """Display text that is still arriving from the model, with a typing cursor"""
+    text = text.replace("*", "\\*").replace("_", "\\_")
+    cursor = "" if done else "▌"
+    container = st.empty()
+    container.markdown(
+        f'<div class="story-text fade-in">{text}{cursor}</div>',
+        unsafe_allow_html=True
+    )
+    return container
+
 def animated_choice_buttons(choices: Dict[str, str], on_click: Callable):
     """Display choice buttons with animation and hover effects"""
     # Fix: Use a more reliable layout for buttons
@@ -0,0 +1,299 @@
+# fake_openai_server.py
+
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Replies are deterministic scenes in the ``[SCENE]/[QUESTION]/[CHOICES]``
+format (or JSON when ``response_format`` asks for it), streamed or not,
+so load and latency can be measured without spending tokens:
+
+    python fake_openai_server.py --port 8765 --latency-ms 400 --tokens-per-second 60 \\
+        --error-rate 0.02 --burst-every 200 --burst-length 20
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run app.py
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from story_generator import CHOICE_OBJECTS, CHOICE_VERBS, FILLER_WORDS, MOOD_WORDS, QUESTIONS
+from utils import detect_mood
+
+DEFAULT_PORT = 8765
+
+
+class FakeServerConfig:
+    """How the stand-in behaves.
+
+    Time to first token is lognormal around ``latency_ms`` (``latency_sigma``
+    0 makes it fixed); streamed replies then arrive at ``tokens_per_second``.
+    ``error_rate`` of requests fail with a 500, and every ``burst_every``
+    requests the next ``burst_length`` get 429 with ``Retry-After``.
+    ``connect_ms`` is added to each new connection, standing in for the TCP
+    and TLS handshakes a remote endpoint needs.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, latency_sigma: float = 0.0,
+                 tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 burst_every: int = 0, burst_length: int = 0, retry_after: float = 1.0,
+                 connect_ms: float = 0.0, text_words: int = 100, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.connect_ms = connect_ms
+        self.text_words = text_words
+        self.seed = seed
+
+
+def scene_reply(prompt: str, text_words: int = 100, structured: bool = False, seed: int = 0) -> str:
+    """The reply for a prompt; the same prompt always gets the same scene"""
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode("utf-8")).digest()
+    rng = random.Random(digest)
+    words = [rng.choice(MOOD_WORDS) if rng.random() < 0.05 else rng.choice(FILLER_WORDS)
+             for _ in range(text_words)]
+    text = " ".join(words).capitalize() + "."
+    question = rng.choice(QUESTIONS)
+    choices = []
+    count = rng.randint(2, 3)
+    while len(choices) < count:
+        choice = f"{rng.choice(CHOICE_VERBS)} {rng.choice(CHOICE_OBJECTS)}"
+        if choice not in choices:
+            choices.append(choice)
+
+    if structured:
+        return json.dumps({"text": text, "question": question, "choices": choices, "mood": detect_mood(text)})
+    return "[SCENE]\n" + text + "\n[QUESTION]\n" + question + "\n[CHOICES]\n" + "\n".join(choices)
+
+
+def _pieces(reply: str) -> List[str]:
+    # Roughly one token per piece: each word with the space before it
+    pieces, start = [], 0
+    for i in range(1, len(reply)):
+        if reply[i] in " \n" and reply[i - 1] not in " \n":
+            pieces.append(reply[start:i])
+            start = i
+    pieces.append(reply[start:])
+    return pieces
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server answering ``POST /v1/chat/completions``"""
+
+    def __init__(self, config: Optional[FakeServerConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeServerConfig()
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.completion_tokens = 0
+        self.abandoned = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "completion_tokens": self.completion_tokens,
+                "abandoned": self.abandoned,
+            }
+
+    def _admit(self) -> Tuple[Optional[int], float]:
+        """Decide this request's fate: (error status or None, seconds to first token)"""
+        config = self.config
+        with self._lock:
+            self.requests += 1
+            count = self.requests
+            failed = self._rng.random() < config.error_rate
+            latency = config.latency_ms / 1000
+            if config.latency_sigma:
+                latency *= self._rng.lognormvariate(0, config.latency_sigma)
+
+        if config.burst_every and (count - 1) % config.burst_every < config.burst_length:
+            with self._lock:
+                self.rate_limited += 1
+            return 429, 0.0
+        if failed:
+            with self._lock:
+                self.errors += 1
+            return 500, latency
+        return None, latency
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                if server.config.connect_ms:
+                    time.sleep(server.config.connect_ms / 1000)
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    # Clients may drop kept-alive connections at any time
+                    pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+                    return
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request"}})
+                    return
+
+                status, latency = server._admit()
+                if status == 429:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                                    {"Retry-After": str(server.config.retry_after)})
+                    return
+                time.sleep(latency)
+                if status:
+                    self._send_json(status, {"error": {"message": "Simulated server error", "type": "server"}})
+                    return
+
+                prompt = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+                structured = (request.get("response_format") or {}).get("type", "text") != "text"
+                reply = scene_reply(prompt, server.config.text_words, structured, server.config.seed)
+                pieces = _pieces(reply)
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(pieces),
+                         "total_tokens": len(prompt) // 4 + len(pieces)}
+                with server._lock:
+                    server.completion_tokens += len(pieces)
+
+                model = request.get("model", "gpt-3.5-turbo")
+                if request.get("stream"):
+                    include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+                    try:
+                        self._stream(model, pieces, usage if include_usage else None)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client closed the stream early, e.g. a hedged request that lost
+                        with server._lock:
+                            server.abandoned += 1
+                        self.close_connection = True
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": model, "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": reply}}],
+                    })
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model: str, pieces: List[str], usage: Optional[Dict]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                delay = 1 / server.config.tokens_per_second if server.config.tokens_per_second else 0
+                base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": model}
+                for piece in pieces:
+                    self._event({**base, "choices": [{"index": 0, "delta": {"content": piece},
+                                                      "finish_reason": None}]})
+                    if delay:
+                        time.sleep(delay)
+                self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if usage:
+                    self._event({**base, "choices": [], "usage": usage})
+                # The last event and the end of the body go out together, as real servers send them
+                self._write_chunk(b"data: [DONE]\n\n", last=True)
+
+            def _event(self, payload: Dict):
+                self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+            def _write_chunk(self, data: bytes, last: bool = False):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n" + (b"0\r\n\r\n" if last else b""))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Lognormal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Streaming speed (0: no delay)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--burst-every", type=int, default=0, help="Start a 429 burst every N requests")
+    parser.add_argument("--burst-length", type=int, default=0, help="Requests rejected in each burst")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429s")
+    parser.add_argument("--connect-ms", type=float, default=0.0, help="Delay added to each new connection")
+    parser.add_argument("--text-words", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeServerConfig(args.latency_ms, args.latency_sigma, args.tokens_per_second, args.error_rate,
+                              args.burst_every, args.burst_length, args.retry_after, args.connect_ms,
+                              args.text_words, args.seed)
+    server = FakeOpenAIServer(config, args.host, args.port)
+    logging.basicConfig(level=logging.INFO)
+    logging.info(f"Serving fake chat completions at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
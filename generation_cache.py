@@ -0,0 +1,167 @@
+# generation_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.getenv("KUKU_GENERATION_CACHE", ".cache/generations.sqlite3")
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_VARIANTS = int(os.getenv("KUKU_GENERATION_VARIANTS", "1"))
+
+_caches: Dict[str, "GenerationCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_key(model: str, system_prompt: str, prompt: str, temperature: float, max_tokens: int) -> str:
+    """Content address of a completion request"""
+    payload = json.dumps([model, system_prompt, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Disk-backed cache of model replies, keyed by the request that produced them.
+
+    Readers who reach the same scene through the same choice send identical
+    requests; the cache answers those without calling the API. Entries
+    expire after ``ttl`` seconds and the least recently used are evicted
+    beyond ``max_entries``. With ``variants`` above one, each request is
+    sent to the model until that many replies are stored, after which the
+    stored replies are served in turn so repeat readers still see variety.
+    """
+
+    def __init__(self, path, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 variants: int = DEFAULT_VARIANTS):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT NOT NULL, variant INTEGER NOT NULL, reply TEXT NOT NULL, tokens INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (key, variant))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed)")
+        (self._count,) = self._connection.execute("SELECT COUNT(*) FROM generations").fetchone()
+
+    def get(self, key: str) -> Optional[Tuple[str, int]]:
+        """Return a cached ``(reply, tokens)`` for a request, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT variant, reply, tokens FROM generations WHERE key = ? AND created > ? ORDER BY variant",
+                (key, now - self.ttl)
+            ).fetchall()
+            # Keep asking the model until every variant slot is filled
+            if len(rows) < self.variants:
+                self.misses += 1
+                return None
+
+            if len(rows) > 1:
+                cursor = self._cursors.get(key, 0)
+                self._cursors[key] = cursor + 1
+                rows = rows[cursor % len(rows):]
+            variant, reply, tokens = rows[0]
+            with self._connection:
+                self._connection.execute("UPDATE generations SET accessed = ? WHERE key = ? AND variant = ?",
+                                         (now, key, variant))
+            self.hits += 1
+            return reply, tokens
+
+    def put(self, key: str, reply: str, tokens: int = 0) -> None:
+        """Store a reply, replacing the stalest variant once all slots are used"""
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT variant, created FROM generations WHERE key = ? ORDER BY variant", (key,)
+            ).fetchall()
+            expired = [variant for variant, created in rows if created <= now - self.ttl]
+            if expired:
+                variant = expired[0]
+            elif len(rows) < self.variants:
+                variant = rows[-1][0] + 1 if rows else 0
+            else:
+                variant = min(rows, key=lambda row: row[1])[0]
+
+            with self._connection:
+                replaced = self._connection.execute(
+                    "UPDATE generations SET reply = ?, tokens = ?, created = ?, accessed = ? "
+                    "WHERE key = ? AND variant = ?", (reply, tokens, now, now, key, variant)
+                ).rowcount
+                if not replaced:
+                    self._connection.execute(
+                        "INSERT INTO generations (key, variant, reply, tokens, created, accessed) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (key, variant, reply, tokens, now, now)
+                    )
+                    self._count += 1
+                self.stores += 1
+                if self._count > self.max_entries:
+                    self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # Drop expired entries first, then the least recently used, down to 90% of capacity
+        removed = self._connection.execute("DELETE FROM generations WHERE created <= ?",
+                                           (now - self.ttl,)).rowcount
+        excess = self._count - removed - int(self.max_entries * 0.9)
+        if excess > 0:
+            removed += self._connection.execute(
+                "DELETE FROM generations WHERE rowid IN "
+                "(SELECT rowid FROM generations ORDER BY accessed LIMIT ?)", (excess,)
+            ).rowcount
+        self._count -= removed
+        self.evictions += removed
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM generations")
+            self._count = 0
+            self._cursors.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def get_generation_cache(path=DEFAULT_CACHE_PATH, **options) -> Optional[GenerationCache]:
+    """Process-wide cache for a path, shared by every session; None if it cannot be opened"""
+    path = os.path.abspath(path)
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(path)
+            if cache is None:
+                try:
+                    cache = GenerationCache(path, **options)
+                except sqlite3.Error as e:
+                    logging.error(f"Error opening generation cache {path}: {e}")
+                    return None
+                _caches[path] = cache
+    return cache
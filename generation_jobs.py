@@ -0,0 +1,177 @@
+# generation_jobs.py
+
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from llm_scheduler import Priority
+from single_flight import Flight, SingleFlight
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 32
+
+
+class GenerationJob:
+    """One session's handle on a scene being written in the background.
+
+    The Streamlit script polls ``done()`` between reruns instead of waiting
+    for the model. Sessions asking for the same key share one Flight, and
+    so one model call; cancelling a handle only stops the call once every
+    session has given up on it, and a cancelled handle ignores the result.
+    ``progress`` optionally holds a live view of partial output, such as a
+    SceneStreamParser the worker is feeding. ``started`` is when this
+    session began waiting on it.
+    """
+
+    def __init__(self, key: Hashable, flight: Flight, flights: SingleFlight):
+        self.key = key
+        self.flight = flight
+        self.future: Future = flight.future
+        self._flights = flights
+        self._cancelled = threading.Event()
+        self.started = time.monotonic()
+
+    @property
+    def progress(self) -> Any:
+        return self.flight.progress
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def status(self) -> str:
+        """One of pending, running, done, failed or cancelled"""
+        if self.cancelled:
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.future.running() else "pending"
+        if self.future.cancelled() or self.future.exception() is not None:
+            return "failed"
+        return "done"
+
+    def done(self) -> bool:
+        return self.cancelled or self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block for at most ``timeout`` seconds, returning whether the job finished"""
+        if self.cancelled:
+            return True
+        try:
+            self.future.exception(timeout)
+        except CancelledError:
+            return True
+        except FutureTimeout:
+            return False
+        return True
+
+    def result(self) -> Any:
+        """The generated value, or None if the job failed, was cancelled or is unfinished"""
+        if self.cancelled or not self.future.done() or self.future.cancelled():
+            return None
+        if self.future.exception() is not None:
+            return None
+        return self.future.result()
+
+    def cancel(self) -> None:
+        if self.cancelled:
+            return
+        self._cancelled.set()
+        if self._flights.leave(self.flight):
+            self.future.cancel()
+
+
+class GenerationQueue:
+    """Bounded, coalescing worker pool for slow generation calls.
+
+    Submissions with a key that is already being generated join that call
+    instead of starting another (see SingleFlight). At most ``max_workers``
+    calls run at once and at most ``max_pending`` may be queued or running;
+    further submissions are rejected so a burst of readers cannot build an
+    unbounded backlog of model calls.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kuku-generate")
+        self._lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, key: Hashable, func: Callable, *args, progress: Any = None,
+               priority: Optional[Priority] = None) -> Optional[GenerationJob]:
+        """Queue ``func(*args)`` unless ``key`` is in flight, returning a job handle.
+
+        ``progress`` and ``priority`` are attached to the flight if this call
+        starts it; joiners see the flight's progress and promote its priority
+        to their own if that is more urgent. Returns None when the queue is
+        full.
+        """
+        def start(flight: Flight) -> Optional[Future]:
+            flight.progress = progress
+            flight.priority = priority
+            return self._start(flight, func, args)
+
+        flight = self.flights.join(key, start)
+        if flight is None:
+            return None
+        if priority is not None and flight.priority is not None:
+            flight.priority.raise_to(priority.value)
+        return GenerationJob(key, flight, self.flights)
+
+    def _start(self, flight: Flight, func: Callable, args: tuple) -> Optional[Future]:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                logging.warning(f"Generation queue full, rejecting job {flight.key}")
+                return None
+            self.pending += 1
+            self.submitted += 1
+
+        future = self._executor.submit(self._run, flight, func, args)
+        future.add_done_callback(lambda future: self._finished(flight, future))
+        return future
+
+    def _run(self, flight: Flight, func: Callable, args: tuple) -> Any:
+        # Every reader may have moved on while the call sat in the queue
+        if flight.waiters <= 0:
+            return None
+        return func(*args)
+
+    def _finished(self, flight: Flight, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or flight.waiters <= 0:
+                self.cancelled += 1
+            elif future.exception() is not None:
+                self.failed += 1
+                logging.error(f"Generation job {flight.key} failed: {future.exception()}")
+            else:
+                self.completed += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {
+                "pending": self.pending,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
+        stats["coalesced"] = self.flights.get_stats()["coalesced"]
+        return stats
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Process-wide pool shared by every session
+generation_queue = GenerationQueue()
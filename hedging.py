@@ -0,0 +1,135 @@
+# hedging.py
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds a reader waits for the first words of a scene before the story moves on without it
+DEFAULT_SCENE_DEADLINE = float(os.getenv("KUKU_SCENE_DEADLINE", "20"))
+# A duplicate request goes out once the first has waited this long for a token
+HEDGE_PERCENTILE = 0.9
+# ...measured over at least this many recent calls
+HEDGE_MIN_SAMPLES = 20
+
+
+class HedgeLost(Exception):
+    """Another attempt at the same call produced a token first"""
+
+
+class DeadlineExceeded(Exception):
+    """No attempt at a call produced a token before its deadline"""
+
+
+def close_response(response) -> None:
+    """Close an open response or stream, dropping its connection"""
+    try:
+        response.close()
+    except Exception as e:
+        logging.debug(f"Error closing abandoned response: {e}")
+
+
+class HedgeRace:
+    """Attempts at one call racing for its first token.
+
+    Each attempt runs in its own thread and calls ``claim`` when its first
+    token (or whole reply) arrives; the first to claim wins and every other
+    attempt's registered response is closed, so their connections are
+    dropped instead of read to the end. ``result`` waits for the winner to
+    finish, or raises the first attempt's error when every attempt failed
+    before producing a token.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.winner: Optional[int] = None
+        self.cancelled = False
+        self._entrants = 0
+        self._running = 0
+        self._outcomes: Dict[int, Tuple[Any, Optional[Exception]]] = {}
+        self._responses: Dict[int, Any] = {}
+
+    def run(self, attempt: Callable[[int], Any]) -> int:
+        """Start ``attempt(entrant)`` in a thread, returning its entrant number"""
+        with self._condition:
+            entrant = self._entrants
+            self._entrants += 1
+            self._running += 1
+        threading.Thread(target=self._run, args=(attempt, entrant), daemon=True,
+                         name=f"kuku-hedge-{entrant}").start()
+        return entrant
+
+    def _run(self, attempt: Callable[[int], Any], entrant: int) -> None:
+        try:
+            outcome = (attempt(entrant), None)
+        except Exception as e:
+            outcome = (None, e)
+        with self._condition:
+            self._running -= 1
+            self._outcomes[entrant] = outcome
+            self._responses.pop(entrant, None)
+            self._condition.notify_all()
+
+    def lost(self, entrant: int) -> bool:
+        with self._condition:
+            return self.cancelled or (self.winner is not None and self.winner != entrant)
+
+    def register(self, entrant: int, response) -> None:
+        """Keep an attempt's open response, to close it if the attempt loses"""
+        with self._condition:
+            lost = self.cancelled or (self.winner is not None and self.winner != entrant)
+            if not lost:
+                self._responses[entrant] = response
+        if lost:
+            close_response(response)
+            raise HedgeLost()
+
+    def claim(self, entrant: int) -> bool:
+        """Called on an attempt's first token; True if it is the first"""
+        with self._condition:
+            if self.cancelled or (self.winner is not None and self.winner != entrant):
+                return False
+            self.winner = entrant
+            losers = [response for other, response in self._responses.items() if other != entrant]
+            self._condition.notify_all()
+        for response in losers:
+            close_response(response)
+        return True
+
+    def wait_first(self, timeout: Optional[float]) -> bool:
+        """Wait for a token or for every attempt to finish; False if neither came in time"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.winner is not None or self._running == 0, timeout)
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """The winning attempt's result once it has finished.
+
+        Raises DeadlineExceeded, and abandons every attempt, when no token
+        came within ``timeout`` seconds; a winner is then waited for however
+        long its reply takes.
+        """
+        if not self.wait_first(timeout):
+            self.cancel()
+            raise DeadlineExceeded(f"No reply within {timeout:.1f}s")
+        with self._condition:
+            if self.winner is not None:
+                self._condition.wait_for(lambda: self.winner in self._outcomes)
+                result, error = self._outcomes[self.winner]
+            else:
+                # Every attempt finished without a token: an empty reply, or errors
+                outcomes = [self._outcomes[entrant] for entrant in sorted(self._outcomes)]
+                result, error = next(((result, None) for result, error in outcomes if error is None),
+                                     outcomes[0])
+        if error is not None:
+            raise error
+        return result
+
+    def cancel(self) -> None:
+        """Abandon every attempt"""
+        with self._condition:
+            self.cancelled = True
+            responses = list(self._responses.values())
+            self._responses.clear()
+            self._condition.notify_all()
+        for response in responses:
+            close_response(response)
@@ -4,25 +4,72 @@ import json
 import random
 import logging
 import os
+import time
+from collections import deque
 from pathlib import Path
-from typing import Dict, Tuple, Optional, List
+from typing import Dict, Tuple, Optional, List, Mapping, Sequence, Set, Union
 import streamlit as st
+from bridge_pool import BridgePool, bridge_pool
+from choice_index import ChoiceIndex, get_choice_index
+from generation_jobs import GenerationJob, GenerationQueue, generation_queue
+from hedging import DEFAULT_SCENE_DEADLINE
+from llm_scheduler import INTERACTIVE, PREFETCH, Priority
+from prefetch import DEFAULT_MAX_SCENES, PrefetchBudget, prefetch_budget
+from scene_ids import scene_ids
+from scene_schema import JsonSceneStreamParser
+from scene_stream import SceneStreamParser
+from story_context import ContextBuilder, lead_sentence
+from story_registry import StoryRegistry
+from story_overlay import StoryOverlay
+from story_store import StoryStore, open_store
+from utils import detect_mood
+
+# Scenes looked at when searching for a pre-authored scene to fall back to
+FALLBACK_SEARCH_LIMIT = 1000
+# How often a blocking wait checks a generation's deadline
+DEADLINE_CHECK_SECONDS = 0.1
 
 class KukuBuddy:
-    def __init__(self, story_file):
+    def __init__(self, story_file=None, registry: Optional[StoryRegistry] = None,
+                 store: Optional[StoryStore] = None, queue: Optional[GenerationQueue] = None,
+                 choice_index: Optional[ChoiceIndex] = None):
+        # Per-session state only; the story itself is shared through the store
         self.story = {}
+        self.graph = None
+        self.store = store
+        self.overlay = StoryOverlay({})
         self.story_file = story_file
         self.openai_manager = None
         self.dynamic_generation = False
+        # Scenes being written in the background, by (scene id, choice)
+        self.generation_queue = queue or generation_queue
+        self.jobs: Dict[Tuple[str, str], GenerationJob] = {}
+        # Opt-in speculative generation of the current scene's AI children
+        self.prefetch_limit = 0
+        self.prefetch_count = 0
+        self.prefetch_budget = prefetch_budget
+        self.prefetched: Set[Tuple[str, str]] = set()
+        # Rolling summaries of this story's reader paths, reused from click to click
+        self.context_builder = ContextBuilder()
+        # Seconds a reader waits for an AI scene to start before moving on to a written one (0: no limit)
+        self.scene_deadline = DEFAULT_SCENE_DEADLINE
+        self.fallbacks = 0
+        # Opt-in pool of pre-written scenes spliced in when a live one is late
+        self.bridge_pool: Optional[BridgePool] = None
+        # Branches already written for this story, so a reworded choice can reuse one
+        self._choice_index = choice_index
         
         try:
-            story_path = Path(story_file)
-            if not story_path.exists():
-                logging.error(f"Story file not found: {story_file}")
-                return
+            if self.store is None:
+                story_path = Path(story_file)
+                if not story_path.exists():
+                    logging.error(f"Story file not found: {story_file}")
+                    return
+                self.store = open_store(story_file, registry)
                 
-            with open(story_file, 'r', encoding='utf-8') as f:
-                self.story = json.load(f)
+            self.story = self.store.story
+            self.graph = self.store.graph
+            self.overlay = StoryOverlay(self.story, self.graph)
         except json.JSONDecodeError as e:
             logging.error(f"Invalid JSON in story file: {e}")
         except Exception as e:
@@ -34,6 +81,30 @@ class KukuBuddy:
         self.dynamic_generation = True
         logging.info("Dynamic story generation enabled")
 
+    def enable_prefetch(self, max_scenes: int = DEFAULT_MAX_SCENES,
+                        budget: Optional[PrefetchBudget] = None) -> None:
+        """Let this session generate up to ``max_scenes`` AI scenes before they are chosen"""
+        self.prefetch_limit = max_scenes
+        if budget is not None:
+            self.prefetch_budget = budget
+
+    def enable_bridges(self, pool: Optional[BridgePool] = None) -> None:
+        """Keep bridge scenes for this story ready, written in the background by the session's manager"""
+        if not (self.dynamic_generation and self.openai_manager and self.story):
+            return
+        self.bridge_pool = pool or bridge_pool
+        start = self.get_scene(self.story.get("start")) or {}
+        self.bridge_pool.register(self._story_key(), {
+            "title": self.story.get("title", "Thriller Story"),
+            "genre": self.story.get("genre", "Thriller"),
+            "summary": f"The story opens: {lead_sentence(start.get('text', ''))}",
+        }, self.openai_manager)
+
+    def disable_prefetch(self) -> None:
+        """Stop prefetching and drop scenes prefetched but not yet chosen"""
+        self.prefetch_limit = 0
+        self._discard_prefetched(None)
+
     def get_scene(self, scene_id):
         """Get a scene by ID with error handling"""
         try:
@@ -41,47 +112,301 @@ class KukuBuddy:
                 logging.error("Story not properly loaded")
                 return None
                 
-            return self.story["scenes"].get(scene_id, None)
+            return self.overlay.get_scene(scene_id)
         except Exception as e:
             logging.error(f"Error getting scene {scene_id}: {e}")
             return None
 
-    def get_next_scene(self, current_scene_id, user_choice):
-        """Get next scene based on user choice with validation"""
+    def get_next_scene(self, current_scene_id, user_choice, path: Sequence[Tuple[str, str]] = ()):
+        """Get next scene based on user choice, waiting for it to be generated if needed"""
+        next_scene_id, next_scene, job = self.request_next_scene(current_scene_id, user_choice, path)
+        if job is None:
+            return next_scene_id, next_scene
+        while not job.wait(DEADLINE_CHECK_SECONDS if self.scene_deadline else None):
+            if self.deadline_passed(job):
+                return self.fall_back(job)
+        next_scene_id, next_scene = self.finish_generation(job)
+        if next_scene_id is None:
+            return self.fall_back(job)
+        return next_scene_id, next_scene
+
+    def request_next_scene(self, current_scene_id, user_choice,
+                           path: Sequence[Tuple[str, str]] = ()) -> Tuple[Optional[str], Optional[Mapping],
+                                                                          Optional[GenerationJob]]:
+        """Resolve a choice without blocking on the model.
+
+        Returns ``(scene_id, scene, None)`` when the next scene exists, or
+        ``(None, None, job)`` when it is being generated in the background;
+        pass the job to finish_generation once it is done. ``path`` is the
+        reader's ``(scene_id, choice)`` history, used as the model's context.
+        """
         try:
-            scene = self.get_scene(current_scene_id)
-            if not scene:
+            if not self.get_scene(current_scene_id):
                 logging.error(f"Invalid current scene: {current_scene_id}")
-                return None, None
+                return None, None, None
 
-            choices = scene.get("choices", {})
-            next_scene_id = choices.get(user_choice)
+            # Session overlay first, then an indexed hop through the compiled graph
+            next_scene_id = self.overlay.next_scene_id(current_scene_id, user_choice)
 
             if not next_scene_id:
                 logging.error(f"Invalid choice: {user_choice}")
-                return None, None
+                return None, None, None
             
-            # Check if we need to dynamically generate this scene
-            if self.dynamic_generation and self.openai_manager and next_scene_id.endswith("_ai"):
-                # Scene doesn't exist yet, generate it
-                if next_scene_id not in self.story["scenes"]:
-                    story_context = self._build_story_context(current_scene_id)
-                    next_scene_id, self.story = self.openai_manager.extend_story(
-                        self.story, current_scene_id, user_choice
-                    )
-                    # Save the updated story
-                    self._save_story()
+            # Scenes ending in _ai are written on demand, off the script thread
+            if (self.dynamic_generation and self.openai_manager and next_scene_id.endswith("_ai")
+                    and self.overlay.get_scene(next_scene_id) is None):
+                reused_id = self.reuse_similar_branch(current_scene_id, user_choice)
+                if reused_id is not None:
+                    return reused_id, self.get_scene(reused_id), None
+                job = self.start_generation(current_scene_id, user_choice, path)
+                if job is None:
+                    return None, None, None
+                return None, None, job
 
             next_scene = self.get_scene(next_scene_id)
             if not next_scene:
                 logging.error(f"Invalid next scene: {next_scene_id}")
-                return None, None
+                return None, None, None
                 
-            return next_scene_id, next_scene
+            return next_scene_id, next_scene, None
         except Exception as e:
             logging.error(f"Error getting next scene: {e}")
+            return None, None, None
+
+    def start_generation(self, current_scene_id: str, user_choice: str,
+                         path: Sequence[Tuple[str, str]] = ()) -> Optional[GenerationJob]:
+        """Submit the scene behind a choice to the background generation queue"""
+        key = (current_scene_id, user_choice)
+        job = self.jobs.get(key)
+        if job is not None and not job.cancelled:
+            # The reader is now waiting on it, so it outranks speculative work
+            if job.flight.priority is not None:
+                job.flight.priority.raise_to(INTERACTIVE)
+            job.started = time.monotonic()
+            return job
+
+        if self.prefetch_limit:
+            self.prefetch_budget.record_miss()
+        return self._submit(key, INTERACTIVE, path)
+
+    def _submit(self, key: Tuple[str, str], priority: int = INTERACTIVE,
+                path: Sequence[Tuple[str, str]] = ()) -> Optional[GenerationJob]:
+        # The context is read here; workers never touch the session overlay
+        current_scene_id, user_choice = key
+        story_context = self.openai_manager.build_extension_context(
+            self.overlay, current_scene_id, path, self.context_builder
+        )
+        # Stream the reply so the scene can be shown while it is written
+        parser = self.openai_manager.new_parser()
+        # Readers of the same story choosing the same branch share one call
+        urgency = Priority(priority)
+        job = self.generation_queue.submit(
+            (self._story_key(), current_scene_id, user_choice), self._write_branch,
+            story_context, current_scene_id, user_choice, parser, urgency,
+            progress=parser, priority=urgency
+        )
+        if job is not None:
+            self.jobs[key] = job
+        return job
+
+    def _story_key(self):
+        return os.path.abspath(self.story_file) if self.story_file else id(self.store)
+
+    @property
+    def choice_index(self) -> ChoiceIndex:
+        if self._choice_index is None:
+            self._choice_index = get_choice_index(self._story_key())
+        return self._choice_index
+
+    def reuse_similar_branch(self, current_scene_id: str, user_choice: str) -> Optional[str]:
+        """Point a choice at the scene already written for a choice of the same scene that means the same"""
+        try:
+            current = self.get_scene(current_scene_id) or {}
+            self.choice_index.add_scene(current_scene_id, current.get("choices") or {}, self.overlay["scenes"])
+            match = self.choice_index.find(current_scene_id, user_choice)
+            # Another session's scene is only usable once it has reached this session
+            if match is None or self.overlay.get_scene(match[2]) is None:
+                return None
+            _, similar_choice, target = match
+            self.overlay.set_choice(current_scene_id, user_choice, target)
+            self._save_story()
+            logging.info(f"Choice {user_choice!r} reuses the branch of {similar_choice!r}")
+            return target
+        except Exception as e:
+            logging.error(f"Error looking up similar choices: {e}")
+            return None
+
+    def _write_branch(self, story_context: Dict, current_scene_id: str, user_choice: str,
+                      parser: Union[SceneStreamParser, JsonSceneStreamParser], priority: Priority) -> Optional[Tuple[Dict, int, str]]:
+        """Worker side of a generation job: returns (scene, tokens, scene id)"""
+        new_scene, tokens = self.openai_manager.generate_scene_streaming(
+            story_context, current_scene_id, user_choice, parser, priority
+        )
+        if new_scene is None:
+            return None
+        return new_scene, tokens, scene_ids.allocate(self.story.get("scenes", {}))
+
+    def prefetch_choices(self, scene_id: str, path: Sequence[Tuple[str, str]] = ()) -> int:
+        """Start writing the missing AI children of a scene, returning how many were started"""
+        # Prefetches for scenes the reader has left will never be chosen
+        self._discard_prefetched(scene_id)
+        if not (self.prefetch_limit and self.dynamic_generation and self.openai_manager):
+            return 0
+
+        scene = self.get_scene(scene_id) or {}
+        started = 0
+        for choice, target in (scene.get("choices") or {}).items():
+            if self.prefetch_count >= self.prefetch_limit:
+                break
+            key = (scene_id, choice)
+            if (not target.endswith("_ai") or key in self.jobs
+                    or self.overlay.get_scene(target) is not None):
+                continue
+            if not self.prefetch_budget.try_acquire():
+                break
+            job = self._submit(key, PREFETCH, path)
+            if job is None:
+                self.prefetch_budget.release()
+                break
+            job.future.add_done_callback(lambda future: self.prefetch_budget.release())
+            self.prefetched.add(key)
+            self.prefetch_count += 1
+            started += 1
+        return started
+
+    def _discard_prefetched(self, keep_scene_id: Optional[str]) -> None:
+        """Cancel prefetches for scenes other than ``keep_scene_id`` and count their cost"""
+        for key in [key for key in self.prefetched if key[0] != keep_scene_id]:
+            self.prefetched.discard(key)
+            job = self.jobs.pop(key, None)
+            if job is None:
+                continue
+            job.cancel()
+            # A running call still costs tokens once it completes
+            job.future.add_done_callback(lambda future, job=job: self._record_wasted(job))
+
+    def _record_wasted(self, job: GenerationJob) -> None:
+        # Not wasted if another reader is still waiting for the same branch
+        if job.flight.waiters > 0:
+            return
+        future = job.future
+        tokens = 0
+        if not future.cancelled() and future.exception() is None and future.result():
+            tokens = future.result()[1]
+        self.prefetch_budget.record_wasted(tokens)
+
+    def finish_generation(self, job: GenerationJob) -> Tuple[Optional[str], Optional[Mapping]]:
+        """Add a finished job's scene to the overlay and return it, or (None, None)"""
+        if not job.done():
+            return None, None
+        _, current_scene_id, user_choice = job.key
+        key = (current_scene_id, user_choice)
+        self.jobs.pop(key, None)
+        result = job.result()
+        if key in self.prefetched:
+            self.prefetched.discard(key)
+            self.prefetch_budget.record_hit()
+            self.prefetch_budget.record_used(result[1] if result else 0)
+        if not result:
+            return None, None
+
+        try:
+            new_scene, _, new_scene_id = result
+            # Only the first session to collect a shared scene saves it
+            first = job.flight.claim()
+            next_scene_id = self.openai_manager.add_generated_scene(
+                self.overlay, current_scene_id, user_choice, new_scene, new_scene_id, pending=first
+            )
+            self.choice_index.add(current_scene_id, user_choice, next_scene_id)
+            # Save the updated story
+            self._save_story()
+            return next_scene_id, self.get_scene(next_scene_id)
+        except Exception as e:
+            logging.error(f"Error adding generated scene: {e}")
             return None, None
 
+    def deadline_passed(self, job: GenerationJob) -> bool:
+        """Whether the reader has waited past the deadline without seeing the scene begin"""
+        if not self.scene_deadline or job.done():
+            return False
+        # Once the scene is being shown it may finish
+        if job.progress is not None and getattr(job.progress, "text", ""):
+            return False
+        return time.monotonic() - job.started > self.scene_deadline
+
+    def fall_back(self, job: GenerationJob) -> Tuple[Optional[str], Optional[Mapping]]:
+        """Give up on a late or failed scene: splice in a bridge scene, or go to the nearest pre-authored one"""
+        _, current_scene_id, user_choice = job.key
+        key = (current_scene_id, user_choice)
+        if self.jobs.get(key) is job:
+            del self.jobs[key]
+        job.cancel()
+        bridge_id = self.splice_bridge(current_scene_id, user_choice)
+        if bridge_id is not None:
+            self.fallbacks += 1
+            return bridge_id, self.get_scene(bridge_id)
+        scene_id = self.nearest_authored_scene(current_scene_id)
+        if scene_id is None:
+            return None, None
+        self.fallbacks += 1
+        logging.warning(f"Scene for {user_choice!r} not ready, continuing at {scene_id}")
+        return scene_id, self.get_scene(scene_id)
+
+    def splice_bridge(self, current_scene_id: str, user_choice: str) -> Optional[str]:
+        """Put a pooled bridge scene matching the current mood behind a choice, returning its id"""
+        if self.bridge_pool is None:
+            return None
+        current = self.get_scene(current_scene_id) or {}
+        mood = current.get("mood") or detect_mood(current.get("text", ""))
+        bridge = self.bridge_pool.take(self._story_key(), mood)
+        if bridge is None:
+            return None
+        try:
+            scenes = self.overlay["scenes"]
+            # Its choices lead to new AI scenes, so the branch goes on once the API recovers
+            bridge = dict(bridge, choices={choice: scene_ids.allocate(scenes) for choice in bridge["choices"]})
+            bridge_id = self.openai_manager.add_generated_scene(self.overlay, current_scene_id, user_choice, bridge)
+            self._save_story()
+            logging.warning(f"Scene for {user_choice!r} not ready, spliced in bridge {bridge_id}")
+            return bridge_id
+        except Exception as e:
+            logging.error(f"Error splicing bridge scene: {e}")
+            return None
+
+    def nearest_authored_scene(self, scene_id: str) -> Optional[str]:
+        """The closest written (not generated) scene reachable from ``scene_id``, searching breadth-first"""
+        seen = {scene_id}
+        queue = deque([scene_id])
+        while queue and len(seen) <= FALLBACK_SEARCH_LIMIT:
+            scene = self.get_scene(queue.popleft()) or {}
+            for target in (scene.get("choices") or {}).values():
+                if target in seen or self.overlay.get_scene(target) is None:
+                    continue
+                if not target.endswith("_ai"):
+                    return target
+                seen.add(target)
+                queue.append(target)
+        return None
+
+    def cancel_generation(self) -> None:
+        """Cancel every scene this session is still waiting for"""
+        self._discard_prefetched(None)
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs.clear()
+
+    def get_progress(self, scene_id: str) -> Optional[float]:
+        """Fraction of the way from the start to the nearest ending, if known"""
+        if not self.graph or scene_id in self.overlay.scenes:
+            return None
+        return self.graph.progress(scene_id)
+
+    def get_reachable_endings(self, scene_id: str) -> Optional[int]:
+        """How many endings the reader can still reach from a scene, if known"""
+        if not self.graph or scene_id in self.overlay.scenes:
+            return None
+        return self.graph.reachable_endings(scene_id)
+
     def get_start_scene(self):
         """Get starting scene with fallback"""
         try:
@@ -104,23 +429,33 @@ class KukuBuddy:
             logging.error(f"Error getting start scene: {e}")
             return None, None
     
-    def generate_choice_scene(self, current_scene_id: str, choice_text: str) -> str:
+    def generate_choice_scene(self, current_scene_id: str, choice_text: str,
+                              path: Sequence[Tuple[str, str]] = ()) -> str:
         """Generate a new scene based on user choice"""
         if not self.dynamic_generation or not self.openai_manager:
             logging.error("Dynamic generation not enabled")
             return current_scene_id
         
         try:
-            # Generate a unique ID for the new scene
-            new_scene_id = f"{current_scene_id}_choice_{len(self.story['scenes']) + 1}"
-            
+            reused_id = self.reuse_similar_branch(current_scene_id, choice_text)
+            if reused_id is not None:
+                return reused_id
+
             # Build context for generation
-            story_context = self._build_story_context(current_scene_id)
+            story_context = self.openai_manager.build_extension_context(
+                self.overlay, current_scene_id, path, self.context_builder
+            )
+            new_scene, _ = self.openai_manager.generate_scene_with_usage(story_context, current_scene_id, choice_text)
+            if new_scene is None:
+                # Late or failed: carry on in the written story rather than show an error scene
+                return (self.splice_bridge(current_scene_id, choice_text)
+                        or self.nearest_authored_scene(current_scene_id) or current_scene_id)
             
-            # Generate new scene and update story
-            new_scene_id, self.story = self.openai_manager.extend_story(
-                self.story, current_scene_id, choice_text
+            # Generate new scene into this session's overlay
+            new_scene_id = self.openai_manager.add_generated_scene(
+                self.overlay, current_scene_id, choice_text, new_scene
             )
+            self.choice_index.add(current_scene_id, choice_text, new_scene_id)
             
             # Save the updated story
             self._save_story()
@@ -154,11 +489,13 @@ class KukuBuddy:
         return context
     
     def _save_story(self) -> None:
-        """Save the current story to file"""
+        """Persist this session's new scenes through the storage backend"""
+        if not self.overlay.has_changes() or not self.store:
+            return
         try:
-            with open(self.story_file, 'w', encoding='utf-8') as f:
-                json.dump(self.story, f, indent=2)
-            logging.info(f"Story saved to {self.story_file}")
+            self.store.save_delta(self.overlay.pending_delta())
+            self.overlay.mark_saved()
+            logging.info(f"Story changes saved for {self.story_file or 'in-memory story'}")
         except Exception as e:
             logging.error(f"Error saving story: {e}")
 
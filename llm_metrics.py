@@ -0,0 +1,153 @@
+# llm_metrics.py
+
+import json
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+DEFAULT_WINDOW = 1000
+
+# US dollars per 1,000 prompt and completion tokens
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4.1-mini": (0.0004, 0.0016),
+    "gpt-4.1": (0.002, 0.008),
+}
+
+# Each call is also written here as one JSON object per line
+call_log = logging.getLogger("kuku.llm")
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Dollar cost of a call; unknown models are priced like the closest known prefix, or free"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        matches = [name for name in MODEL_PRICES if model.startswith(name)]
+        prices = MODEL_PRICES[max(matches, key=len)] if matches else (0.0, 0.0)
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LLMMetrics:
+    """Rolling record of model calls, grouped by model and call type.
+
+    Each call records queue wait, time to first token, total latency,
+    prompt and completion tokens, retries, whether the cache answered, and
+    the outcome. Percentiles cover the last ``window`` calls of a group;
+    counts and costs cover the whole process. Finished stories record what
+    they cost, for a cost-per-story figure.
+    """
+
+    FIELDS = ("queue_wait", "ttft", "latency")
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent: Dict[Tuple[str, str], Deque[Dict]] = {}
+        self._totals: Dict[Tuple[str, str], Dict] = {}
+        self._story_costs: Deque[float] = deque(maxlen=window)
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def record(self, model: str, kind: str, latency: float, outcome: str = "ok", cache: str = "off",
+               queue_wait: float = 0.0, ttft: Optional[float] = None, prompt_tokens: int = 0,
+               completion_tokens: int = 0, retries: int = 0) -> Dict:
+        """Record one call and return it, with its cost"""
+        call = {
+            "model": model, "kind": kind, "outcome": outcome, "cache": cache,
+            "queue_wait": queue_wait, "ttft": latency if ttft is None else ttft, "latency": latency,
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "retries": retries,
+            "cost": call_cost(model, prompt_tokens, completion_tokens),
+        }
+        key = (model, kind)
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent is None:
+                recent = self._recent[key] = deque(maxlen=self.window)
+                self._totals[key] = {"calls": 0, "errors": 0, "cache_hits": 0, "retries": 0,
+                                     "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+            recent.append(call)
+            totals = self._totals[key]
+            totals["calls"] += 1
+            totals["errors"] += outcome != "ok"
+            totals["cache_hits"] += cache == "hit"
+            totals["retries"] += retries
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost"] += call["cost"]
+        call_log.info(json.dumps(call))
+        return call
+
+    def record_story(self, cost: float) -> None:
+        """Record what a finished story cost in model calls"""
+        with self._lock:
+            self._story_costs.append(cost)
+
+    def record_hedge(self, won: bool) -> None:
+        """Count a duplicate request sent for a slow call, and whether it answered first"""
+        with self._lock:
+            self.hedges_fired += 1
+            self.hedges_won += won
+
+    def recent_percentile(self, model: str, kind: str, field: str, fraction: float,
+                          min_samples: int = 1) -> Optional[float]:
+        """A timing percentile over recent successful API calls, or None with fewer than ``min_samples``"""
+        with self._lock:
+            values = [call[field] for call in self._recent.get((model, kind), ())
+                      if call["cache"] != "hit" and call["outcome"] == "ok"]
+        return percentile(values, fraction) if len(values) >= min_samples else None
+
+    def summary(self) -> List[Dict]:
+        """One row per model and call type: totals plus p50/p95/p99 of each timing"""
+        with self._lock:
+            groups = [(key, list(self._recent[key]), dict(self._totals[key])) for key in sorted(self._recent)]
+        rows = []
+        for (model, kind), calls, totals in groups:
+            row = {"model": model, "kind": kind, **totals}
+            # Cache hits take no time and would hide what the API costs
+            timed = [call for call in calls if call["cache"] != "hit" and call["outcome"] == "ok"]
+            for field in self.FIELDS:
+                values = [call[field] for call in timed]
+                for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                    row[f"{field}_{name}"] = percentile(values, fraction)
+            rows.append(row)
+        return rows
+
+    def get_stats(self) -> Dict:
+        """Totals over every call and the cost of finished stories"""
+        with self._lock:
+            totals = list(self._totals.values())
+            story_costs = list(self._story_costs)
+        calls = sum(total["calls"] for total in totals)
+        return {
+            "calls": calls,
+            "errors": sum(total["errors"] for total in totals),
+            "cache_hit_rate": sum(total["cache_hits"] for total in totals) / calls if calls else 0.0,
+            "cost": sum(total["cost"] for total in totals),
+            "stories": len(story_costs),
+            "cost_per_story": sum(story_costs) / len(story_costs) if story_costs else 0.0,
+            "cost_per_story_p95": percentile(story_costs, 0.95),
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._totals.clear()
+            self._story_costs.clear()
+            self.hedges_fired = 0
+            self.hedges_won = 0
+
+
+# Shared by every OpenAIManager in the process
+llm_metrics = LLMMetrics()
@@ -0,0 +1,208 @@
+# llm_scheduler.py
+
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Union
+
+import openai
+
+# Lower values are served first
+INTERACTIVE = 0
+PREFETCH = 1
+BATCH = 2
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("KUKU_OPENAI_RPM", "3500"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("KUKU_OPENAI_TPM", "90000"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("KUKU_OPENAI_MAX_IN_FLIGHT", "16"))
+DEFAULT_MAX_RETRIES = 5
+# Waiters re-check their place this often, so promotions take effect
+RECHECK_INTERVAL = 0.25
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Priority:
+    """Mutable priority, so a queued call can be promoted while it waits"""
+
+    def __init__(self, value: int = INTERACTIVE):
+        self.value = value
+
+    def raise_to(self, value: int) -> None:
+        self.value = min(self.value, value)
+
+
+class TokenBucket:
+    """Allows ``per_minute`` units per minute with bursts up to the same amount"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (0 if they are now)"""
+        self._refill()
+        # Requests larger than the bucket only need it full, or they would wait forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors and dropped connections are worth retrying"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRY_STATUS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Delay the server asked for, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Shared admission control for model calls from every session.
+
+    Each call waits until a slot is free (``max_in_flight``), both the
+    requests-per-minute and tokens-per-minute buckets can cover it, and no
+    waiter with a better priority is ahead of it. Retryable failures (429,
+    5xx, connection errors) are retried with exponential backoff and full
+    jitter, honouring Retry-After. Token estimates are corrected with the
+    real usage reported by the call.
+    """
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = 0.5, max_delay: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.waited = 0.0
+
+    def call(self, func: Callable, estimated_tokens: int = 0,
+             priority: Union[int, Priority] = INTERACTIVE,
+             usage: Optional[Callable[[object], int]] = None, report: Optional[Dict] = None):
+        """Run ``func()`` under the limits, retrying transient failures.
+
+        ``usage(result)`` reports the tokens the call really cost, which
+        replaces ``estimated_tokens`` in the tokens-per-minute bucket. When
+        given, ``report`` receives the seconds spent queued and the retries.
+        """
+        if not isinstance(priority, Priority):
+            priority = Priority(priority)
+        if report is None:
+            report = {}
+        report.update(queue_wait=0.0, retries=0)
+
+        for attempt in range(self.max_retries + 1):
+            report["queue_wait"] += self._acquire(estimated_tokens, priority)
+            try:
+                result = func()
+            except Exception as e:
+                self._release()
+                if not is_retryable(e) or attempt == self.max_retries:
+                    with self._condition:
+                        self.failures += 1
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                with self._condition:
+                    self.retries += 1
+                report["retries"] += 1
+                logging.warning(f"Model call failed ({e}), retrying in {delay:.2f}s")
+                self.sleep(delay)
+                continue
+
+            self._release()
+            actual = usage(result) if usage else 0
+            if actual:
+                with self._condition:
+                    self.tokens.give_back(estimated_tokens - actual)
+            return result
+
+    def _acquire(self, estimated_tokens: int, priority: Priority) -> float:
+        started = time.monotonic()
+        with self._condition:
+            entry = [priority.value, next(self._sequence), priority]
+            heapq.heappush(self._waiting, entry)
+            while True:
+                # Promoted waiters move up the heap
+                if any(item[0] != item[2].value for item in self._waiting):
+                    for item in self._waiting:
+                        item[0] = item[2].value
+                    heapq.heapify(self._waiting)
+
+                delay = RECHECK_INTERVAL
+                if self._waiting[0] is entry and self.in_flight < self.max_in_flight:
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                    if delay <= 0:
+                        break
+                self._condition.wait(min(delay, RECHECK_INTERVAL))
+
+            heapq.heappop(self._waiting)
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            self.calls += 1
+            waited = time.monotonic() - started
+            self.waited += waited
+            # The next waiter may be able to go too
+            self._condition.notify_all()
+        return waited
+
+    def _release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiting),
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "wait_seconds": self.waited,
+            }
+
+
+# Every OpenAIManager in the process shares this scheduler by default
+llm_scheduler = LLMScheduler()
@@ -3,7 +3,22 @@
 import time
 from typing import List, Dict, Set, Tuple
 
+# Words that count a choice towards the Detective achievement
+INVESTIGATIVE_KEYWORDS = ["investigate", "search", "examine", "look", "study", "analyze"]
+# Words that mark a choice as each playstyle, in order of precedence on a tie
+PLAYSTYLE_KEYWORDS = {
+    "Detective": ["investigate", "search", "examine"],
+    "Action Seeker": ["chase", "run", "fight", "escape"],
+    "Strategic Thinker": ["wait", "observe", "think", "plan"],
+}
+
 class MemoryManager:
+    """A reader's path through the current story, with running stats and achievements.
+
+    Everything ``get_stats`` reports about the path is counted as choices
+    and moods come in, so it costs the same however long the session runs.
+    """
+
     def __init__(self):
         self.path = []
         self.stats = {
@@ -54,6 +69,16 @@ class MemoryManager:
             }
         }
         self.start_time = time.time()
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        """Running counts over the current path and its mood transitions"""
+        self._path_choices: Dict[str, int] = {}
+        self._playstyle_counts = {style: 0 for style in PLAYSTYLE_KEYWORDS}
+        # Moods in order of first appearance, so ties go to the earliest as before
+        self._mood_counts: Dict[str, int] = {}
+        self._mood_order: Dict[str, int] = {}
+        self._favorite_mood = None
 
     def update(self, scene_id: str, choice: str) -> None:
         """Update story path and stats"""
@@ -62,11 +87,15 @@ class MemoryManager:
         
         # Track favorite choices
         self.stats["favorite_choices"][choice] = self.stats["favorite_choices"].get(choice, 0) + 1
+        self._path_choices[choice] = self._path_choices.get(choice, 0) + 1
         
         # Check for investigative choices
-        investigative_keywords = ["investigate", "search", "examine", "look", "study", "analyze"]
-        if any(keyword in choice.lower() for keyword in investigative_keywords):
+        lowered = choice.lower()
+        if any(keyword in lowered for keyword in INVESTIGATIVE_KEYWORDS):
             self.achievements["Detective"]["progress"] += 1
+        for style, keywords in PLAYSTYLE_KEYWORDS.items():
+            if any(word in lowered for word in keywords):
+                self._playstyle_counts[style] += 1
         
         self._check_achievements()
 
@@ -74,16 +103,24 @@ class MemoryManager:
         """Track experienced moods"""
         self.stats["moods_experienced"].add(mood)
         self.stats["mood_transitions"].append((time.time() - self.start_time, mood))
+        self._count_mood(mood)
         
         # Check for mood-related achievements
         if len(self.stats["moods_experienced"]) >= 4:
             self._unlock_achievement("Story Weaver")
         
         # Check for mood variety in current story
-        story_moods = set(mood for _, mood in self.stats["mood_transitions"])
-        if len(story_moods) >= 3:
+        if len(self._mood_counts) >= 3:
             self._unlock_achievement("Mood Master")
 
+    def _count_mood(self, mood: str) -> None:
+        self._mood_order.setdefault(mood, len(self._mood_order))
+        count = self._mood_counts[mood] = self._mood_counts.get(mood, 0) + 1
+        favorite = self._favorite_mood
+        if favorite is None or (count, -self._mood_order[mood]) > (
+                self._mood_counts[favorite], -self._mood_order[favorite]):
+            self._favorite_mood = mood
+
     def complete_story(self, time_taken: float) -> None:
         """Record story completion"""
         self.stats["stories_completed"] += 1
@@ -102,7 +139,7 @@ class MemoryManager:
 
     def get_stats(self) -> Dict:
         """Get current statistics with analysis"""
-        unique_choices = len(set(choice for _, choice in self.path))
+        unique_choices = len(self._path_choices)
         story_length = len(self.path)
         
         return {
@@ -121,7 +158,7 @@ class MemoryManager:
 
     def _check_achievements(self) -> None:
         """Check and update achievements"""
-        unique_choices = len(set(choice for _, choice in self.path))
+        unique_choices = len(self._path_choices)
         self.achievements["Explorer"]["progress"] = unique_choices
         
         if unique_choices >= 10:
@@ -153,32 +190,15 @@ class MemoryManager:
 
     def _get_favorite_mood(self) -> str:
         """Determine the most experienced mood"""
-        if not self.stats["mood_transitions"]:
-            return "mysterious"
-        
-        mood_counts = {}
-        for _, mood in self.stats["mood_transitions"]:
-            mood_counts[mood] = mood_counts.get(mood, 0) + 1
-        
-        return max(mood_counts.items(), key=lambda x: x[1])[0]
+        return self._favorite_mood or "mysterious"
 
     def _analyze_playstyle(self) -> str:
         """Analyze player's story choices to determine playstyle"""
         if not self.path:
             return "Newcomer"
         
-        # Count choice types
-        investigative = sum(1 for _, choice in self.path if any(word in choice.lower() for word in ["investigate", "search", "examine"]))
-        action = sum(1 for _, choice in self.path if any(word in choice.lower() for word in ["chase", "run", "fight", "escape"]))
-        careful = sum(1 for _, choice in self.path if any(word in choice.lower() for word in ["wait", "observe", "think", "plan"]))
-        
-        # Determine primary playstyle
-        styles = {
-            "Detective": investigative,
-            "Action Seeker": action,
-            "Strategic Thinker": careful
-        }
-        
+        # Determine primary playstyle from the choice types counted in update
+        styles = self._playstyle_counts
         return max(styles.items(), key=lambda x: x[1])[0] if any(styles.values()) else "Balanced Explorer"
 
     def reset(self) -> None:
@@ -186,3 +206,4 @@ class MemoryManager:
         self.path = []
         self.start_time = time.time()
         self.stats["mood_transitions"] = []
+        self._reset_counters()
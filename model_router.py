@@ -0,0 +1,232 @@
+# model_router.py
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from llm_metrics import percentile
+from llm_scheduler import BATCH, PREFETCH, Priority
+
+DEFAULT_MODEL = os.getenv("KUKU_OPENAI_MODEL", "gpt-3.5-turbo")
+DEFAULT_ROUTE = "default"
+# Call types of OpenAIManager and the route serving each
+CALL_ROUTES = {
+    "scene": "scene",
+    "scene_stream": "scene",
+    "structured_scene": "scene",
+    "choices": "choices",
+}
+# Background calls go to their own routes when those are configured
+PRIORITY_ROUTES = {PREFETCH: "prefetch", BATCH: "batch"}
+
+DEFAULT_WINDOW = 200
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MAX_ERROR_RATE = 0.2
+DEFAULT_COOLDOWN = 60.0
+
+
+class Endpoint:
+    """A model behind an OpenAI-compatible endpoint; None fields use the manager's own"""
+
+    def __init__(self, model: str, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        return self.model, self.base_url
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Endpoint) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.model!r}, {self.base_url!r})"
+
+
+class Route:
+    """Endpoints for one call type, preferred first, and the p95 latency they must keep under"""
+
+    def __init__(self, endpoints: Sequence[Endpoint], slo_p95: Optional[float] = None):
+        if not endpoints:
+            raise ValueError("A route needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.slo_p95 = slo_p95
+
+
+class RouteHealth:
+    """Observed latency and errors of each (route, endpoint), shared by every router.
+
+    An endpoint is taken out of a route for ``cooldown`` seconds once, over
+    at least ``min_samples`` of its last ``window`` calls, its p95 latency
+    exceeds the route's SLO or its error rate exceeds ``max_error_rate``.
+    Its samples are then dropped, so after the cooldown it is tried afresh.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 max_error_rate: float = DEFAULT_MAX_ERROR_RATE, cooldown: float = DEFAULT_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (latency or None for an error) per (route, model, base_url)
+        self._samples: Dict[Tuple, Deque[Optional[float]]] = {}
+        self._down_until: Dict[Tuple, float] = {}
+        self.downgrades = 0
+
+    def observe(self, key: Tuple, latency: Optional[float], slo_p95: Optional[float]) -> None:
+        """Record one call; ``latency`` is None when it failed"""
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(latency)
+            if len(samples) < self.min_samples or key in self._down_until:
+                return
+            p95, error_rate = self._measure(samples)
+            if (slo_p95 is not None and p95 > slo_p95) or error_rate > self.max_error_rate:
+                self._down_until[key] = self.clock() + self.cooldown
+                samples.clear()
+                self.downgrades += 1
+                logging.warning(f"Routing around {key}: p95 {p95:.2f}s, error rate {error_rate:.0%}")
+
+    def healthy(self, key: Tuple) -> bool:
+        with self._lock:
+            until = self._down_until.get(key)
+            if until is None:
+                return True
+            if self.clock() < until:
+                return False
+            del self._down_until[key]
+            return True
+
+    def _measure(self, samples: Iterable[Optional[float]]) -> Tuple[float, float]:
+        samples = list(samples)
+        latencies = [latency for latency in samples if latency is not None]
+        error_rate = (len(samples) - len(latencies)) / len(samples) if samples else 0.0
+        return percentile(latencies, 0.95), error_rate
+
+    def get_stats(self) -> List[Dict]:
+        with self._lock:
+            keys = sorted(set(self._samples) | set(self._down_until), key=str)
+            now = self.clock()
+            rows = []
+            for key in keys:
+                samples = self._samples.get(key, ())
+                p95, error_rate = self._measure(samples)
+                rows.append({
+                    "route": key[0], "model": key[1], "base_url": key[2], "calls": len(samples),
+                    "p95": p95, "error_rate": error_rate, "down": self._down_until.get(key, 0.0) > now,
+                })
+            return rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._down_until.clear()
+
+
+# Shared by every router in the process, so all sessions see the same endpoint health
+route_health = RouteHealth()
+
+
+def _endpoint(spec: Union[str, Mapping]) -> Endpoint:
+    if isinstance(spec, str):
+        return Endpoint(spec)
+    return Endpoint(spec["model"], spec.get("base_url"), spec.get("api_key"))
+
+
+def load_routes_config(value: Optional[str] = None) -> Dict:
+    """Routes from ``KUKU_MODEL_ROUTES``: inline JSON or the path of a JSON file"""
+    value = os.getenv("KUKU_MODEL_ROUTES", "") if value is None else value
+    if not value.strip():
+        return {}
+    try:
+        if value.lstrip().startswith("{"):
+            return json.loads(value)
+        with open(value, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"Error loading model routes: {e}")
+        return {}
+
+
+class ModelRouter:
+    """Picks the model and endpoint for each call.
+
+    Call types map to named routes (``scene``, ``choices``, and ``prefetch``
+    or ``batch`` for background calls), each falling back to the
+    ``default`` route when not configured. A route lists endpoints in order
+    of preference; the first healthy one is used, so a route whose preferred
+    model breaks its p95 SLO or keeps failing moves to the next (faster or
+    cheaper) one until the cooldown ends. When every endpoint is out, the
+    preferred one is used anyway.
+    """
+
+    def __init__(self, routes: Optional[Mapping[str, Route]] = None, health: Optional[RouteHealth] = None):
+        self.routes = dict(routes or {})
+        self.routes.setdefault(DEFAULT_ROUTE, Route([Endpoint(DEFAULT_MODEL)]))
+        self.health = health or route_health
+
+    @classmethod
+    def from_config(cls, config: Mapping, health: Optional[RouteHealth] = None) -> "ModelRouter":
+        """Build from ``{"scene": {"models": ["gpt-4o", {"model": ..., "base_url": ...}], "slo_p95": 6}}``"""
+        routes = {
+            name: Route([_endpoint(spec) for spec in options["models"]], options.get("slo_p95"))
+            for name, options in config.items()
+        }
+        return cls(routes, health)
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        try:
+            return cls.from_config(load_routes_config())
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Error in model routes, using {DEFAULT_MODEL} only: {e}")
+            return cls()
+
+    @property
+    def default_model(self) -> str:
+        return self.routes[DEFAULT_ROUTE].endpoints[0].model
+
+    def with_model(self, model: str) -> "ModelRouter":
+        """A router whose default route prefers ``model``, keeping its fallbacks and the shared health"""
+        default = self.routes[DEFAULT_ROUTE]
+        endpoints = [Endpoint(model)] + [endpoint for endpoint in default.endpoints if endpoint.model != model]
+        return ModelRouter({**self.routes, DEFAULT_ROUTE: Route(endpoints, default.slo_p95)}, self.health)
+
+    def route_name(self, kind: str, priority: Union[int, Priority] = 0) -> str:
+        """The configured route serving a call type at a priority"""
+        value = priority.value if isinstance(priority, Priority) else priority
+        for name in (PRIORITY_ROUTES.get(value), CALL_ROUTES.get(kind)):
+            if name in self.routes:
+                return name
+        return DEFAULT_ROUTE
+
+    def choose(self, name: str, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        """The endpoint for the next call on a route, avoiding ``exclude`` when there is another"""
+        endpoints = [endpoint for endpoint in self.routes[name].endpoints if endpoint not in exclude]
+        endpoints = endpoints or self.routes[name].endpoints
+        for endpoint in endpoints:
+            if self.health.healthy((name,) + endpoint.key):
+                return endpoint
+        return endpoints[0]
+
+    def observe(self, name: str, endpoint: Endpoint, latency: Optional[float]) -> None:
+        """Record how a call went: its latency, or None when it failed"""
+        self.health.observe((name,) + endpoint.key, latency, self.routes[name].slo_p95)
+
+    def get_stats(self) -> List[Dict]:
+        return self.health.get_stats()
+
+
+# Routes from KUKU_MODEL_ROUTES, shared by every session that does not pick its own model
+model_router = ModelRouter.from_env()
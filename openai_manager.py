@@ -1,17 +1,63 @@
 import os
 import json
 import logging
+import threading
+import time
 import openai
 import streamlit as st
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Sequence, Tuple, Optional, Union
+from client_pool import ClientPool, client_pool, iter_chunks
+from generation_cache import GenerationCache, cache_key
+from hedging import (DEFAULT_SCENE_DEADLINE, HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE, DeadlineExceeded, HedgeLost,
+                     HedgeRace, close_response)
+from llm_metrics import LLMMetrics, llm_metrics
+from llm_scheduler import BATCH, INTERACTIVE, LLMScheduler, Priority, llm_scheduler
+from model_router import Endpoint, ModelRouter, model_router
+from scene_ids import scene_ids
+from scene_schema import (MOODS, JsonSceneStreamParser, SceneFormatError, build_scene, is_valid_scene,
+                          load_scene, response_format)
+from scene_stream import DEFAULT_TEXT, SceneStreamParser, choice_targets, parse_scene
+from story_context import ContextBuilder, context_lines
+from story_overlay import StoryOverlay
+
+# A structured reply that cannot be repaired is asked for once more
+STRUCTURED_ATTEMPTS = 2
+# Calls writing a scene; interactive ones get a deadline and hedged requests
+SCENE_CALLS = {"scene", "scene_stream", "structured_scene"}
+
+class StreamInterrupted(Exception):
+    """A streamed reply broke off after part of it was delivered"""
 
 class OpenAIManager:
     """Manages interactions with OpenAI API for story generation"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cache: Optional[GenerationCache] = None,
+                 scheduler: Optional[LLMScheduler] = None, base_url: Optional[str] = None,
+                 pool: Optional[ClientPool] = None, structured: Optional[bool] = None,
+                 metrics: Optional[LLMMetrics] = None, router: Optional[ModelRouter] = None):
         """Initialize OpenAI client with API key"""
         self.api_key = api_key
-        self.client = None
+        # Structured mode asks for the whole scene, choices and mood included, as one JSON object
+        self.structured = os.getenv("KUKU_STRUCTURED_SCENES") == "1" if structured is None else structured
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        # Clients and their connections are shared with every session using the same key
+        self.pool = pool or client_pool
+        self._pool_key: Optional[Tuple[str, Optional[str]]] = None
+        self._client = None
+        # Which model and endpoint serves each call type; see model_router
+        self.router = router or model_router
+        # Replies to identical requests are served from here when set
+        self.cache = cache
+        # Rate limits and retries are shared with every other session
+        self.scheduler = scheduler or llm_scheduler
+        self.context_builder = ContextBuilder()
+        # Per-call timings, tokens and cost, shared by every session
+        self.metrics = metrics or llm_metrics
+        # Seconds an interactive scene may take to start (0: no limit), and whether slow ones are hedged
+        self.scene_deadline = DEFAULT_SCENE_DEADLINE
+        self.hedging = os.getenv("KUKU_HEDGING", "1") == "1"
+        self.cost = 0.0
+        self._cost_lock = threading.Lock()
         self.system_prompt = """
         You are an expert storyteller specializing in thriller narratives. 
         Your task is to continue an interactive story based on the user's choices.
@@ -33,12 +79,44 @@ class OpenAIManager:
             api_key = self.api_key or st.session_state.get("openai_api_key") or os.getenv("OPENAI_API_KEY")
             
             if api_key:
-                self.client = openai.OpenAI(api_key=api_key)
+                self._client = None
+                self._pool_key = (api_key, self.base_url)
+                self.pool.get(api_key, self.base_url)
                 logging.info("OpenAI client initialized successfully")
             else:
                 logging.warning("No OpenAI API key provided")
         except Exception as e:
+            self._pool_key = None
             logging.error(f"Error initializing OpenAI client: {e}")
+
+    @property
+    def client(self):
+        """The pooled client for this session's key, or one set explicitly"""
+        if self._client is not None or self._pool_key is None:
+            return self._client
+        # Looked up on each use, so a client the pool closed while idle is rebuilt
+        return self.pool.get(*self._pool_key)
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client = client
+    
+    def _client_for(self, endpoint: Endpoint):
+        """The pooled client for an endpoint, falling back to this session's key and base URL"""
+        if self._client is not None or (self._pool_key is None and endpoint.api_key is None):
+            return self._client
+        api_key = endpoint.api_key or self._pool_key[0]
+        return self.pool.get(api_key, endpoint.base_url or self.base_url)
+    
+    @property
+    def model(self) -> str:
+        """The preferred model of the default route"""
+        return self.router.default_model
+    
+    @model.setter
+    def model(self, model: str) -> None:
+        # This session prefers another model; endpoint health stays shared
+        self.router = self.router.with_model(model)
     
     def set_api_key(self, api_key: str) -> bool:
         """Set or update API key"""
@@ -58,28 +136,137 @@ class OpenAIManager:
             logging.error("OpenAI client not initialized")
             return self._create_error_scene("API connection error. Please check your API key.")
         
+        scene, _ = self.generate_scene_with_usage(story_context, current_scene_id, user_choice)
+        if scene is None:
+            return self._create_error_scene("Story generation error. Please try again.")
+        return scene
+    
+    def generate_scene_with_usage(self, story_context: Dict, current_scene_id: str,
+                                  user_choice: Optional[str] = None,
+                                  priority: Union[int, Priority] = INTERACTIVE) -> Tuple[Optional[Dict], int]:
+        """Generate a scene and report the tokens it cost; the scene is None on failure"""
+        if not self.client:
+            logging.error("OpenAI client not initialized")
+            return None, 0
+        
         try:
+            if self.structured:
+                return self._generate_structured(story_context, user_choice, None, priority)
+            
             # Build prompt with story context
             prompt = self._build_prompt(story_context, current_scene_id, user_choice)
-            
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
+            scene_text, tokens = self._complete(self.system_prompt, prompt, max_tokens=300, priority=priority,
+                                                kind="scene")
             
             # Parse response into scene format
-            scene_text = response.choices[0].message.content
-            return self._parse_scene_text(scene_text, current_scene_id)
+            return self._parse_scene_text(scene_text), tokens
             
         except Exception as e:
             logging.error(f"Error generating scene: {e}")
-            return self._create_error_scene(f"Story generation error: {str(e)}")
+            return None, 0
+    
+    def generate_scene_streaming(self, story_context: Dict, current_scene_id: str,
+                                 user_choice: Optional[str] = None,
+                                 parser: Optional[SceneStreamParser] = None,
+                                 priority: Union[int, Priority] = INTERACTIVE) -> Tuple[Optional[Dict], int]:
+        """Generate a scene token by token, feeding ``parser`` as the reply arrives.
+
+        Other threads can read ``parser.text`` to show the scene while it is
+        written. Returns the finished scene and its token cost like
+        generate_scene_with_usage.
+        """
+        if not self.client:
+            logging.error("OpenAI client not initialized")
+            return None, 0
+        
+        parser = parser or self.new_parser()
+        try:
+            if self.structured:
+                return self._generate_structured(story_context, user_choice, parser, priority)
+            
+            prompt = self._build_prompt(story_context, current_scene_id, user_choice)
+            _, tokens = self._complete(self.system_prompt, prompt, max_tokens=300, on_text=parser.feed,
+                                       priority=priority, kind="scene_stream")
+            return parser.scene(), tokens
+            
+        except Exception as e:
+            logging.error(f"Error streaming scene: {e}")
+            parser.close()
+            return None, 0
+    
+    def new_parser(self) -> Union[SceneStreamParser, JsonSceneStreamParser]:
+        """A streaming parser for the reply format this manager asks for"""
+        return JsonSceneStreamParser() if self.structured else SceneStreamParser()
+    
+    def _generate_structured(self, story_context: Dict, user_choice: Optional[str],
+                             parser: Optional[JsonSceneStreamParser],
+                             priority: Union[int, Priority]) -> Tuple[Optional[Dict], int]:
+        """One call for text, question, choices and mood; bad JSON is repaired locally before retrying"""
+        prompt = self._build_structured_prompt(story_context, user_choice)
+        tokens = 0
+        for attempt in range(STRUCTURED_ATTEMPTS):
+            if parser:
+                parser.reset()
+            reply, used = self._complete(
+                self.system_prompt, prompt, max_tokens=400, on_text=parser.feed if parser else None,
+                priority=priority, response_format=response_format, cacheable=is_valid_scene,
+                kind="structured_scene"
+            )
+            tokens += used
+            try:
+                scene = build_scene(load_scene(reply))
+            except SceneFormatError as e:
+                logging.warning(f"Unusable structured scene (attempt {attempt + 1}): {e}")
+                continue
+            if parser:
+                parser.close()
+            return scene, tokens
+        return None, tokens
+    
+    def generate_bridge_scene(self, story_context: Dict, mood: str,
+                              priority: Union[int, Priority] = BATCH) -> Tuple[Optional[Dict], int]:
+        """Write a self-contained scene in ``mood`` that can follow any moment of the story.
+
+        Bridge scenes are kept ready to splice in when a live scene is late
+        (see bridge_pool). Returns the scene, tagged with its mood, and its
+        token cost; the scene is None on failure.
+        """
+        if not self.client:
+            logging.error("OpenAI client not initialized")
+            return None, 0
+        
+        title = story_context.get("title", "Thriller Story")
+        genre = story_context.get("genre", "Thriller")
+        prompt = f"""
+        You're writing for a {genre} story titled "{title}".
+        {story_context.get("summary", "")}
+        
+        Write a short {mood} scene (60-100 words) that could follow any moment of this story:
+        don't name characters, places or events that haven't been mentioned above.
+        
+        Format your response like this:
+        [SCENE]
+        Your scene text here...
+        [QUESTION]
+        Your question here...
+        [CHOICES]
+        Choice 1
+        Choice 2
+        (Choice 3 - optional)
+        """
+        try:
+            # Every bridge should read differently, so none come from the cache
+            reply, tokens = self._complete(self.system_prompt, prompt, max_tokens=250, temperature=0.9,
+                                           priority=priority, kind="bridge", use_cache=False)
+            scene = parse_scene(reply)
+        except Exception as e:
+            logging.error(f"Error generating bridge scene: {e}")
+            return None, 0
+        # A bridge has to stand on its own: no placeholder text, and real choices
+        if scene["text"] == DEFAULT_TEXT or len(scene.get("choices") or {}) < 2:
+            return None, tokens
+        scene["mood"] = mood
+        return scene, tokens
     
     def generate_choices(self, story_context: Dict, current_scene_id: str, 
                         scene_text: str) -> Dict[str, str]:
@@ -101,65 +288,293 @@ class OpenAIManager:
             """
             
             # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You generate choices for interactive stories in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=150
+            choices_text, _ = self._complete(
+                "You generate choices for interactive stories in JSON format.", prompt, max_tokens=150,
+                kind="choices"
             )
             
             # Parse response into choices format
-            choices_text = response.choices[0].message.content
             return self._parse_choices_text(choices_text, current_scene_id)
             
         except Exception as e:
             logging.error(f"Error generating choices: {e}")
             return {"Try again": current_scene_id}
     
-    def extend_story(self, story_data: Dict, current_scene_id: str, 
-                    user_choice: str) -> Tuple[str, Dict]:
-        """Generate a new scene and add it to the story"""
+    def _complete(self, system_prompt: str, prompt: str, max_tokens: int, temperature: float = 0.7,
+                  on_text: Optional[Callable[[str], None]] = None,
+                  priority: Union[int, Priority] = INTERACTIVE,
+                  response_format: Optional[Callable[[str], Dict]] = None,
+                  cacheable: Callable[[str], bool] = bool, kind: str = "completion",
+                  use_cache: bool = True) -> Tuple[str, int]:
+        """Run one chat completion through the generation cache, returning (reply, tokens).
+
+        Calls that miss the cache go through the shared scheduler, which
+        applies rate limits and retries transient failures. The router picks
+        the model for ``kind`` at each attempt, so a retry after an error
+        moves to the route's next endpoint. With ``on_text`` the reply is
+        streamed and passed on piece by piece. ``response_format(model)``
+        gives the format to ask that model for. Only replies passing
+        ``cacheable`` are stored, and ``use_cache=False`` skips the cache for
+        calls that should differ each time. Cached replies cost no tokens. API errors
+        propagate to the caller. Every call is recorded in the metrics under
+        ``kind``.
+        
+        Interactive scene calls raise DeadlineExceeded when no token arrives
+        within ``scene_deadline`` seconds. If the first token is later than
+        the recent p90 for the model, a duplicate request is sent (to the
+        route's next endpoint, if it has one); the first to answer is used
+        and the other is closed.
+        """
+        started = time.monotonic()
+        route = self.router.route_name(kind, priority)
+        endpoint = self.router.choose(route)
+        key = None
+        if self.cache is not None and use_cache:
+            key = cache_key(endpoint.model, system_prompt, prompt, temperature, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_text:
+                    on_text(cached[0])
+                self.metrics.record(endpoint.model, kind, time.monotonic() - started, cache="hit")
+                return cached[0], 0
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        # Filled in by the attempt that succeeds, and by the scheduler
+        call = {"endpoint": endpoint}
+        failed: List[Endpoint] = []
+        # Rough prompt size (about four characters per token) plus the reply budget
+        estimate = (len(system_prompt) + len(prompt)) // 4 + max_tokens
+        urgent = kind in SCENE_CALLS and self._priority_value(priority) == INTERACTIVE
+        deadline = started + self.scene_deadline if urgent and self.scene_deadline > 0 else None
+        hedge_after = self._hedge_delay(endpoint.model, kind) if urgent and self.hedging else None
+        # Set once the first attempt has left the scheduler queue; a hedge is timed from then
+        dispatched = threading.Event()
+        
+        def request(race: Optional[HedgeRace] = None, entrant: int = 0) -> Tuple[Tuple[str, int], Endpoint]:
+            attempt = self.router.choose(route, failed) if failed else endpoint
+            if race is None:
+                call["endpoint"] = attempt
+            sent = time.monotonic()
+            dispatched.set()
+            return attempt_at(attempt, sent, race, entrant)
+        
+        def attempt_at(attempt: Endpoint, sent: float, race: Optional[HedgeRace] = None,
+                       entrant: int = 0) -> Tuple[Tuple[str, int], Endpoint]:
+            if deadline is not None and sent >= deadline:
+                raise DeadlineExceeded("Deadline passed before the request was sent")
+            try:
+                result = send(attempt, sent, race, entrant)
+            except HedgeLost:
+                # Losing a race says nothing about the endpoint
+                raise
+            except Exception:
+                self.router.observe(route, attempt, None)
+                failed.append(attempt)
+                raise
+            self.router.observe(route, attempt, time.monotonic() - sent)
+            return result, attempt
+        
+        def send(attempt: Endpoint, sent: float, race: Optional[HedgeRace] = None,
+                 entrant: int = 0) -> Tuple[str, int]:
+            """One request; in a race, only the attempt that answers first goes on"""
+            if race is not None and race.lost(entrant):
+                raise HedgeLost()
+            
+            def first_token() -> bool:
+                if race is not None and not race.claim(entrant):
+                    return False
+                call["ttft"] = time.monotonic() - sent
+                return True
+            
+            client = self._client_for(attempt)
+            options = {"response_format": response_format(attempt.model)} if response_format else {}
+            if on_text is None and race is None:
+                response = client.chat.completions.create(
+                    model=attempt.model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                    **options
+                )
+                first_token()
+                call["usage"] = response
+                return response.choices[0].message.content, self._total_tokens(response)
+            
+            # Racing calls stream even when nobody reads along, so a losing attempt can be closed
+            stream = client.chat.completions.create(
+                model=attempt.model, messages=messages, temperature=temperature, max_tokens=max_tokens,
+                stream=True, stream_options={"include_usage": True}, **options
+            )
+            if race is not None:
+                race.register(entrant, stream)
+            parts = []
+            tokens = 0
+            try:
+                for chunk in iter_chunks(stream):
+                    # The final chunk carries usage and no choices
+                    if self._total_tokens(chunk):
+                        tokens = self._total_tokens(chunk)
+                        call["usage"] = chunk
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts and not first_token():
+                            raise HedgeLost()
+                        parts.append(chunk.choices[0].delta.content)
+                        if on_text:
+                            on_text(parts[-1])
+            except HedgeLost:
+                close_response(stream)
+                raise
+            except Exception as e:
+                if race is not None and race.lost(entrant):
+                    # Closed under us when another attempt won or the deadline passed
+                    raise HedgeLost() from e
+                if parts and on_text:
+                    # Text was already shown; a retry would repeat it
+                    raise StreamInterrupted(str(e)) from e
+                raise
+            return "".join(parts), tokens
+        
+        def usage(result: Tuple[Tuple[str, int], Endpoint]) -> int:
+            return result[0][1]
+        
+        try:
+            if deadline is None and hedge_after is None:
+                (reply, tokens), call["endpoint"] = self.scheduler.call(
+                    request, estimated_tokens=estimate, priority=priority, usage=usage, report=call
+                )
+            else:
+                (reply, tokens), call["endpoint"] = self._race(
+                    lambda race, entrant: self.scheduler.call(
+                        lambda: request(race, entrant), estimated_tokens=estimate, priority=priority,
+                        usage=usage, report=call
+                    ),
+                    lambda race, entrant, hedge, sent: self.scheduler.call(
+                        lambda: attempt_at(hedge, sent, race, entrant), estimated_tokens=estimate,
+                        priority=INTERACTIVE, usage=usage
+                    ),
+                    endpoint, route, dispatched, hedge_after, deadline
+                )
+        except Exception as e:
+            self._record_call(kind, started, call, type(e).__name__, "miss" if key else "off")
+            raise
+        self._record_call(kind, started, call, "ok", "miss" if key else "off")
+        
+        if key is not None and reply and cacheable(reply):
+            # Stored under the model that wrote it
+            model = call["endpoint"].model
+            self.cache.put(cache_key(model, system_prompt, prompt, temperature, max_tokens), reply, tokens)
+        return reply, tokens
+    
+    def _race(self, primary: Callable, hedged: Callable, endpoint: Endpoint, route: str,
+              dispatched: threading.Event, hedge_after: Optional[float],
+              deadline: Optional[float]) -> Tuple[Tuple[str, int], Endpoint]:
+        """Race ``primary`` against the deadline, hedging it after ``hedge_after`` seconds without a token.
+
+        Each attempt takes its own scheduler slot and keeps it until it has
+        really finished; attempts that lose, or are still waiting at the
+        deadline, have their responses closed.
+        """
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        
+        def first(entrant: int):
+            try:
+                return primary(race, entrant)
+            finally:
+                # Failing before the request went out counts too
+                dispatched.set()
+        
+        race = HedgeRace()
+        race.run(first)
+        if hedge_after is None or not dispatched.wait(remaining()):
+            return race.result(remaining())
+        sent = time.monotonic()
+        if (deadline is not None and hedge_after >= remaining()) or race.wait_first(hedge_after):
+            return race.result(remaining())
+        
+        hedge = self.router.choose(route, [endpoint])
+        logging.info(f"No reply after {hedge_after:.2f}s, hedging with {hedge.model}")
+        # The duplicate waits its turn under the rate limits like any other call
+        hedge_entrant = race.run(lambda entrant: hedged(race, entrant, hedge, sent))
+        try:
+            return race.result(remaining())
+        finally:
+            self.metrics.record_hedge(race.winner == hedge_entrant)
+    
+    def _hedge_delay(self, model: str, kind: str) -> Optional[float]:
+        """Time to first token after which a request is duplicated, once enough calls are known"""
+        return self.metrics.recent_percentile(model, kind, "ttft", HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    
+    def _priority_value(self, priority: Union[int, Priority]) -> int:
+        return priority.value if isinstance(priority, Priority) else priority
+    
+    def _record_call(self, kind: str, started: float, call: Dict, outcome: str, cache: str) -> None:
+        usage = getattr(call.get("usage"), "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0)
+        completion_tokens = getattr(usage, "completion_tokens", 0)
+        recorded = self.metrics.record(
+            call["endpoint"].model, kind, time.monotonic() - started, outcome=outcome, cache=cache,
+            queue_wait=call.get("queue_wait", 0.0), ttft=call.get("ttft"),
+            prompt_tokens=prompt_tokens if isinstance(prompt_tokens, int) else 0,
+            completion_tokens=completion_tokens if isinstance(completion_tokens, int) else 0,
+            retries=call.get("retries", 0)
+        )
+        with self._cost_lock:
+            self.cost += recorded["cost"]
+    
+    def take_cost(self) -> float:
+        """Dollars spent on model calls since the last call, e.g. over one story"""
+        with self._cost_lock:
+            cost, self.cost = self.cost, 0.0
+        return cost
+    
+    def extend_story(self, story_data: StoryOverlay, current_scene_id: str, 
+                    user_choice: str, path: Sequence[Tuple[str, str]] = ()) -> Tuple[str, StoryOverlay]:
+        """Generate a new scene and add it to the session's story overlay"""
         if not self.client:
             logging.error("OpenAI client not initialized")
             return current_scene_id, story_data
         
         try:
-            # Generate a unique ID for the new scene
-            new_scene_id = f"scene_{len(story_data['scenes']) + 1}_ai"
-            
-            # Get the current scene
-            current_scene = story_data["scenes"].get(current_scene_id, {})
-            
-            # Build context for generation
-            story_context = {
-                "title": story_data.get("title", "Thriller Story"),
-                "genre": story_data.get("genre", "Thriller"),
-                "previous_scenes": [
-                    {"id": scene_id, "text": scene.get("text", ""), "choices": scene.get("choices", {})}
-                    for scene_id, scene in story_data["scenes"].items()
-                    if scene_id == current_scene_id or scene_id in current_scene.get("choices", {}).values()
-                ]
-            }
-            
-            # Generate new scene
+            story_context = self.build_extension_context(story_data, current_scene_id, path)
             new_scene = self.generate_scene(story_context, current_scene_id, user_choice)
-            
-            # Add the new scene to the story
-            story_data["scenes"][new_scene_id] = new_scene
-            
-            # Update the current scene's choices to point to the new scene
-            if current_scene and "choices" in current_scene:
-                current_scene["choices"][user_choice] = new_scene_id
-            
+            new_scene_id = self.add_generated_scene(story_data, current_scene_id, user_choice, new_scene)
             return new_scene_id, story_data
             
         except Exception as e:
             logging.error(f"Error extending story: {e}")
             return current_scene_id, story_data
     
+    def build_extension_context(self, story_data: StoryOverlay, current_scene_id: str,
+                                path: Sequence[Tuple[str, str]] = (),
+                                builder: Optional[ContextBuilder] = None) -> Dict:
+        """Collect the story context used to continue from a scene.
+
+        ``path`` is the reader's ``(scene_id, choice)`` history; the context
+        follows it back within a token budget instead of scanning the story.
+        """
+        return (builder or self.context_builder).build(story_data, path, current_scene_id)
+    
+    def add_generated_scene(self, story_data: StoryOverlay, current_scene_id: str,
+                            user_choice: str, new_scene: Dict, new_scene_id: Optional[str] = None,
+                            pending: bool = True) -> str:
+        """Add a generated scene to the overlay and point the chosen choice at it.
+
+        ``pending=False`` records a scene that another session already saved.
+        """
+        # Generate a unique ID for the new scene
+        new_scene_id = new_scene_id or scene_ids.allocate(story_data["scenes"])
+        
+        # Add the new scene to the overlay, leaving the shared story untouched
+        story_data.add_scene(new_scene_id, new_scene, pending)
+        
+        # Rewire the current scene's choice to point to the new scene
+        current_scene = story_data.get_scene(current_scene_id)
+        if current_scene and "choices" in current_scene:
+            story_data.set_choice(current_scene_id, user_choice, new_scene_id, pending)
+        
+        return new_scene_id
+    
     def _build_prompt(self, story_context: Dict, current_scene_id: str, 
                      user_choice: Optional[str] = None) -> str:
         """Build prompt for scene generation"""
@@ -174,12 +589,9 @@ class OpenAIManager:
         if user_choice:
             prompt += f"The reader chose: \"{user_choice}\"\n\n"
         
-        # Add previous scenes for context
-        previous_scenes = story_context.get("previous_scenes", [])
-        if previous_scenes:
-            prompt += "Previous scenes:\n"
-            for scene in previous_scenes:
-                prompt += f"- {scene.get('text', '')}\n"
+        # Add the story so far for context
+        for line in context_lines(story_context):
+            prompt += f"{line}\n"
         
         prompt += """
         Generate the next scene in this thriller story. Include:
@@ -200,38 +612,36 @@ class OpenAIManager:
         
         return prompt
     
-    def _parse_scene_text(self, scene_text: str, current_scene_id: str) -> Dict:
+    def _build_structured_prompt(self, story_context: Dict, user_choice: Optional[str] = None) -> str:
+        """Build the prompt for a whole scene as one JSON object"""
+        title = story_context.get("title", "Thriller Story")
+        genre = story_context.get("genre", "Thriller")
+        
+        prompt = f"""
+        You're continuing a {genre} story titled "{title}".
+        
+        """
+        
+        if user_choice:
+            prompt += f"The reader chose: \"{user_choice}\"\n\n"
+        
+        for line in context_lines(story_context):
+            prompt += f"{line}\n"
+        
+        prompt += f"""
+        Write the next scene and reply with only this JSON object:
+        {{"text": "vivid scene description, 100-150 words",
+         "question": "a question for the reader",
+         "choices": ["2 or 3 short, distinct choices"],
+         "mood": one of {json.dumps(list(MOODS))}}}
+        """
+        
+        return prompt
+    
+    def _parse_scene_text(self, scene_text: str) -> Dict:
         """Parse generated text into scene format"""
         try:
-            # Extract sections
-            scene_parts = {}
-            current_section = None
-            
-            for line in scene_text.split('\n'):
-                line = line.strip()
-                if line in ['[SCENE]', '[QUESTION]', '[CHOICES]']:
-                    current_section = line
-                    scene_parts[current_section] = []
-                elif current_section and line:
-                    scene_parts[current_section].append(line)
-            
-            # Build scene object
-            scene = {
-                "text": ' '.join(scene_parts.get('[SCENE]', ['Scene text missing'])),
-                "question": ' '.join(scene_parts.get('[QUESTION]', ['What do you do next?']))
-            }
-            
-            # Add choices
-            choices = scene_parts.get('[CHOICES]', [])
-            if choices:
-                choice_dict = {}
-                for i, choice in enumerate(choices):
-                    next_scene_id = f"{current_scene_id}_choice_{i+1}"
-                    choice_dict[choice] = next_scene_id
-                scene["choices"] = choice_dict
-            
-            return scene
-            
+            return parse_scene(scene_text)
         except Exception as e:
             logging.error(f"Error parsing scene text: {e}")
             return self._create_error_scene("Error processing the story. Please try again.")
@@ -249,22 +659,27 @@ class OpenAIManager:
             if start_idx >= 0 and end_idx > start_idx:
                 json_str = choices_text[start_idx:end_idx]
                 choices = json.loads(json_str)
-                return choices
+                # The values are the model's placeholder ids, the same in every reply:
+                # keep the choice texts and give each a fresh _ai scene
+                choices = choice_targets(choice.strip() for choice in choices
+                                         if isinstance(choice, str) and choice.strip())
+                return choices if choices else choice_targets(["Continue"])
             
             # Fallback: parse line by line if JSON not found
-            choices = {}
-            for i, line in enumerate(choices_text.split('\n')):
-                line = line.strip()
-                if line and not line.startswith('{') and not line.startswith('}'):
-                    next_scene_id = f"{current_scene_id}_choice_{i+1}"
-                    choices[line] = next_scene_id
+            lines = [line.strip() for line in choices_text.split('\n')]
+            choices = choice_targets(line for line in lines if line and line[0] not in "{}")
             
-            return choices if choices else {"Continue": f"{current_scene_id}_continue"}
+            return choices if choices else choice_targets(["Continue"])
             
         except Exception as e:
             logging.error(f"Error parsing choices text: {e}")
             return {"Try again": current_scene_id}
     
+    def _total_tokens(self, response) -> int:
+        """Tokens billed for a completion, or 0 when the server did not report usage"""
+        tokens = getattr(getattr(response, "usage", None), "total_tokens", 0)
+        return tokens if isinstance(tokens, int) else 0
+    
     def _create_error_scene(self, error_message: str) -> Dict:
         """Create an error scene when generation fails"""
         return {
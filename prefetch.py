@@ -0,0 +1,79 @@
+# prefetch.py
+
+import threading
+from typing import Dict
+
+DEFAULT_MAX_SCENES = 20
+DEFAULT_MAX_CONCURRENT = 8
+
+
+class PrefetchBudget:
+    """Process-wide cap on speculative generation, plus the numbers to tune it.
+
+    Prefetching writes the AI children of a scene while the reader is still
+    reading it, so the click finds the scene ready. Every prefetch the reader
+    does not take is spend without benefit; ``hits``/``misses`` and
+    ``wasted_tokens`` let that cost be weighed against the latency saved.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.started = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.used_tokens = 0
+        self.wasted_tokens = 0
+
+    def try_acquire(self) -> bool:
+        """Reserve a concurrent prefetch slot, or return False when all are taken"""
+        with self._lock:
+            if self.in_flight >= self.max_concurrent:
+                self.skipped += 1
+                return False
+            self.in_flight += 1
+            self.started += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def record_used(self, tokens: int) -> None:
+        with self._lock:
+            self.used_tokens += tokens
+
+    def record_wasted(self, tokens: int) -> None:
+        with self._lock:
+            self.wasted += 1
+            self.wasted_tokens += tokens
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            clicks = self.hits + self.misses
+            return {
+                "in_flight": self.in_flight,
+                "started": self.started,
+                "skipped": self.skipped,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / clicks if clicks else 0.0,
+                "wasted": self.wasted,
+                "used_tokens": self.used_tokens,
+                "wasted_tokens": self.wasted_tokens,
+            }
+
+
+# Shared by every session in the process
+prefetch_budget = PrefetchBudget()
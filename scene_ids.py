@@ -0,0 +1,41 @@
+# scene_ids.py
+
+import itertools
+import os
+import secrets
+import threading
+from typing import Container
+
+
+class SceneIdAllocator:
+    """Hands out ids for generated scenes that cannot collide.
+
+    Ids look like ``scene_<node>_<n>_ai``. ``node`` combines the process id
+    with random bits and is drawn again in forked children, so worker
+    processes never share it; ``n`` counts up under a lock, so threads
+    never share it. Ids already present in a story are skipped.
+    """
+
+    def __init__(self, prefix: str = "scene", suffix: str = "_ai"):
+        self.prefix = prefix
+        self.suffix = suffix
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+        self.node = f"{os.getpid():x}{secrets.token_hex(3)}"
+        self._counter = itertools.count(1)
+
+    def allocate(self, existing: Container = ()) -> str:
+        """Return a fresh id that is not in ``existing``"""
+        while True:
+            with self._lock:
+                scene_id = f"{self.prefix}_{self.node}_{next(self._counter)}{self.suffix}"
+            if scene_id not in existing:
+                return scene_id
+
+
+# Process-wide allocator shared by every session
+scene_ids = SceneIdAllocator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=scene_ids._reset)
@@ -0,0 +1,220 @@
+# scene_schema.py
+
+import json
+import re
+from typing import Dict, List, Optional
+
+from scene_stream import DEFAULT_QUESTION, choice_targets
+from utils import MOOD_KEYWORDS
+
+MOODS = tuple(MOOD_KEYWORDS)
+MAX_CHOICES = 3
+
+# Strict JSON schema for a whole scene in one reply
+SCENE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string"},
+        "question": {"type": "string"},
+        "choices": {"type": "array", "items": {"type": "string"}},
+        "mood": {"type": "string", "enum": list(MOODS)},
+    },
+    "required": ["text", "question", "choices", "mood"],
+    "additionalProperties": False,
+}
+
+# Models that enforce a JSON schema; older ones only promise valid JSON
+SCHEMA_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_TEXT_FIELD = re.compile(r'"text"\s*:\s*"')
+
+
+class SceneFormatError(ValueError):
+    """A structured reply that is not a usable scene, even after repair"""
+
+
+def response_format(model: str) -> Dict:
+    """The strictest response_format a model supports for scene replies"""
+    if model.startswith(SCHEMA_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": "scene", "strict": True, "schema": SCENE_SCHEMA}}
+    return {"type": "json_object"}
+
+
+def repair_json(reply: str) -> str:
+    """Fix the usual ways a model mangles JSON: code fences, chatter, trailing commas, truncation"""
+    start = reply.find("{")
+    if start < 0:
+        raise SceneFormatError("No JSON object in reply")
+    reply = _TRAILING_COMMA.sub(r"\1", reply[start:])
+
+    # Walk the object, noting where it ends and what is left open if it was cut off
+    closers: List[str] = []
+    in_string = escaped = False
+    for end, char in enumerate(reply):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not closers:
+                break
+            closers.pop()
+            if not closers:
+                return reply[:end + 1]
+
+    if escaped:
+        reply = reply[:-1]
+    if in_string:
+        reply += '"'
+    return _TRAILING_COMMA.sub(r"\1", reply.rstrip().rstrip(",") + "".join(reversed(closers)))
+
+
+def load_scene(reply: str) -> Dict:
+    """Parse and validate a structured reply into {"text", "question", "choices", "mood"}"""
+    try:
+        data = json.loads(reply)
+    except ValueError:
+        try:
+            data = json.loads(repair_json(reply))
+        except ValueError as e:
+            raise SceneFormatError(f"Unreadable scene JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise SceneFormatError("Scene JSON is not an object")
+
+    text = data.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise SceneFormatError("Scene has no text")
+    choices = data.get("choices")
+    if not isinstance(choices, list):
+        raise SceneFormatError("Scene choices are not a list")
+    choices = list(dict.fromkeys(choice.strip() for choice in choices
+                                 if isinstance(choice, str) and choice.strip()))[:MAX_CHOICES]
+    if len(choices) < 2:
+        raise SceneFormatError("Scene needs at least two choices")
+
+    question = data.get("question")
+    mood = data.get("mood")
+    return {
+        "text": text.strip(),
+        "question": question.strip() if isinstance(question, str) and question.strip() else None,
+        "choices": choices,
+        "mood": mood if mood in MOODS else None,
+    }
+
+
+def is_valid_scene(reply: str) -> bool:
+    try:
+        load_scene(reply)
+        return True
+    except SceneFormatError:
+        return False
+
+
+def build_scene(data: Dict) -> Dict:
+    """Turn a loaded scene into the story format, with new _ai scene ids for its choices"""
+    scene = {
+        "text": data["text"],
+        "question": data["question"] or DEFAULT_QUESTION,
+        "choices": choice_targets(data["choices"]),
+    }
+    if data["mood"]:
+        scene["mood"] = data["mood"]
+    return scene
+
+
+class JsonSceneStreamParser:
+    """Streaming counterpart of SceneStreamParser for structured (JSON) replies.
+
+    ``text`` follows the scene text while the JSON object is still being
+    written; ``question`` and ``choices`` stay None until the reply is
+    complete. ``scene()`` validates the whole reply and raises
+    SceneFormatError if it cannot be repaired.
+
+    Chunks are scanned once, as they arrive, for the text field; it is
+    decoded when ``text`` is read.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything fed so far, for a retried reply"""
+        self.question: Optional[str] = None
+        self.choices: Optional[List[str]] = None
+        self.closed = False
+        self._chunks: List[str] = []
+        self._text: Optional[str] = None
+        # Reply read before the text field was found, and how far it was searched
+        self._head = ""
+        self._searched = 0
+        # The text field's raw characters so far, until its closing quote
+        self._raw: Optional[List[str]] = None
+        self._escaped = False
+        self._ended = False
+
+    @property
+    def text(self) -> str:
+        if self._text is not None:
+            return self._text
+        if not self._raw:
+            return ""
+        raw = "".join(self._raw)
+        # Drop an escape whose next character hasn't arrived
+        return _decode_partial(raw[:-1] if self._escaped else raw)
+
+    def feed(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        if self._ended:
+            return
+        if self._raw is None:
+            self._head += chunk
+            # Back up far enough to catch a field name split across chunks
+            match = _TEXT_FIELD.search(self._head, max(0, self._searched - 32))
+            self._searched = len(self._head)
+            if not match:
+                return
+            chunk = self._head[match.end():]
+            self._head = ""
+            self._raw = []
+        for index, char in enumerate(chunk):
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._raw.append(chunk[:index])
+                self._ended = True
+                return
+        self._raw.append(chunk)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            data = load_scene("".join(self._chunks))
+        except SceneFormatError:
+            return
+        self._text, self.question, self.choices = data["text"], data["question"], data["choices"]
+
+    def scene(self) -> Dict:
+        self.close()
+        return build_scene(load_scene("".join(self._chunks)))
+
+
+def _decode_partial(raw: str) -> str:
+    """Decoded value of a JSON string cut off at any point"""
+    # A \\u escape may still be incomplete
+    raw = re.sub(r"\\u[0-9a-fA-F]{0,3}$", "", raw)
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return raw
@@ -0,0 +1,101 @@
+# scene_stream.py
+
+from typing import Dict, List, Optional, Sequence
+
+from scene_ids import scene_ids
+
+SCENE = "[SCENE]"
+QUESTION = "[QUESTION]"
+CHOICES = "[CHOICES]"
+MARKERS = (SCENE, QUESTION, CHOICES)
+
+DEFAULT_TEXT = "Scene text missing"
+DEFAULT_QUESTION = "What do you do next?"
+
+
+def choice_targets(choices: Sequence[str]) -> Dict[str, str]:
+    """Point each generated choice at a fresh _ai scene, written when it is chosen"""
+    return {choice: scene_ids.allocate() for choice in choices}
+
+
+class SceneStreamParser:
+    """Incremental parser for the ``[SCENE]``/``[QUESTION]``/``[CHOICES]`` reply format.
+
+    Feed it text as the model streams it. ``text`` always holds the scene
+    text received so far, so it can be shown while the rest is written; a
+    trailing fragment that could still turn out to be a section marker is
+    held back. ``question`` and ``choices`` stay None until their section is
+    complete. Feeding a whole reply and calling ``close()`` gives the same
+    result as parsing it in one go.
+
+    Each chunk is only looked at once: the unfinished line is kept as a list
+    of pieces and ``text`` is put together when it is read.
+    """
+
+    def __init__(self):
+        self.section: Optional[str] = None
+        self.question: Optional[str] = None
+        self.choices: Optional[List[str]] = None
+        self.closed = False
+        self._sections: Dict[str, List[str]] = {}
+        self._line: List[str] = []
+
+    @property
+    def text(self) -> str:
+        lines = self._sections.get(SCENE, [])
+        partial = "".join(self._line).strip() if self.section == SCENE else ""
+        if partial and not any(marker.startswith(partial) for marker in MARKERS):
+            lines = lines + [partial]
+        return " ".join(lines)
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next piece of the reply"""
+        if "\n" not in chunk:
+            self._line.append(chunk)
+            return
+        *lines, rest = chunk.split("\n")
+        lines[0] = "".join(self._line) + lines[0]
+        for line in lines:
+            self._end_line(line.strip())
+        self._line = [rest] if rest else []
+
+    def close(self) -> None:
+        """Mark the reply as finished, completing the last section"""
+        if self.closed:
+            return
+        self._end_line("".join(self._line).strip())
+        self._line = []
+        self._complete_section()
+        self.closed = True
+
+    def _end_line(self, line: str) -> None:
+        if line in MARKERS:
+            self._complete_section()
+            self.section = line
+            self._sections[line] = []
+        elif self.section and line:
+            self._sections[self.section].append(line)
+
+    def _complete_section(self) -> None:
+        if self.section == QUESTION:
+            self.question = " ".join(self._sections[QUESTION])
+        elif self.section == CHOICES:
+            self.choices = list(self._sections[CHOICES])
+
+    def scene(self) -> Dict:
+        """Build the scene dict, with new _ai scene ids for the generated choices"""
+        self.close()
+        scene = {
+            "text": " ".join(self._sections[SCENE]) if SCENE in self._sections else DEFAULT_TEXT,
+            "question": self.question if QUESTION in self._sections else DEFAULT_QUESTION
+        }
+        if self.choices:
+            scene["choices"] = choice_targets(self.choices)
+        return scene
+
+
+def parse_scene(reply: str) -> Dict:
+    """Parse a complete reply in one go"""
+    parser = SceneStreamParser()
+    parser.feed(reply)
+    return parser.scene()
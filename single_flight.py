@@ -0,0 +1,103 @@
+# single_flight.py
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+DEFAULT_KEEP_RESULTS = 1024
+
+
+class Flight:
+    """One call shared by every caller that asked for the same key"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.future: Optional[Future] = None
+        # Optional live view of partial output and scheduling priority, shared by all waiters
+        self.progress: Any = None
+        self.priority: Any = None
+        self.waiters = 0
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def usable(self) -> bool:
+        """Still running, or finished with a result worth sharing"""
+        if not self.future.done():
+            return True
+        return not self.future.cancelled() and self.future.exception() is None and bool(self.future.result())
+
+    def claim(self) -> bool:
+        """Return True to exactly one caller, who then publishes the shared result"""
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key starts the call; callers arriving while it
+    runs join the same Flight and share its future. Finished flights are
+    remembered (up to ``keep_results``) so sessions that arrive just after
+    a result was produced reuse it instead of starting over; failed or
+    abandoned flights are replaced by a fresh call.
+    """
+
+    def __init__(self, keep_results: int = DEFAULT_KEEP_RESULTS):
+        self.keep_results = keep_results
+        self._lock = threading.Lock()
+        self._flights: "OrderedDict[Hashable, Flight]" = OrderedDict()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key: Hashable, start: Callable[[Flight], Optional[Future]]) -> Optional[Flight]:
+        """Join the flight for ``key``, calling ``start`` to launch it if there is none.
+
+        ``start`` receives the new Flight and returns its future, or None to
+        refuse (for example when a queue is full), in which case None is
+        returned and nothing is recorded.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.usable():
+                flight.waiters += 1
+                self._flights.move_to_end(key)
+                self.coalesced += 1
+                return flight
+
+            flight = Flight(key)
+            flight.waiters = 1
+            flight.future = start(flight)
+            if flight.future is None:
+                return None
+            self._flights[key] = flight
+            self.started += 1
+            self._trim()
+            return flight
+
+    def leave(self, flight: Flight) -> bool:
+        """Drop one waiter, returning True when nobody is waiting any more"""
+        with self._lock:
+            flight.waiters -= 1
+            return flight.waiters <= 0
+
+    def _trim(self) -> None:
+        # Running flights always stay; finished ones are kept while there is room
+        excess = len(self._flights) - self.keep_results
+        for key in list(self._flights):
+            if excess <= 0:
+                break
+            if self._flights[key].future.done():
+                del self._flights[key]
+                excess -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "flights": len(self._flights),
+                "started": self.started,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,141 @@
+# story_analyzer.py
+
+from collections import Counter
+from typing import Dict, List, Mapping
+
+from story_graph import StoryGraph
+
+# Choices pointing at ids with this suffix are generated on demand, not broken
+AI_SUFFIX = "_ai"
+
+
+def analyze(story: Mapping) -> Dict:
+    """Check a story's scene graph for structural problems and summarize its shape.
+
+    Runs in time linear in scenes plus choices: one pass to compile the
+    graph, breadth-first searches from the start and from every ending,
+    and one iterative depth-first search for cycles.
+
+    Reports:
+        dangling_edges    -- choices whose target scene does not exist
+        pending_ai_edges  -- choices to ``*_ai`` scenes that are generated on demand
+        unreachable       -- scenes that cannot be reached from the start
+        cycles            -- back edges, each closing at least one loop
+        dead_ends         -- scenes with choices from which no ending can be reached
+        missing_question  -- scenes that offer choices without asking a question
+        branching_histogram, depth_histogram -- {value: number of scenes}
+    """
+    graph = StoryGraph(story, metrics=False)
+    ids, present = graph.ids, graph.present
+    offsets, targets, labels = graph.edge_offsets, graph.edge_targets, graph.edge_labels
+    scene_count = graph.scene_count
+
+    dangling_edges = []
+    pending_ai_edges = 0
+    branching = Counter()
+    missing_question = []
+    for idx in range(scene_count):
+        start, end = offsets[idx], offsets[idx + 1]
+        branching[end - start] += 1
+        if end > start and not graph.scenes[idx].get("question"):
+            missing_question.append(ids[idx])
+        for edge in range(start, end):
+            target = targets[edge]
+            if not present[target]:
+                if ids[target].endswith(AI_SUFFIX):
+                    pending_ai_edges += 1
+                else:
+                    dangling_edges.append((ids[idx], labels[edge], ids[target]))
+
+    depth = graph.depth
+    unreachable = [ids[idx] for idx in range(scene_count) if depth[idx] < 0]
+    depth_histogram = Counter(depth[idx] for idx in range(scene_count) if depth[idx] >= 0)
+
+    # Pending AI scenes count as ways out: the story continues once they are generated
+    endings = graph.ending_indices()
+    pending = [idx for idx in range(scene_count, len(ids)) if ids[idx].endswith(AI_SUFFIX)]
+    distance = graph.distance_to(endings + pending)
+    dead_ends = [
+        ids[idx] for idx in range(scene_count)
+        if offsets[idx + 1] > offsets[idx] and distance[idx] < 0
+    ]
+
+    return {
+        "title": story.get("title"),
+        "start": ids[graph.start] if graph.start >= 0 else None,
+        "scenes": scene_count,
+        "choices": len(targets),
+        "endings": len(endings),
+        "dangling_edges": dangling_edges,
+        "pending_ai_edges": pending_ai_edges,
+        "unreachable": unreachable,
+        "cycles": _find_back_edges(graph),
+        "dead_ends": dead_ends,
+        "missing_question": missing_question,
+        "max_depth": max(depth_histogram) if depth_histogram else 0,
+        "branching_histogram": dict(sorted(branching.items())),
+        "depth_histogram": dict(sorted(depth_histogram.items())),
+    }
+
+
+def _find_back_edges(graph: StoryGraph) -> List[tuple]:
+    """Iterative three-colour depth-first search returning (from, to) back edges"""
+    offsets, targets, ids = graph.edge_offsets, graph.edge_targets, graph.ids
+    colour = bytearray(len(ids))  # 0 unvisited, 1 on the current path, 2 finished
+    back_edges = []
+
+    roots = [graph.start] if graph.start >= 0 else []
+    for root in [*roots, *range(len(ids))]:
+        if colour[root]:
+            continue
+        colour[root] = 1
+        stack = [(root, offsets[root])]
+        while stack:
+            idx, edge = stack[-1]
+            if edge < offsets[idx + 1]:
+                stack[-1] = (idx, edge + 1)
+                target = targets[edge]
+                if not colour[target]:
+                    colour[target] = 1
+                    stack.append((target, offsets[target]))
+                elif colour[target] == 1:
+                    back_edges.append((ids[idx], ids[target]))
+            else:
+                colour[idx] = 2
+                stack.pop()
+    return back_edges
+
+
+def has_errors(report: Mapping) -> bool:
+    """Check whether a report contains problems a reader would run into"""
+    return bool(report["dangling_edges"] or report["dead_ends"] or report["unreachable"])
+
+
+def format_report(report: Mapping, limit: int = 10) -> str:
+    """Render a report as readable text, listing at most ``limit`` examples per problem"""
+    lines = [
+        f"Story: {report['title'] or 'untitled'} (start: {report['start']})",
+        f"  {report['scenes']} scenes, {report['choices']} choices, {report['endings']} endings, "
+        f"max depth {report['max_depth']}",
+        f"  {report['pending_ai_edges']} choices lead to scenes generated on demand",
+    ]
+
+    problems = [
+        ("Dangling choices", [f"{scene} --[{choice}]--> {target}"
+                              for scene, choice, target in report["dangling_edges"]]),
+        ("Unreachable scenes", report["unreachable"]),
+        ("Cycles (back edges)", [f"{source} -> {target}" for source, target in report["cycles"]]),
+        ("Dead ends (no ending reachable)", report["dead_ends"]),
+        ("Choices without a question", report["missing_question"]),
+    ]
+    for title, items in problems:
+        lines.append(f"{title}: {len(items)}")
+        lines.extend(f"    {item}" for item in items[:limit])
+        if len(items) > limit:
+            lines.append(f"    ... and {len(items) - limit} more")
+
+    lines.append("Branching factor: " + ", ".join(
+        f"{choices}: {count}" for choices, count in report["branching_histogram"].items()))
+    lines.append("Depth: " + ", ".join(
+        f"{depth}: {count}" for depth, count in report["depth_histogram"].items()))
+    return "\n".join(lines)
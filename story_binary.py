@@ -0,0 +1,387 @@
+# story_binary.py
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import copy
+import threading
+import zlib
+from array import array
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from story_graph import LayeredGraph, StoryGraph
+from story_journal import apply_records, get_journal, journal_path, read_records
+from story_registry import MAX_JOURNAL_TAIL, LayeredScenes, journal_tail
+from story_store import StoryStore
+
+COMPILED_SUFFIX = ".kbs"
+MAGIC = b"KUKUSTRY"
+FORMAT_VERSION = 2
+NONE = -1
+
+# magic, format version, id count, scene count, edge count, string count,
+# start index, hash table size, source mtime, source journal size,
+# title string, genre string, extra metadata string
+HEADER = struct.Struct("<8sIIIIIiIqqiii")
+SECTIONS = ("string_offsets", "strings", "records", "edge_offsets", "edge_labels",
+            "edge_targets", "present", "depth", "ending_distance", "ending_counts", "hash")
+SECTION_TABLE = struct.Struct(f"<{len(SECTIONS)}Q")
+# id string, text string, question string, extra fields string
+RECORD = struct.Struct("<iiii")
+
+_compiled: Dict[str, Tuple[Tuple[int, int, int], "BinaryStoryStore"]] = {}
+_compiled_lock = threading.Lock()
+
+
+def compiled_path(story_file) -> Path:
+    """Binary file produced by compiling a JSON story"""
+    return Path(story_file).with_suffix(COMPILED_SUFFIX)
+
+
+def _source_version(story_file) -> Tuple[int, int]:
+    """Modification time of a story and the size of its journal"""
+    try:
+        journal_size = os.stat(journal_path(story_file)).st_size
+    except FileNotFoundError:
+        journal_size = 0
+    return os.stat(story_file).st_mtime_ns, journal_size
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _string_hash(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+class _StringTable:
+    """Deduplicating string table builder"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.encoded: List[bytes] = []
+
+    def add(self, text: Optional[str]) -> int:
+        if text is None:
+            return NONE
+        idx = self.index.get(text)
+        if idx is None:
+            idx = len(self.encoded)
+            self.index[text] = idx
+            self.encoded.append(text.encode('utf-8'))
+        return idx
+
+
+def compile_story(story_file, output=None) -> Path:
+    """Compile a JSON story, with its journal replayed, into the binary format.
+
+    Layout, all little-endian and 8-byte aligned: header, section table,
+    string offsets (int64) and UTF-8 string data, one fixed-width record per
+    scene id, the flat edge arrays and precomputed metrics of StoryGraph,
+    and an open-addressing hash table mapping scene ids to indices.
+    """
+    story_file = Path(story_file)
+    output = Path(output) if output else compiled_path(story_file)
+    source_mtime, journal_size = _source_version(story_file)
+
+    with open(story_file, 'r', encoding='utf-8') as f:
+        story = json.load(f)
+    records, _ = read_records(journal_path(story_file))
+    apply_records(story.setdefault("scenes", {}), records)
+    graph = StoryGraph(story)
+
+    strings = _StringTable()
+    scene_records = bytearray()
+    for idx, scene_id in enumerate(graph.ids):
+        scene = graph.scenes[idx] if graph.present[idx] else {}
+        extra = {key: value for key, value in scene.items() if key not in ("text", "question", "choices")}
+        scene_records += RECORD.pack(
+            strings.add(scene_id),
+            strings.add(scene.get("text")),
+            strings.add(scene.get("question")),
+            strings.add(json.dumps(extra) if extra else None)
+        )
+    edge_labels = array('i', (strings.add(label) for label in graph.edge_labels))
+
+    metadata = {key: value for key, value in story.items() if key not in ("title", "genre", "start", "scenes")}
+    title = strings.add(story.get("title"))
+    genre = strings.add(story.get("genre"))
+    extra_metadata = strings.add(json.dumps(metadata) if metadata else None)
+
+    hash_size = 1
+    while hash_size < 2 * max(len(graph.ids), 1):
+        hash_size *= 2
+    table = array('I', [0]) * hash_size
+    for idx, scene_id in enumerate(graph.ids):
+        slot = _string_hash(scene_id) & (hash_size - 1)
+        while table[slot]:
+            slot = (slot + 1) & (hash_size - 1)
+        table[slot] = idx + 1
+
+    string_offsets = array('q', [0])
+    for encoded in strings.encoded:
+        string_offsets.append(string_offsets[-1] + len(encoded))
+
+    sections = {
+        "string_offsets": _little_endian(string_offsets),
+        "strings": b"".join(strings.encoded),
+        "records": bytes(scene_records),
+        "edge_offsets": _little_endian(array('i', graph.edge_offsets)),
+        "edge_labels": _little_endian(edge_labels),
+        "edge_targets": _little_endian(array('i', graph.edge_targets)),
+        "present": bytes(graph.present),
+        "depth": _little_endian(array('i', graph.depth)),
+        "ending_distance": _little_endian(array('i', graph.ending_distance)),
+        "ending_counts": _little_endian(array('q', graph.ending_counts)),
+        "hash": _little_endian(table),
+    }
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(graph.ids), graph.scene_count,
+                         len(graph.edge_targets), len(strings.encoded), graph.start, hash_size,
+                         source_mtime, journal_size, title, genre, extra_metadata)
+    position = HEADER.size + SECTION_TABLE.size
+    offsets = []
+    for name in SECTIONS:
+        position += -position % 8
+        offsets.append(position)
+        position += len(sections[name])
+
+    tmp_path = output.with_name(f"{output.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(SECTION_TABLE.pack(*offsets))
+        for name, offset in zip(SECTIONS, offsets):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, output)
+    logging.info(f"Compiled {story_file} ({graph.scene_count} scenes) to {output}")
+    return output
+
+
+class BinaryStoryGraph(StoryGraph):
+    """StoryGraph whose arrays are views into a memory-mapped compiled story.
+
+    Nothing is decoded up front: ids, labels and scenes are read from the
+    mapping when asked for, so opening a story costs the same at any size
+    and worker processes share the pages through the OS cache. The ``ids``
+    list and ``index`` dict of StoryGraph are replaced by ``scene_id_at``
+    and a hash-table ``lookup``.
+    """
+
+    def __init__(self, buffer: memoryview, header: Tuple, offsets: Dict[str, int]):
+        (_, _, self._id_count, self.scene_count, edge_count, string_count,
+         self.start, self._hash_size, _, _, _, _, _) = header
+
+        def view(name: str, typecode: str, count: int) -> memoryview:
+            size = array(typecode).itemsize * count
+            return buffer[offsets[name]:offsets[name] + size].cast(typecode)
+
+        self._buffer = buffer
+        self._string_offsets = view("string_offsets", 'q', string_count + 1)
+        self._strings_start = offsets["strings"]
+        self._records_start = offsets["records"]
+        self.edge_offsets = view("edge_offsets", 'i', self._id_count + 1)
+        self._edge_labels = view("edge_labels", 'i', edge_count)
+        self.edge_targets = view("edge_targets", 'i', edge_count)
+        self.present = view("present", 'B', self._id_count)
+        self.depth = view("depth", 'i', self._id_count)
+        self.ending_distance = view("ending_distance", 'i', self._id_count)
+        self.ending_counts = view("ending_counts", 'q', self._id_count)
+        self._hash = view("hash", 'I', self._hash_size)
+
+    def string(self, idx: int) -> Optional[str]:
+        """Decode one entry of the string table"""
+        if idx == NONE:
+            return None
+        start = self._strings_start + self._string_offsets[idx]
+        end = self._strings_start + self._string_offsets[idx + 1]
+        return str(self._buffer[start:end], 'utf-8')
+
+    def _record(self, idx: int) -> Tuple[int, int, int, int]:
+        return RECORD.unpack_from(self._buffer, self._records_start + idx * RECORD.size)
+
+    def __len__(self) -> int:
+        return self._id_count
+
+    def lookup(self, scene_id: str) -> int:
+        mask = self._hash_size - 1
+        slot = _string_hash(scene_id) & mask
+        while True:
+            entry = self._hash[slot]
+            if not entry:
+                return -1
+            if self.scene_id_at(entry - 1) == scene_id:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def scene_id_at(self, idx: int) -> str:
+        return self.string(self._record(idx)[0])
+
+    def edge_label(self, edge: int) -> str:
+        return self.string(self._edge_labels[edge])
+
+    def get_scene(self, scene_id: str) -> Optional[Mapping]:
+        idx = self.lookup(scene_id)
+        if idx < 0 or not self.present[idx]:
+            return None
+        return self.scene_at(idx)
+
+    def scene_at(self, idx: int) -> Mapping:
+        """Decode the scene stored at an index into a read-only mapping"""
+        _, text, question, extra = self._record(idx)
+        scene = json.loads(self.string(extra)) if extra != NONE else {}
+        if text != NONE:
+            scene["text"] = self.string(text)
+        if question != NONE:
+            scene["question"] = self.string(question)
+        start, end = self.edge_offsets[idx], self.edge_offsets[idx + 1]
+        if end > start:
+            scene["choices"] = MappingProxyType({
+                self.edge_label(edge): self.scene_id_at(self.edge_targets[edge])
+                for edge in range(start, end)
+            })
+        return MappingProxyType(scene)
+
+
+class BinaryScenes(Mapping):
+    """Scene mapping decoded on demand from a compiled story"""
+
+    def __init__(self, graph: BinaryStoryGraph):
+        self._graph = graph
+
+    def __getitem__(self, scene_id: str) -> Mapping:
+        scene = self._graph.get_scene(scene_id)
+        if scene is None:
+            raise KeyError(scene_id)
+        return scene
+
+    def __contains__(self, scene_id) -> bool:
+        idx = self._graph.lookup(scene_id)
+        return idx >= 0 and bool(self._graph.present[idx])
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(self._graph.scene_count):
+            yield self._graph.scene_id_at(idx)
+
+    def __len__(self) -> int:
+        return self._graph.scene_count
+
+
+class BinaryStoryStore(StoryStore):
+    """Read-only, memory-mapped compiled story; new scenes go to the story journal.
+
+    Scenes journaled after compilation are layered over the mapped story
+    (see ``extended``), so the compiled file stays usable as the story grows.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        header = HEADER.unpack_from(buffer, 0)
+        if header[0] != MAGIC or header[1] != FORMAT_VERSION:
+            raise ValueError(f"Not a compiled story (format {FORMAT_VERSION}): {path}")
+        if sys.byteorder != "little":
+            raise ValueError("Compiled stories can only be memory-mapped on little-endian hosts")
+        self.source_mtime, self.journal_size = header[8], header[9]
+        offsets = dict(zip(SECTIONS, SECTION_TABLE.unpack_from(buffer, HEADER.size)))
+
+        self.graph = BinaryStoryGraph(buffer, header, offsets)
+        title, genre, extra = header[10:13]
+        metadata = json.loads(self.graph.string(extra)) if extra != NONE else {}
+        if title != NONE:
+            metadata["title"] = self.graph.string(title)
+        if genre != NONE:
+            metadata["genre"] = self.graph.string(genre)
+        if self.graph.start >= 0:
+            metadata["start"] = self.graph.scene_id_at(self.graph.start)
+        self.story = MappingProxyType({**metadata, "scenes": BinaryScenes(self.graph)})
+        self.base_story, self.base_graph = self.story, self.graph
+        # Journal records past the compiled ones, and where the next one starts
+        self.tail: List[Dict] = []
+        self.offset = self.journal_size
+
+    def extended(self, records: List[Dict], offset: int) -> "BinaryStoryStore":
+        """A store sharing this one's mapping, with more journal records layered on top"""
+        store = copy.copy(self)
+        store.tail = self.tail + records
+        store.offset = offset
+        tail_scenes = journal_tail(self.base_story["scenes"], store.tail)
+        if tail_scenes:
+            store.story = MappingProxyType({**self.base_story,
+                                            "scenes": LayeredScenes(self.base_story["scenes"], tail_scenes)})
+            store.graph = LayeredGraph(self.base_graph, tail_scenes)
+        return store
+
+    def save_delta(self, delta: Mapping) -> None:
+        get_journal(self.path).append_delta(delta)
+
+
+def open_compiled(story_file) -> Optional[BinaryStoryStore]:
+    """Return the shared compiled store for a story if it is up to date.
+
+    A JSON story is served from its compiled file while the JSON snapshot
+    is the one it was compiled from. Journal records written since are read
+    incrementally and layered over the mapped story. None is returned, and
+    the caller falls back to JSON, when the snapshot changed, the journal
+    was truncated, or more than MAX_JOURNAL_TAIL records have piled up
+    (recompile to fold them in).
+    """
+    path = Path(story_file)
+    binary = path if path.suffix == COMPILED_SUFFIX else compiled_path(path)
+    try:
+        binary_mtime = os.stat(binary).st_mtime_ns
+        source_mtime = os.stat(path).st_mtime_ns if path.suffix != COMPILED_SUFFIX else None
+    except FileNotFoundError:
+        return None
+    journal_file = journal_path(binary)
+    try:
+        journal_size = os.stat(journal_file).st_size
+    except FileNotFoundError:
+        journal_size = 0
+
+    key = os.path.abspath(binary)
+    version = (binary_mtime, source_mtime, journal_size)
+    entry = _compiled.get(key)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    with _compiled_lock:
+        entry = _compiled.get(key)
+        if entry and entry[0] == version:
+            return entry[1]
+        if entry and entry[0][:2] == version[:2]:
+            # Same files, longer journal: read on from where the cached store stopped
+            store = entry[1]
+        else:
+            try:
+                store = BinaryStoryStore(binary)
+            except (ValueError, struct.error) as e:
+                logging.warning(f"Ignoring compiled story {binary}: {e}")
+                return None
+            if source_mtime is not None and store.source_mtime != source_mtime:
+                logging.info(f"Compiled story {binary} is stale, using JSON")
+                return None
+
+        if journal_size < store.offset:
+            logging.info(f"Journal of {binary} was truncated since it was compiled, using JSON")
+            return None
+        if journal_size > store.offset:
+            records, offset = read_records(journal_file, store.offset)
+            if len(store.tail) + len(records) > MAX_JOURNAL_TAIL:
+                logging.info(f"{binary} is {len(store.tail) + len(records)} journal records behind, using JSON")
+                return None
+            store = store.extended(records, offset)
+        _compiled[key] = (version, store)
+        return store
@@ -0,0 +1,164 @@
+# story_cli.py
+
+import argparse
+import glob
+import json
+import logging
+import sys
+import time
+
+from story_analyzer import analyze, format_report, has_errors
+from story_binary import compile_story
+from story_expander import DEFAULT_CHECKPOINT_EVERY, DEFAULT_WORKERS, expand_file
+from story_generator import write_story
+from story_journal import apply_records, compact, journal_path, read_records
+from story_store import import_json
+
+
+def cmd_compact(args) -> int:
+    """Fold each story's scene journal back into its JSON snapshot"""
+    for story_file in args.stories:
+        folded = compact(story_file)
+        print(f"{story_file}: folded {folded} journal records")
+    return 0
+
+
+def cmd_import_sqlite(args) -> int:
+    """Copy a JSON story into an SQLite scene store for lazy loading"""
+    count = import_json(args.story, args.database)
+    print(f"{args.story}: imported {count} scenes into {args.database}")
+    return 0
+
+
+def cmd_compile(args) -> int:
+    """Compile JSON stories into the memory-mappable binary format"""
+    for story_file in args.stories or sorted(glob.glob("stories/*.json")):
+        output = compile_story(story_file)
+        print(f"{story_file}: compiled to {output}")
+    return 0
+
+
+def load_story(story_file) -> dict:
+    """Load a JSON story with its journal replayed, without freezing it"""
+    with open(story_file, 'r', encoding='utf-8') as f:
+        story = json.load(f)
+    records, _ = read_records(journal_path(story_file))
+    apply_records(story.setdefault("scenes", {}), records)
+    return story
+
+
+def cmd_analyze(args) -> int:
+    """Report dangling choices, unreachable scenes, cycles, dead ends and shape histograms"""
+    failed = False
+    for story_file in args.stories:
+        report = analyze(load_story(story_file))
+        if args.json:
+            print(json.dumps({"file": story_file, **report}))
+        else:
+            print(f"== {story_file}")
+            print(format_report(report, limit=args.limit))
+        failed = failed or has_errors(report)
+    return 1 if failed and args.strict else 0
+
+
+def cmd_generate(args) -> int:
+    """Write a deterministic synthetic story for load and scaling tests"""
+    write_story(args.output, args.scenes, args.branching, args.text_words,
+                args.mood_density, args.seed, indent=args.indent)
+    print(f"{args.output}: generated {args.scenes} scenes")
+    return 0
+
+
+def cmd_expand(args) -> int:
+    """Write a story's missing AI branches ahead of time, breadth-first to a given depth"""
+    from generation_cache import get_generation_cache
+    from openai_manager import OpenAIManager
+
+    manager = OpenAIManager(cache=get_generation_cache(), base_url=args.base_url,
+                            structured=args.structured or None)
+    if not manager.client:
+        print("No OpenAI API key: set OPENAI_API_KEY", file=sys.stderr)
+        return 1
+
+    last_report = [0.0]
+
+    def progress(stats):
+        if time.monotonic() - last_report[0] < 1 and stats["generated"] % 50:
+            return
+        last_report[0] = time.monotonic()
+        seconds = max(stats["seconds"], 1e-9)
+        print(f"depth {stats['depth']}: {stats['generated']} scenes, {stats['failed']} failed, "
+              f"{stats['tokens']} tokens ({stats['generated'] / seconds:.2f} scenes/s, "
+              f"{stats['tokens'] / seconds:.0f} tokens/s)", flush=True)
+
+    stats = expand_file(load_story(args.story), args.output, manager, resume=args.resume,
+                        max_depth=args.depth, workers=args.workers, max_scenes=args.max_scenes,
+                        max_tokens=args.max_tokens, checkpoint_every=args.checkpoint_every, progress=progress)
+    print(f"{args.output}: {stats['generated']} scenes written to depth {stats['depth']} "
+          f"({stats['tokens']} tokens, {stats['failed']} failed, {stats['deduplicated']} shared branches, "
+          f"{stats['seconds']:.1f}s)")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline maintenance tools for Kuku stories")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = subparsers.add_parser("compact", help=cmd_compact.__doc__)
+    compact_parser.add_argument("stories", nargs="+", help="Story JSON files")
+    compact_parser.set_defaults(func=cmd_compact)
+
+    compile_parser = subparsers.add_parser("compile", help=cmd_compile.__doc__)
+    compile_parser.add_argument("stories", nargs="*", help="Story JSON files (default: stories/*.json)")
+    compile_parser.set_defaults(func=cmd_compile)
+
+    analyze_parser = subparsers.add_parser("analyze", help=cmd_analyze.__doc__)
+    analyze_parser.add_argument("stories", nargs="+", help="Story JSON files")
+    analyze_parser.add_argument("--json", action="store_true", help="Print one JSON report per story")
+    analyze_parser.add_argument("--limit", type=int, default=10, help="Examples listed per problem")
+    analyze_parser.add_argument("--strict", action="store_true",
+                                help="Exit with status 1 if any story has reader-facing problems")
+    analyze_parser.set_defaults(func=cmd_analyze)
+
+    generate_parser = subparsers.add_parser("generate", help=cmd_generate.__doc__)
+    generate_parser.add_argument("output", help="Story JSON file to write")
+    generate_parser.add_argument("--scenes", type=int, default=1000)
+    generate_parser.add_argument("--branching", type=int, default=3, help="Choices per scene")
+    generate_parser.add_argument("--text-words", type=int, default=60, help="Words of text per scene")
+    generate_parser.add_argument("--mood-density", type=float, default=0.05,
+                                 help="Probability that a word is a mood keyword")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--indent", action="store_true", help="Pretty-print like thriller.json")
+    generate_parser.set_defaults(func=cmd_generate)
+
+    expand_parser = subparsers.add_parser("expand", help=cmd_expand.__doc__)
+    expand_parser.add_argument("story", help="Story JSON file to expand")
+    expand_parser.add_argument("output", help="Expanded story JSON file to write")
+    expand_parser.add_argument("--depth", type=int, default=2, help="Choices from the start to expand")
+    expand_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent model calls")
+    expand_parser.add_argument("--max-scenes", type=int, help="Stop after this many new scenes in total")
+    expand_parser.add_argument("--max-tokens", type=int, help="Stop after spending this many tokens in total")
+    expand_parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                               help="Scenes between appends to the output's journal")
+    expand_parser.add_argument("--resume", action="store_true", help="Continue from an existing output file")
+    expand_parser.add_argument("--structured", action="store_true", help="Generate structured (JSON) scenes")
+    expand_parser.add_argument("--base-url", help="OpenAI-compatible endpoint (default: OPENAI_BASE_URL)")
+    expand_parser.set_defaults(func=cmd_expand)
+
+    sqlite_parser = subparsers.add_parser("import-sqlite", help=cmd_import_sqlite.__doc__)
+    sqlite_parser.add_argument("story", help="Story JSON file")
+    sqlite_parser.add_argument("database", help="SQLite file to create or update (.db)")
+    sqlite_parser.set_defaults(func=cmd_import_sqlite)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# story_context.py
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Mapping, Sequence, Tuple
+
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("KUKU_CONTEXT_TOKENS", "600"))
+# Share of the budget kept for the summary of scenes too old to quote in full
+SUMMARY_SHARE = 0.25
+DEFAULT_CACHE_SIZE = 4096
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count without a tokenizer.
+
+    Each word or punctuation mark is a token, long words split roughly
+    every six characters; within about 10% of the OpenAI tokenizers on
+    English prose.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in _PIECES.findall(text))
+
+
+def clip_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """Cut text down to about ``max_tokens``, keeping the start (or the end)"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    if from_end:
+        words.reverse()
+    kept, used = [], 0
+    for word in words:
+        used += estimate_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    if from_end:
+        kept.reverse()
+        return "… " + " ".join(kept)
+    return " ".join(kept) + " …"
+
+
+def lead_sentence(text: str) -> str:
+    return _SENTENCE.split(text.strip(), 1)[0]
+
+
+class ContextBuilder:
+    """Builds generation context from the path the reader actually took.
+
+    The path is walked backwards from the current scene: recent scenes are
+    quoted in full while they fit in ``max_tokens``, and everything older
+    is folded into a rolling summary (the lead sentence of each scene and
+    the choice made there). Summaries of a path prefix are cached and
+    extended one scene at a time, so each click costs one new summary step
+    no matter how long the story has run, and the prompt never outgrows
+    the budget. Summaries are keyed by scene ids, so use one builder per
+    story.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_CONTEXT_TOKENS, cache_size: int = DEFAULT_CACHE_SIZE,
+                 counter: Callable[[str], int] = estimate_tokens):
+        self.max_tokens = max_tokens
+        self.summary_tokens = int(max_tokens * SUMMARY_SHARE)
+        self.cache_size = cache_size
+        self.counter = counter
+        self._lock = threading.Lock()
+        self._summaries: "OrderedDict[Tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def build(self, story, path: Sequence[Tuple[str, str]], current_scene_id: str) -> Dict:
+        """Context for continuing from ``current_scene_id`` after following ``path``.
+
+        ``story`` needs ``get(key)`` and ``get_scene(scene_id)`` (a
+        StoryOverlay); ``path`` is the list of ``(scene_id, choice)`` pairs
+        the reader chose, oldest first, as kept by MemoryManager.
+        """
+        budget = self.max_tokens - self.summary_tokens
+        current = story.get_scene(current_scene_id) or {}
+        text = clip_tokens(current.get("text", ""), budget)
+        recent = [{"id": current_scene_id, "text": text, "choices": dict(current.get("choices", {}))}]
+        budget -= self.counter(text)
+
+        # Walk back while whole scenes still fit
+        cut = len(path)
+        while cut > 0:
+            scene_id, choice = path[cut - 1]
+            scene = story.get_scene(scene_id) or {}
+            cost = self.counter(scene.get("text", "")) + self.counter(choice)
+            if cost > budget:
+                break
+            budget -= cost
+            recent.append({"id": scene_id, "text": scene.get("text", ""), "choice": choice})
+            cut -= 1
+        recent.reverse()
+
+        return {
+            "title": story.get("title", "Thriller Story"),
+            "genre": story.get("genre", "Thriller"),
+            "summary": self.summary(story, path[:cut]),
+            "previous_scenes": recent,
+        }
+
+    def summary(self, story, path: Sequence[Tuple[str, str]]) -> str:
+        """Rolling summary of a path prefix, built from the cached summary one step shorter"""
+        if not path:
+            return ""
+        keys = [tuple(path[0])]
+        for step in path[1:]:
+            keys.append((hash(keys[-1]), *step))
+
+        # Find the longest prefix already summarised, then extend it
+        with self._lock:
+            done = len(keys)
+            while done and keys[done - 1] not in self._summaries:
+                done -= 1
+            summary = self._summaries[keys[done - 1]] if done else ""
+            if done:
+                self._summaries.move_to_end(keys[done - 1])
+            if done == len(keys):
+                self.hits += 1
+                return summary
+            self.misses += 1
+
+        for i in range(done, len(keys)):
+            scene_id, choice = path[i]
+            scene = story.get_scene(scene_id) or {}
+            step = f"{lead_sentence(scene.get('text', ''))} The reader chose: {choice}."
+            summary = clip_tokens(f"{summary} {step}".strip(), self.summary_tokens, from_end=True)
+            with self._lock:
+                self._summaries[keys[i]] = summary
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+        return summary
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {"summaries": len(self._summaries), "hits": self.hits, "misses": self.misses}
+
+
+def context_lines(story_context: Mapping) -> List[str]:
+    """Prompt lines describing the story so far"""
+    lines = []
+    if story_context.get("summary"):
+        lines.append(f"Earlier in the story: {story_context['summary']}")
+    previous_scenes = story_context.get("previous_scenes", [])
+    if previous_scenes:
+        lines.append("Previous scenes:")
+        for scene in previous_scenes:
+            line = f"- {scene.get('text', '')}"
+            if scene.get("choice"):
+                line += f" (The reader chose: {scene['choice']})"
+            lines.append(line)
+    return lines
+
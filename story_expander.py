@@ -0,0 +1,213 @@
+# story_expander.py
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from llm_scheduler import BATCH
+from scene_ids import scene_ids
+from story_journal import SceneJournal, apply_records, compact, journal_path, read_records
+from story_overlay import StoryOverlay
+
+DEFAULT_WORKERS = 8
+DEFAULT_CHECKPOINT_EVERY = 25
+
+Path = Tuple[Tuple[str, str], ...]
+
+
+def progress_path(output) -> str:
+    """Sidecar holding the counters of an interrupted expansion"""
+    return f"{output}.progress.json"
+
+
+def write_json(path, data: Mapping, indent: Optional[int] = 2) -> None:
+    """Write JSON atomically, so an interrupted run never leaves half a file"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp, path)
+
+
+class StoryExpander:
+    """Writes a story's missing branches ahead of time, breadth-first.
+
+    Every choice within ``max_depth`` steps of the start whose target is
+    not written yet (an ``_ai`` placeholder or a dangling id) is generated
+    under that id by a pool of ``workers`` threads through OpenAIManager,
+    at batch priority so it yields to live readers sharing the scheduler.
+    Choices pointing at the same missing target are written once. The choices of
+    generated scenes get fresh ``_ai`` targets, so the next level (or the
+    app, past the last level) can fill them in.
+
+    Generation stops at ``max_scenes`` new scenes or ``max_tokens`` tokens;
+    calls already running when a cap is reached still finish, so the token
+    cap can be overshot by up to ``workers`` scenes. ``checkpoint(delta,
+    stats)`` is called every ``checkpoint_every`` scenes and at the end with
+    the overlay delta written since the previous call.
+    """
+
+    def __init__(self, story: Mapping, manager, max_depth: int = 2, workers: int = DEFAULT_WORKERS,
+                 max_scenes: Optional[int] = None, max_tokens: Optional[int] = None,
+                 checkpoint: Optional[Callable[[Dict, Dict], None]] = None,
+                 checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                 progress: Optional[Callable[[Dict], None]] = None, stats: Optional[Dict] = None):
+        self.overlay = StoryOverlay(story)
+        self.manager = manager
+        self.max_depth = max_depth
+        self.workers = workers
+        self.max_scenes = max_scenes
+        self.max_tokens = max_tokens
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+        # Counters carry over from an earlier, interrupted run
+        self.stats = {"generated": 0, "failed": 0, "tokens": 0, "deduplicated": 0, "depth": 0, "seconds": 0.0,
+                      **(stats or {})}
+        self._started = time.perf_counter()
+        self._elapsed_before = self.stats["seconds"]
+        self._since_checkpoint = 0
+
+    def story(self) -> Dict:
+        """The expanded story as a plain dict"""
+        story = {key: value for key, value in self.overlay.base.items() if key != "scenes"}
+        story["scenes"] = {scene_id: dict(scene) for scene_id, scene in self.overlay["scenes"].items()}
+        return story
+
+    def budget_left(self) -> bool:
+        if self.max_scenes is not None and self.stats["generated"] >= self.max_scenes:
+            return False
+        return self.max_tokens is None or self.stats["tokens"] < self.max_tokens
+
+    def expand(self) -> Dict:
+        """Run the expansion and return its counters"""
+        start = self.overlay.get("start")
+        scenes = self.overlay["scenes"]
+        if start not in scenes:
+            raise ValueError(f"Start scene {start!r} not found")
+
+        level: List[Tuple[str, Path]] = [(start, ())]
+        seen = {start}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for depth in range(1, self.max_depth + 1):
+                if not level or not self.budget_left():
+                    break
+                self.stats["depth"] = depth
+                missing: Dict[str, List[Tuple[str, str, Path]]] = {}
+                next_level = []
+                for scene_id, path in level:
+                    for choice, target in (self.overlay.get_scene(scene_id).get("choices") or {}).items():
+                        if target in scenes:
+                            if target not in seen:
+                                seen.add(target)
+                                next_level.append((target, path + ((scene_id, choice),)))
+                        else:
+                            missing.setdefault(target, []).append((scene_id, choice, path))
+                self.stats["deduplicated"] += sum(len(branches) - 1 for branches in missing.values())
+                written = self._write_level(executor, list(missing.values()))
+                seen.update(scene_id for scene_id, _ in written)
+                level = next_level + written
+
+        self._checkpoint()
+        return self.stats
+
+    def _write_level(self, executor, branches: List[List[Tuple[str, str, Path]]]) -> List[Tuple[str, Path]]:
+        """Generate one scene per missing target, keeping the pool busy without queueing the whole level"""
+        written = []
+        running = {}
+        pending = iter(branches)
+        while True:
+            while len(running) < self.workers * 2 and self.budget_left():
+                group = next(pending, None)
+                if group is None:
+                    break
+                scene_id, choice, path = group[0]
+                # Contexts are read here; workers only talk to the model
+                context = self.manager.build_extension_context(self.overlay, scene_id, path)
+                future = executor.submit(self.manager.generate_scene_with_usage, context, scene_id, choice, BATCH)
+                running[future] = group
+            if not running:
+                return written
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = running.pop(future)
+                new_scene, tokens = future.result()
+                self.stats["tokens"] += tokens
+                if new_scene is None:
+                    self.stats["failed"] += 1
+                    continue
+                written.append(self._add(group, new_scene))
+            self._report()
+
+    def _add(self, group: List[Tuple[str, str, Path]], new_scene: Dict) -> Tuple[str, Path]:
+        scene_id, choice, path = group[0]
+        scenes = self.overlay["scenes"]
+        # The scene takes the missing target's id, so every choice pointing there now resolves
+        target = self.overlay.next_scene_id(scene_id, choice)
+        new_scene_id = self.manager.add_generated_scene(self.overlay, scene_id, choice, new_scene, target)
+        # Every target becomes a fresh _ai scene to write at the next level, whatever id it came with
+        for next_choice in list(new_scene.get("choices") or {}):
+            self.overlay.set_choice(new_scene_id, next_choice, scene_ids.allocate(scenes))
+
+        self.stats["generated"] += 1
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._checkpoint()
+        return new_scene_id, path + ((scene_id, choice),)
+
+    def _report(self) -> None:
+        self.stats["seconds"] = self._elapsed_before + time.perf_counter() - self._started
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def _checkpoint(self) -> None:
+        self._since_checkpoint = 0
+        self.stats["seconds"] = self._elapsed_before + time.perf_counter() - self._started
+        if self.checkpoint:
+            try:
+                self.checkpoint(self.overlay.pending_delta(), dict(self.stats))
+            except OSError as e:
+                logging.error(f"Error writing expansion checkpoint: {e}")
+                return
+        self.overlay.mark_saved()
+
+
+def expand_file(story: Mapping, output, manager, resume: bool = False, **options) -> Dict:
+    """Expand a story into ``output``, checkpointing there and resuming from it if asked.
+
+    The story is written to ``output`` once; checkpoints append the new
+    scenes to its journal, which is compacted into it when the run ends.
+    """
+    stats = None
+    if resume and os.path.exists(output):
+        with open(output, 'r', encoding='utf-8') as f:
+            story = json.load(f)
+        records, _ = read_records(journal_path(output))
+        apply_records(story.setdefault("scenes", {}), records)
+        if os.path.exists(progress_path(output)):
+            with open(progress_path(output), 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        logging.info(f"Resuming expansion from {output}")
+    else:
+        write_json(output, story)
+        # A journal left by an earlier run belongs to another snapshot
+        if os.path.exists(journal_path(output)):
+            os.remove(journal_path(output))
+
+    journal = SceneJournal(journal_path(output))
+
+    def checkpoint(delta: Mapping, counters: Dict) -> None:
+        journal.append_delta(delta)
+        journal.sync()
+        write_json(progress_path(output), counters)
+
+    try:
+        expander = StoryExpander(story, manager, checkpoint=checkpoint, stats=stats, **options)
+        stats = expander.expand()
+    finally:
+        journal.close()
+    compact(output)
+    return stats
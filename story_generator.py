@@ -0,0 +1,83 @@
+# story_generator.py
+
+import json
+import random
+from typing import Dict, Iterator, Tuple
+
+from utils import MOOD_KEYWORDS
+
+FILLER_WORDS = [
+    "the", "rain", "corridor", "door", "shadow", "light", "motel", "road", "night", "voice",
+    "window", "footsteps", "key", "room", "storm", "car", "forest", "clock", "mirror", "stairs",
+    "you", "hear", "see", "feel", "notice", "behind", "beyond", "slowly", "faint", "cold",
+    "old", "empty", "distant", "flickering", "heavy", "wet", "silent", "narrow", "dark", "a"
+]
+CHOICE_VERBS = [
+    "Investigate", "Search", "Examine", "Follow", "Observe", "Question", "Check",
+    "Chase", "Confront", "Run toward", "Escape through", "Fight off",
+    "Wait by", "Think about", "Plan around", "Hide near"
+]
+CHOICE_OBJECTS = [
+    "the basement", "the stranger", "the locked door", "the guest book", "the forest trail",
+    "the flickering sign", "room 13", "the old well", "the radio", "the mirror", "the stairs"
+]
+QUESTIONS = ["What do you do?", "How do you respond?", "What's your next move?", "Where do you go?"]
+MOOD_WORDS = [word for words in MOOD_KEYWORDS.values() for word in words]
+
+
+def iter_scenes(scene_count: int, branching: int = 3, text_words: int = 60,
+                mood_density: float = 0.05, seed: int = 0) -> Iterator[Tuple[str, Dict]]:
+    """Yield ``(scene_id, scene)`` pairs of a deterministic synthetic story.
+
+    Scenes form a complete ``branching``-ary tree in breadth-first order:
+    scene ``i`` leads to scenes ``i * branching + 1 ..`` while they exist,
+    so the last layer holds the endings. Each word of the text is a mood
+    keyword with probability ``mood_density``. The same arguments always
+    produce the same story, scene by scene, without holding it in memory.
+    """
+    rng = random.Random(seed)
+    for i in range(scene_count):
+        words = [
+            rng.choice(MOOD_WORDS) if rng.random() < mood_density else rng.choice(FILLER_WORDS)
+            for _ in range(text_words)
+        ]
+        scene = {"text": " ".join(words).capitalize() + "."}
+
+        children = range(i * branching + 1, min(i * branching + branching, scene_count - 1) + 1)
+        if children:
+            scene["question"] = rng.choice(QUESTIONS)
+            choices = {}
+            for n, child in enumerate(children, 1):
+                label = f"{rng.choice(CHOICE_VERBS)} {rng.choice(CHOICE_OBJECTS)}"
+                # Labels must be unique within a scene
+                if label in choices:
+                    label = f"{label} ({n})"
+                choices[label] = f"scene_{child}"
+            scene["choices"] = choices
+        yield f"scene_{i}", scene
+
+
+def generate_story(scene_count: int, branching: int = 3, text_words: int = 60,
+                   mood_density: float = 0.05, seed: int = 0) -> Dict:
+    """Build a synthetic story in the thriller.json schema"""
+    return {
+        "title": f"Synthetic Story ({scene_count} scenes)",
+        "genre": "Thriller",
+        "start": "scene_0",
+        "scenes": dict(iter_scenes(scene_count, branching, text_words, mood_density, seed))
+    }
+
+
+def write_story(path, scene_count: int, branching: int = 3, text_words: int = 60,
+                mood_density: float = 0.05, seed: int = 0, indent: bool = False) -> None:
+    """Stream a synthetic story to a JSON file without building it in memory"""
+    separator = ",\n" if indent else ","
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"title": %s, "genre": "Thriller", "start": "scene_0", "scenes": {' %
+                json.dumps(f"Synthetic Story ({scene_count} scenes)"))
+        for i, (scene_id, scene) in enumerate(iter_scenes(scene_count, branching, text_words,
+                                                          mood_density, seed)):
+            if i:
+                f.write(separator)
+            f.write(f"{json.dumps(scene_id)}: {json.dumps(scene, indent=2 if indent else None)}")
+        f.write("}}\n")
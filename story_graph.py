@@ -0,0 +1,314 @@
+# story_graph.py
+
+import sys
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+class StoryGraph:
+    """Compact, precomputed form of a story's scene graph.
+
+    Scene ids are interned and mapped to integer indices. The choices of
+    scene ``i`` are the edges ``edge_offsets[i]:edge_offsets[i + 1]``, with
+    their labels in ``edge_labels`` and target indices in ``edge_targets``.
+    Targets that are referenced but have no scene (dangling or not yet
+    generated ids) still get an index, with ``present[i] == 0``.
+
+    Per-scene metrics, indexed like ``ids`` (-1 means "not applicable"):
+        depth            -- choices needed to reach the scene from the start
+        ending_counts    -- number of distinct endings reachable from the scene
+        ending_distance  -- fewest choices from the scene to any ending
+
+    Pass ``metrics=False`` to compute only the structure and depth, e.g.
+    when a caller needs its own reachability passes.
+    """
+
+    def __init__(self, story: Mapping, metrics: bool = True):
+        scenes = story.get("scenes", {}) or {}
+
+        ids = [sys.intern(scene_id) for scene_id in scenes]
+        index = {scene_id: idx for idx, scene_id in enumerate(ids)}
+        self.ids: List[str] = ids
+        self.index: Dict[str, int] = index
+        self.scene_count = len(ids)
+
+        offsets = [0]
+        targets = []
+        labels = []
+        for scene in scenes.values():
+            choices = scene.get("choices")
+            if choices:
+                for label, target in choices.items():
+                    idx = index.get(target)
+                    if idx is None:
+                        # Referenced-only id, interned after the real scenes
+                        idx = len(ids)
+                        target = sys.intern(target)
+                        ids.append(target)
+                        index[target] = idx
+                    labels.append(label)
+                    targets.append(idx)
+            offsets.append(len(targets))
+
+        # Referenced-only ids have no outgoing edges
+        extra = len(ids) - self.scene_count
+        offsets.extend([len(targets)] * extra)
+        self.edge_offsets = array('l', offsets)
+        self.edge_targets = array('l', targets)
+        self.edge_labels: List[str] = labels
+        self.present = bytearray([1] * self.scene_count + [0] * extra)
+        self.scenes = tuple(scenes.values())
+
+        start_id = story.get("start") or (self.ids[0] if self.ids else None)
+        self.start = self.index.get(start_id, -1) if start_id else -1
+
+        self.depth = self._compute_depth()
+        self.ending_distance = None
+        self.ending_counts = None
+        if metrics:
+            self.ending_distance = self.distance_to(self.ending_indices())
+            self.ending_counts = self._compute_ending_counts()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def lookup(self, scene_id: str) -> int:
+        """Return the index of a scene id, or -1 if the graph does not know it"""
+        return self.index.get(scene_id, -1)
+
+    def scene_id_at(self, idx: int) -> str:
+        return self.ids[idx]
+
+    def edge_label(self, edge: int) -> str:
+        return self.edge_labels[edge]
+
+    def is_ending(self, idx: int) -> bool:
+        """Check whether a scene exists and offers no choices"""
+        return bool(self.present[idx]) and self.edge_offsets[idx] == self.edge_offsets[idx + 1]
+
+    def ending_indices(self) -> List[int]:
+        """Indices of every scene that exists and offers no choices"""
+        offsets = self.edge_offsets
+        return [idx for idx in range(self.scene_count) if offsets[idx] == offsets[idx + 1]]
+
+    def get_scene(self, scene_id: str) -> Optional[Mapping]:
+        """Get a scene by id, or None if it is unknown or only referenced"""
+        idx = self.lookup(scene_id)
+        if idx < 0 or not self.present[idx]:
+            return None
+        return self.scenes[idx]
+
+    def next_index(self, idx: int, choice: str) -> int:
+        """Follow the edge labelled ``choice`` out of scene ``idx``, or return -1"""
+        for edge in range(self.edge_offsets[idx], self.edge_offsets[idx + 1]):
+            if self.edge_label(edge) == choice:
+                return self.edge_targets[edge]
+        return -1
+
+    def next_scene_id(self, scene_id: str, choice: str) -> Optional[str]:
+        """Resolve a choice to the id of the scene it leads to"""
+        idx = self.lookup(scene_id)
+        if idx < 0:
+            return None
+        target = self.next_index(idx, choice)
+        return self.scene_id_at(target) if target >= 0 else None
+
+    def progress(self, scene_id: str) -> Optional[float]:
+        """Fraction of the shortest remaining route already travelled"""
+        idx = self.lookup(scene_id)
+        if idx < 0 or self.depth[idx] < 0 or self.ending_distance[idx] < 0:
+            return None
+        travelled = self.depth[idx]
+        total = travelled + self.ending_distance[idx]
+        return travelled / total if total else 1.0
+
+    def reachable_endings(self, scene_id: str) -> Optional[int]:
+        """Number of distinct endings still reachable from a scene"""
+        idx = self.lookup(scene_id)
+        if idx < 0 or self.ending_counts is None:
+            return None
+        return self.ending_counts[idx]
+
+    def _compute_depth(self) -> array:
+        """Breadth-first distances from the start scene"""
+        depth = array('l', [-1]) * len(self.ids)
+        if self.start < 0:
+            return depth
+
+        offsets, targets = self.edge_offsets, self.edge_targets
+        depth[self.start] = 0
+        queue = deque([self.start])
+        while queue:
+            idx = queue.popleft()
+            next_depth = depth[idx] + 1
+            for edge in range(offsets[idx], offsets[idx + 1]):
+                target = targets[edge]
+                if depth[target] < 0:
+                    depth[target] = next_depth
+                    queue.append(target)
+        return depth
+
+    def distance_to(self, sources: Iterable[int]) -> array:
+        """Fewest choices from every scene to any of ``sources`` (-1 if none is reachable).
+
+        A multi-source breadth-first search over reversed edges.
+        """
+        count = len(self.ids)
+        offsets, targets = self.edge_offsets, self.edge_targets
+
+        # Reverse adjacency in the same flat offsets/targets layout
+        in_degree = array('l', [0]) * (count + 1)
+        for target in targets:
+            in_degree[target + 1] += 1
+        for idx in range(count):
+            in_degree[idx + 1] += in_degree[idx]
+        reverse_offsets = array('l', in_degree)
+        fill = array('l', in_degree)
+        reverse_sources = array('l', [0]) * len(targets)
+        for idx in range(count):
+            for edge in range(offsets[idx], offsets[idx + 1]):
+                target = targets[edge]
+                reverse_sources[fill[target]] = idx
+                fill[target] += 1
+
+        distance = array('l', [-1]) * count
+        queue = deque()
+        for idx in sources:
+            if distance[idx] < 0:
+                distance[idx] = 0
+                queue.append(idx)
+        while queue:
+            idx = queue.popleft()
+            next_distance = distance[idx] + 1
+            for pos in range(reverse_offsets[idx], reverse_offsets[idx + 1]):
+                source = reverse_sources[pos]
+                if distance[source] < 0:
+                    distance[source] = next_distance
+                    queue.append(source)
+        return distance
+
+    def _compute_ending_counts(self) -> array:
+        """Count the distinct endings reachable from each scene.
+
+        Uses an iterative Tarjan pass, which emits strongly connected
+        components sinks-first, so every successor is final before it is read.
+        Each component's reachable endings are a bitset (a Python int, offset
+        by its lowest bit) that is dropped once every edge into the component
+        has been read, so only the frontier of unfinished components is held
+        at once. Endings are numbered in emission order, so the endings below
+        one branch of a tree-shaped story take up a short run of bits.
+        """
+        count = len(self.ids)
+        offsets, targets = self.edge_offsets, self.edge_targets
+        order = array('l', [-1]) * count
+        low = array('l', [0]) * count
+        component = array('l', [-1]) * count
+        on_stack = bytearray(count)
+        stack: List[int] = []
+        totals = array('q', [0]) * count
+        next_order = 0
+
+        in_degree = array('l', [0]) * count
+        for target in targets:
+            in_degree[target] += 1
+        next_bit = 0
+        # Reachable endings as (lowest bit, bits above it) and unread incoming edges, by component root
+        reach: Dict[int, Tuple[int, int]] = {}
+        readers: Dict[int, int] = {}
+
+        for root in range(count):
+            if order[root] >= 0:
+                continue
+            work = [(root, offsets[root])]
+            order[root] = low[root] = next_order
+            next_order += 1
+            stack.append(root)
+            on_stack[root] = 1
+
+            while work:
+                idx, edge = work[-1]
+                if edge < offsets[idx + 1]:
+                    work[-1] = (idx, edge + 1)
+                    target = targets[edge]
+                    if order[target] < 0:
+                        order[target] = low[target] = next_order
+                        next_order += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, offsets[target]))
+                    elif on_stack[target]:
+                        low[idx] = min(low[idx], order[target])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[idx])
+                if low[idx] != order[idx]:
+                    continue
+
+                # idx is the root of a finished component
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component[member] = idx
+                    members.append(member)
+                    if member == idx:
+                        break
+
+                sets = []
+                unread = 0
+                for member in members:
+                    if self.is_ending(member):
+                        sets.append((next_bit, 1))
+                        next_bit += 1
+                    unread += in_degree[member]
+                    for pos in range(offsets[member], offsets[member + 1]):
+                        other = component[targets[pos]]
+                        if other == idx:
+                            unread -= 1
+                            continue
+                        sets.append(reach[other])
+                        readers[other] -= 1
+                        if not readers[other]:
+                            del reach[other], readers[other]
+                base = min((low_bit for low_bit, _ in sets), default=0)
+                endings = 0
+                for low_bit, bits in sets:
+                    endings |= bits << (low_bit - base)
+                if unread:
+                    reach[idx], readers[idx] = (base, endings), unread
+                total = bin(endings).count("1")
+                for member in members:
+                    totals[member] = total
+        return totals
+
+
+class LayeredGraph:
+    """A compiled graph seen through the few scenes written or rewired since it was built.
+
+    ``scenes`` maps each such scene id to its current scene; every other
+    scene, and every per-scene metric, comes from the base graph.
+    """
+
+    def __init__(self, graph: StoryGraph, scenes: Mapping):
+        self.base = graph
+        self.scenes = scenes
+
+    def __getattr__(self, name: str):
+        return getattr(self.base, name)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def get_scene(self, scene_id: str) -> Optional[Mapping]:
+        scene = self.scenes.get(scene_id)
+        return scene if scene is not None else self.base.get_scene(scene_id)
+
+    def next_scene_id(self, scene_id: str, choice: str) -> Optional[str]:
+        scene = self.scenes.get(scene_id)
+        if scene is not None:
+            return (scene.get("choices") or {}).get(choice)
+        return self.base.next_scene_id(scene_id, choice)
@@ -0,0 +1,192 @@
+# story_journal.py
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+_journals: Dict[str, "SceneJournal"] = {}
+_journals_lock = threading.Lock()
+
+
+def journal_path(story_file) -> Path:
+    """Append-only journal file that accompanies a story snapshot"""
+    path = Path(story_file)
+    return path.with_name(f"{path.stem}.journal.jsonl")
+
+
+def delta_records(delta: Mapping) -> List[Dict]:
+    """Turn an overlay delta into journal records, scenes before rewired choices"""
+    records = [
+        {"op": "scene", "id": scene_id, "scene": scene}
+        for scene_id, scene in delta.get("scenes", {}).items()
+    ]
+    for scene_id, choices in delta.get("choices", {}).items():
+        records.extend(
+            {"op": "choice", "scene": scene_id, "choice": choice, "target": target}
+            for choice, target in choices.items()
+        )
+    return records
+
+
+def read_records(path, offset: int = 0) -> Tuple[List[Dict], int]:
+    """Read complete records from ``offset`` on, returning them and the next offset.
+
+    A trailing partial line (a write cut short by a crash) is left unread so
+    that it is neither applied nor skipped past.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    end = data.rfind(b"\n") + 1
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            logging.error(f"Skipping corrupt journal record in {path}: {e}")
+    return records, offset + end
+
+
+def apply_records(scenes: Dict, records: Iterable[Mapping]) -> Dict:
+    """Replay journal records onto a mutable scenes dict in place.
+
+    Records are idempotent, so replaying a journal onto a snapshot that
+    already contains it leaves the snapshot unchanged.
+    """
+    for record in records:
+        op = record.get("op")
+        if op == "scene":
+            scenes[record["id"]] = record["scene"]
+        elif op == "choice":
+            scene = scenes.get(record["scene"])
+            if scene is not None:
+                scene.setdefault("choices", {})[record["choice"]] = record["target"]
+        else:
+            logging.warning(f"Unknown journal record: {op}")
+    return scenes
+
+
+class SceneJournal:
+    """Append-only log of generated scenes and rewired choices for one story.
+
+    Every record is a single JSON line written with one O_APPEND write, so
+    concurrent sessions and worker processes never interleave partial lines.
+    Writes are flushed to the OS immediately but fsync'd at most once per
+    ``fsync_interval`` seconds, bounding both the durability window and the
+    cost of a save.
+    """
+
+    def __init__(self, path, fsync_interval: float = DEFAULT_FSYNC_INTERVAL):
+        self.path = Path(path)
+        self.fsync_interval = fsync_interval
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self.records_written = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._fd is None
+
+    def append(self, records: Iterable[Mapping]) -> None:
+        """Append records, syncing to disk if the interval has elapsed"""
+        data = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+        if not data:
+            return
+        payload = data.encode('utf-8')
+        with self._lock:
+            os.write(self._fd, payload)
+            self.records_written += data.count("\n")
+            self._dirty = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def append_delta(self, delta: Mapping) -> None:
+        """Append the records describing an overlay delta"""
+        self.append(delta_records(delta))
+
+    def sync(self) -> None:
+        """Force pending writes to disk"""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        if self._dirty:
+            os.fsync(self._fd)
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """Sync and close the journal file"""
+        with self._lock:
+            if self._fd is not None:
+                self._sync_locked()
+                os.close(self._fd)
+                self._fd = None
+
+
+def get_journal(story_file, fsync_interval: float = DEFAULT_FSYNC_INTERVAL) -> SceneJournal:
+    """Return the process-wide journal for a story, opening it on first use"""
+    path = os.path.abspath(journal_path(story_file))
+    journal = _journals.get(path)
+    if journal is None or journal.closed:
+        with _journals_lock:
+            journal = _journals.get(path)
+            if journal is None or journal.closed:
+                journal = SceneJournal(path, fsync_interval)
+                _journals[path] = journal
+    return journal
+
+
+def close_journals() -> None:
+    """Sync and close every open journal"""
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
+
+
+atexit.register(close_journals)
+
+
+def compact(story_file) -> int:
+    """Fold a story's journal into its snapshot and empty the journal.
+
+    Meant to run offline, while no session is appending. The new snapshot
+    is written atomically before the journal is truncated; if the process
+    dies in between, replaying the old journal again is harmless.
+    Returns the number of records folded in.
+    """
+    story_file = Path(story_file)
+    journal_file = journal_path(story_file)
+    records, _ = read_records(journal_file)
+    if not records:
+        return 0
+
+    with open(story_file, 'r', encoding='utf-8') as f:
+        story = json.load(f)
+    apply_records(story.setdefault("scenes", {}), records)
+
+    tmp_path = story_file.with_name(f"{story_file.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(story, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, story_file)
+    os.truncate(journal_file, 0)
+    logging.info(f"Compacted {len(records)} journal records into {story_file}")
+    return len(records)
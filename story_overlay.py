@@ -0,0 +1,140 @@
+# story_overlay.py
+
+from typing import Dict, Iterator, Mapping, Optional
+
+from story_graph import StoryGraph
+
+
+def empty_delta() -> Dict:
+    return {"scenes": {}, "choices": {}}
+
+
+class OverlayScenes(Mapping):
+    """Read-only mapping of scene id to scene, overlay first then base"""
+
+    def __init__(self, overlay: "StoryOverlay"):
+        self._overlay = overlay
+
+    def __getitem__(self, scene_id: str) -> Mapping:
+        scene = self._overlay.get_scene(scene_id)
+        if scene is None:
+            raise KeyError(scene_id)
+        return scene
+
+    def __contains__(self, scene_id) -> bool:
+        return scene_id in self._overlay.scenes or scene_id in self._overlay.base_scenes
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._overlay.base_scenes
+        for scene_id in self._overlay.scenes:
+            if scene_id not in self._overlay.base_scenes:
+                yield scene_id
+
+    def __len__(self) -> int:
+        extra = sum(1 for scene_id in self._overlay.scenes if scene_id not in self._overlay.base_scenes)
+        return len(self._overlay.base_scenes) + extra
+
+
+class StoryOverlay:
+    """Per-session copy-on-write view over an immutable base story.
+
+    Generated scenes and rewired choices live in small session-owned dicts
+    and are consulted before the shared base story and its compiled graph,
+    which are never modified. Only the changes made since the last save are
+    handed out for persistence.
+    """
+
+    def __init__(self, base: Mapping, graph: Optional[StoryGraph] = None):
+        self.base = base
+        self.base_scenes: Mapping = base.get("scenes", {}) if base else {}
+        self.graph = graph
+        self.scenes: Dict[str, Dict] = {}
+        self.choices: Dict[str, Dict[str, str]] = {}
+        self._merged: Dict[str, Dict] = {}
+        self._pending = empty_delta()
+
+    def __getitem__(self, key: str):
+        if key == "scenes":
+            return OverlayScenes(self)
+        return self.base[key]
+
+    def __contains__(self, key) -> bool:
+        return key == "scenes" or key in self.base
+
+    def get(self, key: str, default=None):
+        """Read story-level metadata such as title, genre or start"""
+        if key == "scenes":
+            return OverlayScenes(self)
+        return self.base.get(key, default)
+
+    def get_scene(self, scene_id: str) -> Optional[Mapping]:
+        """Look a scene up in the overlay first, then in the base story"""
+        scene = self.scenes.get(scene_id)
+        if scene is not None:
+            return scene
+
+        if scene_id in self.choices:
+            merged = self._merged.get(scene_id)
+            if merged is None:
+                base_scene = self.base_scenes.get(scene_id)
+                if base_scene is None:
+                    return None
+                merged = dict(base_scene)
+                merged["choices"] = {**base_scene.get("choices", {}), **self.choices[scene_id]}
+                self._merged[scene_id] = merged
+            return merged
+
+        return self.base_scenes.get(scene_id)
+
+    def next_scene_id(self, scene_id: str, choice: str) -> Optional[str]:
+        """Resolve a choice through the overlay, falling back to the base graph"""
+        rewired = self.choices.get(scene_id)
+        if rewired and choice in rewired:
+            return rewired[choice]
+
+        scene = self.scenes.get(scene_id)
+        if scene is not None:
+            return (scene.get("choices") or {}).get(choice)
+
+        if self.graph is not None:
+            return self.graph.next_scene_id(scene_id, choice)
+
+        base_scene = self.base_scenes.get(scene_id)
+        return (base_scene.get("choices") or {}).get(choice) if base_scene else None
+
+    def __len__(self) -> int:
+        return len(self["scenes"])
+
+    def add_scene(self, scene_id: str, scene: Dict, pending: bool = True) -> None:
+        """Add a generated scene to this session's overlay.
+
+        Pass ``pending=False`` for scenes another session already saved.
+        The overlay keeps its own copy, so rewiring its choices never
+        reaches another session holding the same generated scene.
+        """
+        scene = dict(scene, choices=dict(scene.get("choices") or {}))
+        self.scenes[scene_id] = scene
+        if pending:
+            self._pending["scenes"][scene_id] = scene
+
+    def set_choice(self, scene_id: str, choice: str, target_id: str, pending: bool = True) -> None:
+        """Point a choice of any scene at a different target"""
+        if scene_id in self.scenes:
+            self.scenes[scene_id].setdefault("choices", {})[choice] = target_id
+        else:
+            self.choices.setdefault(scene_id, {})[choice] = target_id
+            self._merged.pop(scene_id, None)
+        if pending:
+            self._pending["choices"].setdefault(scene_id, {})[choice] = target_id
+
+    def has_changes(self) -> bool:
+        """Check whether anything was added since the last save"""
+        return bool(self._pending["scenes"] or self._pending["choices"])
+
+    def pending_delta(self) -> Dict:
+        """Changes made since the last call to mark_saved"""
+        return self._pending
+
+    def mark_saved(self) -> None:
+        """Forget pending changes once they have been persisted"""
+        self._pending = empty_delta()
@@ -0,0 +1,209 @@
+# story_registry.py
+
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from story_graph import LayeredGraph, StoryGraph
+from story_journal import apply_records, journal_path, read_records
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert parsed JSON into read-only mappings and tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Return a mutable deep copy of a frozen story structure"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+# Journal records kept as a layer over the base story before they are folded into it
+MAX_JOURNAL_TAIL = int(os.getenv("KUKU_JOURNAL_TAIL", "1000"))
+
+
+class LayeredScenes(Mapping):
+    """Read-only scenes of a base story with the scenes of a journal tail on top"""
+
+    def __init__(self, base: Mapping, tail: Mapping):
+        self._base = base
+        self._tail = tail
+        self._added = [scene_id for scene_id in tail if scene_id not in base]
+
+    def __getitem__(self, scene_id: str) -> Mapping:
+        scene = self._tail.get(scene_id)
+        return scene if scene is not None else self._base[scene_id]
+
+    def __contains__(self, scene_id) -> bool:
+        return scene_id in self._tail or scene_id in self._base
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._added)
+
+
+def journal_tail(scenes: Mapping, records: Iterable[Mapping]) -> Dict[str, Mapping]:
+    """Frozen scenes written or rewired by ``records``, applied over ``scenes`` without copying it"""
+    touched: Dict[str, Dict] = {}
+    for record in records:
+        op = record.get("op")
+        if op == "scene":
+            touched[record["id"]] = thaw(record["scene"])
+        elif op == "choice":
+            scene_id = record["scene"]
+            scene = touched.get(scene_id)
+            if scene is None and scene_id in scenes:
+                scene = touched[scene_id] = thaw(scenes[scene_id])
+            if scene is not None:
+                scene.setdefault("choices", {})[record["choice"]] = record["target"]
+    return {scene_id: freeze(scene) for scene_id, scene in touched.items()}
+
+
+class _StoryVersion:
+    """One cached version of a story: a base and the journal records written since"""
+
+    def __init__(self, version: Tuple[int, int], base: Mapping, offset: int, tail: List[Dict]):
+        self.version = version
+        self.base = base
+        self.offset = offset
+        self.tail = tail
+        self.tail_scenes = journal_tail(base["scenes"], tail)
+        self.story = base
+        if self.tail_scenes:
+            self.story = MappingProxyType({**base, "scenes": LayeredScenes(base["scenes"], self.tail_scenes)})
+
+
+class StoryRegistry:
+    """Process-wide cache of parsed stories shared by every reader session.
+
+    Each story file is parsed once per process and handed out as a frozen
+    mapping, so all sessions share one copy of the scene graph. The story's
+    scene journal (see story_journal) is replayed on top of the snapshot.
+    When only the journal has grown, the new records join a small shared
+    tail layered over the base story and its compiled StoryGraph, so a new
+    session costs time in the size of the tail rather than of the story.
+    The tail is folded into the base once it passes ``max_tail`` records,
+    and everything is reloaded when the snapshot's modification time
+    changes (for example after compaction).
+    """
+
+    def __init__(self, max_tail: int = MAX_JOURNAL_TAIL):
+        self.max_tail = max_tail
+        self._entries: Dict[str, _StoryVersion] = {}
+        # Compiled graph of each story's base, built once per base
+        self._graphs: Dict[str, Tuple[Mapping, StoryGraph]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.folds = 0
+        self.hits = 0
+
+    def get(self, story_file) -> Mapping:
+        """Return the shared, read-only story for a file, loading it if stale.
+
+        Raises OSError if the file is missing and json.JSONDecodeError if it
+        cannot be parsed, leaving any previously cached version untouched.
+        """
+        return self._load(story_file, count_hit=True).story
+
+    def get_graph(self, story_file) -> Union[StoryGraph, LayeredGraph]:
+        """Return the compiled graph for a story file, with the journal tail layered on top"""
+        entry = self._load(story_file)
+        path = os.path.abspath(story_file)
+
+        cached = self._graphs.get(path)
+        if cached is None or cached[0] is not entry.base:
+            with self._lock:
+                cached = self._graphs.get(path)
+                if cached is None or cached[0] is not entry.base:
+                    cached = (entry.base, StoryGraph(entry.base))
+                    self._graphs[path] = cached
+        graph = cached[1]
+        return LayeredGraph(graph, entry.tail_scenes) if entry.tail_scenes else graph
+
+    def _load(self, story_file, count_hit: bool = False) -> _StoryVersion:
+        """Return the current version of a story, reading only what changed"""
+        path = os.path.abspath(story_file)
+        journal_file = journal_path(path)
+        try:
+            journal_size = os.stat(journal_file).st_size
+        except FileNotFoundError:
+            journal_size = 0
+        version = (os.stat(path).st_mtime_ns, journal_size)
+
+        entry = self._entries.get(path)
+        if entry and entry.version == version:
+            if count_hit:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            # Another session may have reloaded the file while we waited
+            entry = self._entries.get(path)
+            if entry and entry.version == version:
+                if count_hit:
+                    self.hits += 1
+                return entry
+
+            if entry and entry.version[0] == version[0] and entry.offset <= journal_size:
+                # Same snapshot, longer journal: add the new records to the tail
+                records, offset = read_records(journal_file, entry.offset)
+                base, tail = entry.base, entry.tail + records
+                if len(tail) > self.max_tail:
+                    base, tail = self._fold(base, tail), []
+                    self.folds += 1
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    story = json.load(f)
+                records, offset = read_records(journal_file)
+                apply_records(story.setdefault("scenes", {}), records)
+                base, tail = freeze(story), []
+                self.loads += 1
+                logging.info(f"Story loaded into shared registry: {story_file}")
+
+            entry = _StoryVersion(version, base, offset, tail)
+            self._entries[path] = entry
+            return entry
+
+    @staticmethod
+    def _fold(story: Mapping, records) -> Mapping:
+        """Return a new frozen base story with journal records applied to a copy"""
+        scenes = dict(story["scenes"])
+        scenes.update(journal_tail(scenes, records))
+        return MappingProxyType({**story, "scenes": MappingProxyType(scenes)})
+
+    def invalidate(self, story_file: Optional[str] = None) -> None:
+        """Drop one cached story, or every cached story if none is given"""
+        with self._lock:
+            if story_file is None:
+                self._entries.clear()
+                self._graphs.clear()
+            else:
+                self._entries.pop(os.path.abspath(story_file), None)
+                self._graphs.pop(os.path.abspath(story_file), None)
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        return {
+            "stories_cached": len(self._entries),
+            "loads": self.loads,
+            "folds": self.folds,
+            "hits": self.hits
+        }
+
+
+# Shared by every session running in this process
+story_registry = StoryRegistry()
@@ -0,0 +1,231 @@
+# story_store.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterator, Mapping, Optional
+
+from story_graph import StoryGraph
+from story_journal import delta_records, get_journal
+from story_registry import StoryRegistry, freeze, story_registry
+
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+DEFAULT_CACHE_SIZE = 4096
+
+_stores: Dict[str, "StoryStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class StoryStore(ABC):
+    """Storage backend behind KukuBuddy.
+
+    A store exposes the base story as a read-only ``story`` mapping with the
+    usual ``title``/``genre``/``start``/``scenes`` keys, an optional compiled
+    ``graph`` for indexed choice hops, and persists overlay deltas. Sessions
+    layer their own StoryOverlay on top, so stores never see in-flight edits.
+    Backends must implement ``save_delta``; ``close`` is optional.
+    """
+
+    story: Mapping = MappingProxyType({})
+    graph: Optional[StoryGraph] = None
+
+    @abstractmethod
+    def save_delta(self, delta: Mapping) -> None:
+        """Persist scenes and rewired choices added by a session"""
+
+    def close(self) -> None:
+        """Release any resources held by the store"""
+
+
+class MemoryStoryStore(StoryStore):
+    """Story held in an in-memory dict; saved deltas are kept only for this process"""
+
+    def __init__(self, story: Mapping):
+        self.story = freeze(dict(story))
+        self.graph = StoryGraph(self.story)
+        self.saved_records = []
+
+    def save_delta(self, delta: Mapping) -> None:
+        self.saved_records.extend(delta_records(delta))
+
+
+class JsonStoryStore(StoryStore):
+    """JSON snapshot plus scene journal, shared through the story registry"""
+
+    def __init__(self, story_file, registry: Optional[StoryRegistry] = None):
+        self.story_file = story_file
+        self.registry = registry or story_registry
+        self.story = self.registry.get(story_file)
+        self.graph = self.registry.get_graph(story_file)
+
+    def save_delta(self, delta: Mapping) -> None:
+        get_journal(self.story_file).append_delta(delta)
+
+
+class SqliteScenes(Mapping):
+    """Lazy scene mapping that reads scenes from SQLite on demand"""
+
+    def __init__(self, store: "SqliteStoryStore"):
+        self._store = store
+
+    def __getitem__(self, scene_id: str) -> Mapping:
+        scene = self._store.get_scene(scene_id)
+        if scene is None:
+            raise KeyError(scene_id)
+        return scene
+
+    def get(self, scene_id, default=None):
+        scene = self._store.get_scene(scene_id)
+        return default if scene is None else scene
+
+    def __contains__(self, scene_id) -> bool:
+        return self._store.get_scene(scene_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        cursor = self._store.connection().execute("SELECT id FROM scenes ORDER BY rowid")
+        for (scene_id,) in cursor:
+            yield scene_id
+
+    def __len__(self) -> int:
+        (count,) = self._store.connection().execute("SELECT COUNT(*) FROM scenes").fetchone()
+        return count
+
+
+class SqliteStoryStore(StoryStore):
+    """SQLite-backed story that loads scenes by id with a bounded LRU of hot scenes.
+
+    Only story metadata is read up front, so opening a story with hundreds
+    of thousands of scenes costs the same as opening a small one. Each
+    thread gets its own connection; the LRU is shared by all sessions.
+    """
+
+    def __init__(self, db_path, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.db_path = str(db_path)
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Mapping]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        connection = self.connection()
+        create_schema(connection)
+        metadata = {key: json.loads(value) for key, value in connection.execute("SELECT key, value FROM meta")}
+        self.story = MappingProxyType({**metadata, "scenes": SqliteScenes(self)})
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path)
+            self._local.connection = connection
+        return connection
+
+    def get_scene(self, scene_id: str) -> Optional[Mapping]:
+        """Return a scene from the LRU, or load it from the database"""
+        with self._cache_lock:
+            scene = self._cache.get(scene_id)
+            if scene is not None:
+                self._cache.move_to_end(scene_id)
+                self.hits += 1
+                return scene
+
+        row = self.connection().execute("SELECT data FROM scenes WHERE id = ?", (scene_id,)).fetchone()
+        if row is None:
+            return None
+        scene = freeze(json.loads(row[0]))
+
+        with self._cache_lock:
+            self.misses += 1
+            self._cache[scene_id] = scene
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scene
+
+    def save_delta(self, delta: Mapping) -> None:
+        connection = self.connection()
+        with connection:
+            for scene_id, scene in delta.get("scenes", {}).items():
+                connection.execute("INSERT OR REPLACE INTO scenes (id, data) VALUES (?, ?)",
+                                   (scene_id, json.dumps(scene)))
+            for scene_id, choices in delta.get("choices", {}).items():
+                row = connection.execute("SELECT data FROM scenes WHERE id = ?", (scene_id,)).fetchone()
+                if row is None:
+                    continue
+                scene = json.loads(row[0])
+                scene.setdefault("choices", {}).update(choices)
+                connection.execute("UPDATE scenes SET data = ? WHERE id = ?", (json.dumps(scene), scene_id))
+
+        with self._cache_lock:
+            for scene_id in (*delta.get("scenes", {}), *delta.get("choices", {})):
+                self._cache.pop(scene_id, None)
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def create_schema(connection: sqlite3.Connection) -> None:
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS scenes (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    connection.commit()
+
+
+def import_json(story_file, db_path, batch_size: int = 10000) -> int:
+    """Copy a JSON story into an SQLite scene store, returning the scene count"""
+    with open(story_file, 'r', encoding='utf-8') as f:
+        story = json.load(f)
+
+    connection = sqlite3.connect(str(db_path))
+    try:
+        create_schema(connection)
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in story.items() if key != "scenes"]
+            )
+            rows = [(scene_id, json.dumps(scene)) for scene_id, scene in story.get("scenes", {}).items()]
+            for start in range(0, len(rows), batch_size):
+                connection.executemany("INSERT OR REPLACE INTO scenes (id, data) VALUES (?, ?)",
+                                       rows[start:start + batch_size])
+        return len(rows)
+    finally:
+        connection.close()
+
+
+def open_store(story_file, registry: Optional[StoryRegistry] = None) -> StoryStore:
+    """Pick a backend from the file extension.
+
+    JSON stories are served from their memory-mapped compiled form (see
+    story_binary) while it is up to date, and otherwise through the registry.
+    SQLite stores are shared by every session in the process so that they
+    also share one scene cache.
+    """
+    if Path(story_file).suffix.lower() not in SQLITE_SUFFIXES:
+        from story_binary import open_compiled
+
+        compiled = open_compiled(story_file)
+        if compiled is not None:
+            return compiled
+        return JsonStoryStore(story_file, registry)
+
+    if not os.path.exists(story_file):
+        raise FileNotFoundError(story_file)
+    path = os.path.abspath(story_file)
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = SqliteStoryStore(path)
+                _stores[path] = store
+                logging.info(f"Opened SQLite story store: {story_file}")
+    return store
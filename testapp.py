@@ -3,6 +3,10 @@ import sys
 import unittest
 from unittest.mock import patch, MagicMock
 import json
+import tempfile
+import threading
+import time
+from functools import partial
 from pathlib import Path
 
 # Fix import paths for testing
@@ -12,6 +16,43 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from kuku_buddy import KukuBuddy
 from openai_manager import OpenAIManager
 from memory_manager import MemoryManager
+from story_registry import StoryRegistry
+from story_graph import StoryGraph
+from story_overlay import StoryOverlay
+from story_store import MemoryStoryStore, SqliteStoryStore, StoryStore, import_json
+from story_analyzer import analyze
+from story_generator import generate_story, write_story
+from generation_jobs import GenerationQueue
+from prefetch import PrefetchBudget
+from scene_stream import SceneStreamParser, parse_scene
+from story_expander import StoryExpander, expand_file, progress_path
+from story_context import ContextBuilder, estimate_tokens
+from scene_schema import JsonSceneStreamParser, SceneFormatError, load_scene, repair_json
+from generation_cache import GenerationCache, cache_key
+from scene_ids import SceneIdAllocator
+from client_pool import ClientPool, iter_chunks
+from llm_metrics import LLMMetrics, call_cost
+from model_router import Endpoint, ModelRouter, RouteHealth
+from hedging import HedgeRace
+from bridge_pool import BridgePool
+from choice_index import BANDS, ChoiceIndex
+from fake_openai_server import FakeOpenAIServer, FakeServerConfig, scene_reply
+from llm_scheduler import BATCH, INTERACTIVE, PREFETCH, LLMScheduler, Priority, TokenBucket
+from utils import detect_mood
+from story_binary import BinaryStoryStore, compile_story
+from story_journal import SceneJournal, compact, get_journal, journal_path, read_records
+
+def without_targets(scene):
+    """A scene with its freshly allocated choice ids left out, to compare two parses"""
+    return dict(scene, choices=list(scene.get("choices") or {}))
+
+def stream_chunks(reply, size=3):
+    """Fake a streamed chat completion, a few characters per chunk"""
+    chunks = [
+        MagicMock(choices=[MagicMock(delta=MagicMock(content=reply[i:i + size]))], usage=None)
+        for i in range(0, len(reply), size)
+    ]
+    return chunks + [MagicMock(choices=[], usage=MagicMock(total_tokens=42))]
 
 class TestKukuBuddy(unittest.TestCase):
     """Test the KukuBuddy class functionality"""
@@ -72,7 +113,9 @@ class TestOpenAIManager(unittest.TestCase):
         result = self.openai_manager.set_api_key("test_api_key")
         self.assertTrue(result)
         self.assertEqual(self.openai_manager.api_key, "test_api_key")
-        mock_openai.assert_called_once_with(api_key="test_api_key")
+        mock_openai.assert_called_once()
+        self.assertEqual(mock_openai.call_args.kwargs["api_key"], "test_api_key")
+        self.assertIs(self.openai_manager.client, mock_client)
     
     def test_error_scene_creation(self):
         """Test creating error scene"""
@@ -80,6 +123,17 @@ class TestOpenAIManager(unittest.TestCase):
         self.assertIn("text", error_scene)
         self.assertIn("Test error", error_scene["text"])
         self.assertIn("choices", error_scene)
+    
+    def test_json_choices_get_fresh_targets(self):
+        """Test that placeholder ids in structured choices replies are replaced by distinct _ai scenes"""
+        reply = 'Sure: {"Investigate the basement": "next_scene_1", "Call for backup": "next_scene_2"}'
+        first = self.openai_manager._parse_choices_text(reply, "s")
+        second = self.openai_manager._parse_choices_text(reply, "s")
+        self.assertEqual(list(first), ["Investigate the basement", "Call for backup"])
+        self.assertEqual(list(second), list(first))
+        targets = list(first.values()) + list(second.values())
+        self.assertEqual(len(set(targets)), 4)
+        self.assertTrue(all(target.endswith("_ai") for target in targets))
 
 class TestMemoryManager(unittest.TestCase):
     """Test the MemoryManager class functionality"""
@@ -112,6 +166,1347 @@ class TestMemoryManager(unittest.TestCase):
         self.memory.update("scene_1", "Test Choice")
         self.memory.reset()
         self.assertEqual(len(self.memory.path), 0)
+    
+    def test_running_stats(self):
+        """Test that path stats are counted as choices and moods come in, and restart on reset"""
+        for choice in ["Search the desk", "Run!", "Search the desk", "Wait"]:
+            self.memory.update("scene_1", choice)
+        for mood in ["tense", "peaceful", "peaceful", "tense"]:
+            self.memory.add_mood(mood)
+        stats = self.memory.get_stats()
+        self.assertEqual((stats["unique_choices"], stats["story_length"]), (3, 4))
+        self.assertEqual((stats["favorite_mood"], stats["playstyle"]), ("tense", "Detective"))
+        self.memory.reset()
+        self.memory.add_mood("peaceful")
+        stats = self.memory.get_stats()
+        self.assertEqual((stats["unique_choices"], stats["favorite_mood"], stats["playstyle"]),
+                         (0, "peaceful", "Newcomer"))
+
+class TestStoryRegistry(unittest.TestCase):
+    """Test the shared story registry"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.registry = StoryRegistry()
+        self.story_file = "stories/thriller.json"
+    
+    def test_sessions_share_story(self):
+        """Test that sessions reuse one parsed story"""
+        first = KukuBuddy(self.story_file, registry=self.registry)
+        second = KukuBuddy(self.story_file, registry=self.registry)
+        self.assertIs(first.story, second.story)
+        self.assertEqual(self.registry.loads, 1)
+        self.assertEqual(self.registry.hits, 1)
+    
+    def test_story_is_read_only(self):
+        """Test that the shared story cannot be modified"""
+        story = self.registry.get(self.story_file)
+        with self.assertRaises(TypeError):
+            story["scenes"]["scene_1"]["text"] = "changed"
+    
+    def test_reload_on_mtime_change(self):
+        """Test that a modified file is reloaded"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "story.json"
+            path.write_text(json.dumps({"start": "a", "scenes": {"a": {"text": "one"}}}))
+            first = self.registry.get(path)
+            path.write_text(json.dumps({"start": "a", "scenes": {"a": {"text": "two"}}}))
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+            second = self.registry.get(path)
+            self.assertEqual(first["scenes"]["a"]["text"], "one")
+            self.assertEqual(second["scenes"]["a"]["text"], "two")
+            self.assertEqual(self.registry.loads, 2)
+
+class TestStoryGraph(unittest.TestCase):
+    """Test the compiled story graph"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.story = {
+            "start": "a",
+            "scenes": {
+                "a": {"text": "A", "choices": {"left": "b", "right": "c"}},
+                "b": {"text": "B", "choices": {"back": "a", "on": "d"}},
+                "c": {"text": "C", "choices": {"on": "d", "lost": "missing"}},
+                "d": {"text": "D"}
+            }
+        }
+        self.graph = StoryGraph(self.story)
+    
+    def test_indexed_hop(self):
+        """Test that choices resolve through the flat edge arrays"""
+        self.assertEqual(self.graph.next_scene_id("a", "right"), "c")
+        self.assertEqual(self.graph.next_scene_id("c", "lost"), "missing")
+        self.assertIsNone(self.graph.next_scene_id("a", "nowhere"))
+        self.assertIsNone(self.graph.get_scene("missing"))
+    
+    def test_precomputed_metrics(self):
+        """Test depth, ending distance and reachable endings, including a cycle"""
+        idx = self.graph.index
+        self.assertEqual(self.graph.depth[idx["d"]], 2)
+        self.assertEqual(self.graph.ending_distance[idx["a"]], 2)
+        self.assertEqual(self.graph.ending_distance[idx["missing"]], -1)
+        # a reaches d by two routes, but d is its only ending
+        self.assertEqual(self.graph.ending_counts[idx["a"]], 1)
+        self.assertEqual(self.graph.ending_counts[idx["missing"]], 0)
+        self.assertEqual(self.graph.reachable_endings("c"), 1)
+        self.assertEqual(self.graph.progress("b"), 0.5)
+    
+    def test_matches_story_file(self):
+        """Test that the graph agrees with the raw choices of thriller.json"""
+        kuku = KukuBuddy("stories/thriller.json")
+        for scene_id, scene in kuku.story["scenes"].items():
+            for choice, target in scene.get("choices", {}).items():
+                self.assertEqual(kuku.graph.next_scene_id(scene_id, choice), target)
+
+class TestStoryOverlay(unittest.TestCase):
+    """Test per-session copy-on-write overlays"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.story_file = Path(self.tmp.name) / "story.json"
+        self.story_file.write_text(json.dumps({
+            "title": "Test", "start": "a",
+            "scenes": {"a": {"text": "A", "choices": {"go": "b_ai"}}}
+        }))
+        self.registry = StoryRegistry()
+    
+    def tearDown(self):
+        get_journal(self.story_file).close()
+        self.tmp.cleanup()
+    
+    def test_overlay_lookup_first(self):
+        """Test that overlay scenes and rewired choices shadow the base"""
+        base = self.registry.get(self.story_file)
+        overlay = StoryOverlay(base, self.registry.get_graph(self.story_file))
+        overlay.add_scene("scene_2_ai", {"text": "B"})
+        overlay.set_choice("a", "go", "scene_2_ai")
+        self.assertEqual(overlay.next_scene_id("a", "go"), "scene_2_ai")
+        self.assertEqual(overlay.get_scene("a")["choices"]["go"], "scene_2_ai")
+        self.assertEqual(base["scenes"]["a"]["choices"]["go"], "b_ai")
+        self.assertEqual(len(overlay["scenes"]), 2)
+    
+    @patch('streamlit.session_state', {})
+    def test_generation_is_session_local(self):
+        """Test that a generated branch only persists the delta"""
+        reader = KukuBuddy(self.story_file, registry=self.registry)
+        other = KukuBuddy(self.story_file, registry=self.registry)
+        manager = OpenAIManager()
+        manager.client = MagicMock()
+        manager.client.chat.completions.create.return_value = stream_chunks(
+            "[SCENE]\nB\n[QUESTION]\nNow?\n[CHOICES]\nWait"
+        )
+        reader.enable_dynamic_generation(manager)
+        before = self.story_file.read_text()
+        
+        next_id, scene = reader.get_next_scene("a", "go")
+        self.assertEqual(scene["text"], "B")
+        self.assertEqual(other.get_scene("a")["choices"]["go"], "b_ai")
+        self.assertEqual(self.story_file.read_text(), before)
+        
+        records, _ = read_records(journal_path(self.story_file))
+        self.assertEqual([r["op"] for r in records], ["scene", "choice"])
+        self.assertEqual(records[0]["id"], next_id)
+        self.assertEqual(records[1]["target"], next_id)
+        
+        # New sessions see the persisted branch folded into the base story
+        fresh = KukuBuddy(self.story_file, registry=self.registry)
+        self.assertEqual(fresh.get_next_scene("a", "go")[0], next_id)
+
+class TestSceneJournal(unittest.TestCase):
+    """Test the append-only scene journal"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.story_file = Path(self.tmp.name) / "story.json"
+        self.story_file.write_text(json.dumps({
+            "start": "a", "scenes": {"a": {"text": "A", "choices": {"go": "b_ai"}}}
+        }))
+        self.journal = SceneJournal(journal_path(self.story_file), fsync_interval=0)
+    
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+    
+    def test_replay_on_load(self):
+        """Test that new records are applied incrementally on reload"""
+        registry = StoryRegistry()
+        registry.get(self.story_file)
+        self.journal.append_delta({"scenes": {"s1_ai": {"text": "B"}}, "choices": {"a": {"go": "s1_ai"}}})
+        story = registry.get(self.story_file)
+        self.assertEqual(story["scenes"]["a"]["choices"]["go"], "s1_ai")
+        self.assertEqual(story["scenes"]["s1_ai"]["text"], "B")
+        self.assertEqual(registry.loads, 1)
+    
+    def test_tail_layered_then_folded(self):
+        """Test that new records are layered over the cached graph until the tail is folded in"""
+        registry = StoryRegistry(max_tail=3)
+        graph = registry.get_graph(self.story_file)
+        self.journal.append_delta({"scenes": {"s1_ai": {"text": "B"}}, "choices": {"a": {"go": "s1_ai"}}})
+        layered = registry.get_graph(self.story_file)
+        self.assertIs(layered.base, graph)
+        self.assertEqual(layered.next_scene_id("a", "go"), "s1_ai")
+        story = registry.get(self.story_file)
+        self.assertEqual((len(story["scenes"]), list(story["scenes"])), (2, ["a", "s1_ai"]))
+        
+        self.journal.append_delta({"scenes": {"s2_ai": {"text": "C"}}, "choices": {"s1_ai": {"on": "s2_ai"}}})
+        folded = registry.get_graph(self.story_file)
+        self.assertEqual((registry.loads, registry.folds), (1, 1))
+        self.assertIsInstance(folded, StoryGraph)
+        self.assertEqual(folded.next_scene_id("s1_ai", "on"), "s2_ai")
+    
+    def test_partial_record_ignored(self):
+        """Test that a torn final line is not replayed"""
+        self.journal.append([{"op": "scene", "id": "s1_ai", "scene": {"text": "B"}}])
+        with open(self.journal.path, 'a') as f:
+            f.write('{"op": "scene", "id": "s2')
+        records, offset = read_records(self.journal.path)
+        self.assertEqual(len(records), 1)
+        self.assertLess(offset, os.path.getsize(self.journal.path))
+    
+    def test_compact(self):
+        """Test folding the journal back into the snapshot"""
+        self.journal.append_delta({"scenes": {"s1_ai": {"text": "B"}}, "choices": {"a": {"go": "s1_ai"}}})
+        self.assertEqual(compact(self.story_file), 2)
+        story = json.loads(self.story_file.read_text())
+        self.assertEqual(story["scenes"]["a"]["choices"]["go"], "s1_ai")
+        self.assertEqual(os.path.getsize(self.journal.path), 0)
+
+class TestStoryStores(unittest.TestCase):
+    """Test the pluggable story storage backends"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.story_file = "stories/thriller.json"
+        self.db_path = Path(self.tmp.name) / "thriller.db"
+        import_json(self.story_file, self.db_path)
+        with open(self.story_file, 'r', encoding='utf-8') as f:
+            self.story = json.load(f)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_backends_agree(self):
+        """Test that every backend serves the same scenes and choices"""
+        sqlite_store = SqliteStoryStore(self.db_path)
+        sessions = [
+            KukuBuddy(self.story_file),
+            KukuBuddy(store=MemoryStoryStore(self.story)),
+            KukuBuddy(store=sqlite_store),
+        ]
+        for kuku in sessions:
+            scene, start_id = kuku.get_start_scene()
+            self.assertEqual(start_id, "scene_1")
+            next_id, next_scene = kuku.get_next_scene("scene_1", "Keep driving despite the storm")
+            self.assertEqual(next_id, "scene_2_drive")
+            self.assertEqual(next_scene["text"], self.story["scenes"]["scene_2_drive"]["text"])
+        sqlite_store.close()
+    
+    def test_backend_must_save(self):
+        """Test that a backend without save_delta fails when it is created"""
+        class ReadOnlyStore(StoryStore):
+            pass
+        with self.assertRaises(TypeError):
+            ReadOnlyStore()
+    
+    def test_sqlite_lazy_lru(self):
+        """Test that SQLite scenes load on demand into a bounded cache"""
+        store = SqliteStoryStore(self.db_path, cache_size=2)
+        self.assertEqual(store.misses, 0)
+        for scene_id in ["scene_1", "scene_2_drive", "scene_2_call", "scene_1"]:
+            self.assertIsNotNone(store.get_scene(scene_id))
+        self.assertEqual(len(store._cache), 2)
+        self.assertEqual(store.misses, 4)
+        self.assertIsNone(store.get_scene("missing"))
+        store.close()
+    
+    def test_sqlite_save_delta(self):
+        """Test that overlay deltas are written into the database"""
+        store = SqliteStoryStore(self.db_path)
+        store.get_scene("scene_1")
+        store.save_delta({"scenes": {"scene_99_ai": {"text": "New"}},
+                          "choices": {"scene_1": {"Keep driving despite the storm": "scene_99_ai"}}})
+        kuku = KukuBuddy(store=store)
+        self.assertEqual(kuku.get_next_scene("scene_1", "Keep driving despite the storm")[0], "scene_99_ai")
+        store.close()
+
+class TestBinaryStory(unittest.TestCase):
+    """Test the compiled, memory-mapped story format"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.story_file = Path(self.tmp.name) / "thriller.json"
+        self.story_file.write_text(Path("stories/thriller.json").read_text())
+        compile_story(self.story_file)
+    
+    def tearDown(self):
+        get_journal(self.story_file).close()
+        self.tmp.cleanup()
+    
+    def test_compiled_matches_json(self):
+        """Test that the compiled store serves the same story as JSON"""
+        compiled = KukuBuddy(self.story_file)
+        json_story = json.loads(self.story_file.read_text())
+        self.assertIsInstance(compiled.store, BinaryStoryStore)
+        self.assertEqual(compiled.story["title"], json_story["title"])
+        self.assertEqual(compiled.get_start_scene()[1], json_story["start"])
+        for scene_id, scene in json_story["scenes"].items():
+            loaded = compiled.get_scene(scene_id)
+            self.assertEqual(loaded["text"], scene["text"])
+            self.assertEqual(dict(loaded.get("choices", {})), scene.get("choices", {}))
+        self.assertEqual(compiled.get_progress("scene_4_flee"), 0.75)
+        json_graph = StoryGraph(json_story)
+        self.assertEqual(compiled.get_reachable_endings("scene_1"), json_graph.reachable_endings("scene_1"))
+    
+    def test_journal_layered_over_compiled(self):
+        """Test that scenes journaled after compiling are served on top of the binary store"""
+        get_journal(self.story_file).append_delta({"scenes": {"s_ai": {"text": "New"}},
+                                                   "choices": {"scene_1": {"Keep driving despite the storm": "s_ai"}}})
+        kuku = KukuBuddy(self.story_file)
+        self.assertIsInstance(kuku.store, BinaryStoryStore)
+        self.assertEqual(kuku.get_scene("s_ai")["text"], "New")
+        self.assertEqual(kuku.get_next_scene("scene_1", "Keep driving despite the storm")[0], "s_ai")
+        self.assertEqual(kuku.get_scene("scene_2_call")["text"],
+                         json.loads(self.story_file.read_text())["scenes"]["scene_2_call"]["text"])
+    
+    def test_stale_compiled_falls_back_to_json(self):
+        """Test that a changed snapshot makes KukuBuddy use the JSON story"""
+        story = json.loads(self.story_file.read_text())
+        story["scenes"]["scene_1"]["text"] = "Rewritten"
+        self.story_file.write_text(json.dumps(story))
+        os.utime(self.story_file, ns=(0, os.stat(self.story_file).st_mtime_ns + 1_000_000))
+        kuku = KukuBuddy(self.story_file)
+        self.assertNotIsInstance(kuku.store, BinaryStoryStore)
+        self.assertEqual(kuku.get_scene("scene_1")["text"], "Rewritten")
+
+class TestStoryAnalyzer(unittest.TestCase):
+    """Test the story graph analyzer"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.report = analyze({
+            "start": "a",
+            "scenes": {
+                "a": {"text": "A", "question": "?", "choices": {"left": "b", "right": "c", "gen": "x_ai"}},
+                "b": {"text": "B", "question": "?", "choices": {"loop": "d"}},
+                "d": {"text": "D", "question": "?", "choices": {"back": "b", "broken": "a_choice_1"}},
+                "c": {"text": "C"},
+                "orphan": {"text": "O", "choices": {"go": "c"}}
+            }
+        })
+    
+    def test_problems(self):
+        """Test that structural problems are found"""
+        self.assertEqual(self.report["dangling_edges"], [("d", "broken", "a_choice_1")])
+        self.assertEqual(self.report["pending_ai_edges"], 1)
+        self.assertEqual(self.report["unreachable"], ["orphan"])
+        self.assertEqual(self.report["cycles"], [("d", "b")])
+        self.assertEqual(sorted(self.report["dead_ends"]), ["b", "d"])
+        self.assertEqual(self.report["missing_question"], ["orphan"])
+    
+    def test_histograms(self):
+        """Test branching and depth histograms"""
+        self.assertEqual(self.report["branching_histogram"], {0: 1, 1: 2, 2: 1, 3: 1})
+        self.assertEqual(self.report["depth_histogram"], {0: 1, 1: 2, 2: 1})
+        self.assertEqual(self.report["endings"], 1)
+
+class TestStoryGenerator(unittest.TestCase):
+    """Test the synthetic story generator"""
+    
+    def test_deterministic_and_valid(self):
+        """Test that generated stories are reproducible and well formed"""
+        story = generate_story(200, branching=3, seed=7)
+        self.assertEqual(story, generate_story(200, branching=3, seed=7))
+        self.assertNotEqual(story, generate_story(200, branching=3, seed=8))
+        report = analyze(story)
+        self.assertEqual(report["scenes"], 200)
+        self.assertFalse(report["dangling_edges"] or report["unreachable"] or report["dead_ends"])
+        self.assertEqual(max(report["branching_histogram"]), 3)
+    
+    def test_streamed_file_matches(self):
+        """Test that the streaming writer produces the same story"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "story.json"
+            write_story(path, 50, seed=3, indent=True)
+            self.assertEqual(json.loads(path.read_text()), generate_story(50, seed=3))
+    
+    def test_mood_density(self):
+        """Test that mood keywords drive the detected mood"""
+        calm = generate_story(20, mood_density=0.0)
+        self.assertTrue(all(detect_mood(scene["text"]) == "mysterious" for scene in calm["scenes"].values()))
+        moody = generate_story(20, mood_density=0.5)
+        self.assertGreater(len({detect_mood(scene["text"]) for scene in moody["scenes"].values()}), 1)
+
+class TestGenerationJobs(unittest.TestCase):
+    """Test background scene generation"""
+    
+    def setUp(self):
+        """Set up a session whose model blocks until released"""
+        self.queue = GenerationQueue(max_workers=1, max_pending=2)
+        self.release = threading.Event()
+        self.manager = MagicMock()
+        self.manager.build_extension_context.return_value = {}
+        self.manager.generate_scene_streaming.side_effect = (
+            lambda *args: self.release.wait(5) and ({"text": "B"}, 100)
+        )
+        self.manager.add_generated_scene.side_effect = partial(OpenAIManager.add_generated_scene, None)
+        story = {"start": "a", "scenes": {"a": {"text": "A", "choices": {"go": "b_ai", "stay": "c_ai"}}}}
+        self.kuku = KukuBuddy(store=MemoryStoryStore(story), queue=self.queue)
+        self.kuku.enable_dynamic_generation(self.manager)
+    
+    def tearDown(self):
+        self.release.set()
+        self.queue.shutdown(wait=True)
+    
+    def test_request_does_not_block(self):
+        """Test that a missing scene returns a job instead of waiting for the model"""
+        next_id, scene, job = self.kuku.request_next_scene("a", "go")
+        self.assertIsNone(next_id)
+        self.assertFalse(job.done())
+        self.assertIs(self.kuku.request_next_scene("a", "go")[2], job)
+        self.assertEqual(self.kuku.finish_generation(job), (None, None))
+        
+        self.release.set()
+        self.assertTrue(job.wait(5))
+        next_id, scene = self.kuku.finish_generation(job)
+        self.assertEqual(scene["text"], "B")
+        self.assertEqual(self.kuku.get_scene("a")["choices"]["go"], next_id)
+        self.assertEqual(self.kuku.store.saved_records[0]["id"], next_id)
+        self.assertEqual(self.queue.get_stats()["completed"], 1)
+    
+    def test_cancel_and_bounded_queue(self):
+        """Test that cancelled results are dropped and a full queue rejects jobs"""
+        running = self.kuku.request_next_scene("a", "go")[2]
+        queued = self.kuku.request_next_scene("a", "stay")[2]
+        self.assertIsNone(self.queue.submit("extra", print))
+        
+        self.kuku.cancel_generation()
+        self.assertEqual(queued.status, "cancelled")
+        self.release.set()
+        running.wait(5)
+        self.assertEqual(self.kuku.finish_generation(running), (None, None))
+        self.assertEqual(self.kuku.get_scene("a")["choices"]["go"], "b_ai")
+        self.assertFalse(self.kuku.overlay.scenes)
+        self.assertEqual(self.queue.get_stats()["rejected"], 1)
+
+class TestPrefetch(unittest.TestCase):
+    """Test speculative generation of AI children"""
+    
+    def setUp(self):
+        """Set up a session with three AI choices and a prefetch budget"""
+        self.queue = GenerationQueue(max_workers=2)
+        self.budget = PrefetchBudget(max_concurrent=2)
+        self.manager = MagicMock()
+        self.manager.build_extension_context.return_value = {}
+        self.manager.generate_scene_streaming.side_effect = lambda context, scene_id, choice, *args: ({"text": choice}, 50)
+        self.manager.add_generated_scene.side_effect = partial(OpenAIManager.add_generated_scene, None)
+        story = {"start": "a", "scenes": {
+            "a": {"text": "A", "choices": {"x": "x_ai", "y": "y_ai", "z": "z_ai", "home": "a"}}
+        }}
+        self.kuku = KukuBuddy(store=MemoryStoryStore(story), queue=self.queue)
+        self.kuku.enable_dynamic_generation(self.manager)
+    
+    def tearDown(self):
+        self.queue.shutdown(wait=True)
+    
+    def test_disabled_by_default(self):
+        """Test that nothing is generated speculatively unless enabled"""
+        self.assertEqual(self.kuku.prefetch_choices("a"), 0)
+        self.manager.generate_scene_streaming.assert_not_called()
+    
+    def test_click_hits_prefetched_scene(self):
+        """Test that choosing a prefetched scene reuses it and siblings count as waste"""
+        self.kuku.enable_prefetch(max_scenes=2, budget=self.budget)
+        self.assertEqual(self.kuku.prefetch_choices("a"), 2)
+        self.assertEqual(self.kuku.prefetch_choices("a"), 0)
+        for job in list(self.kuku.jobs.values()):
+            job.wait(5)
+        
+        next_id, scene = self.kuku.get_next_scene("a", "x")
+        self.assertEqual(scene["text"], "x")
+        self.kuku.prefetch_choices(next_id)
+        self.kuku.get_next_scene("a", "z")
+        
+        stats = self.budget.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["wasted"]), (1, 1, 1))
+        self.assertEqual((stats["used_tokens"], stats["wasted_tokens"]), (50, 50))
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(self.manager.generate_scene_streaming.call_count, 3)
+
+class TestSceneStream(unittest.TestCase):
+    """Test incremental parsing of streamed scenes"""
+    
+    REPLY = "[SCENE]\nThe door creaks.\nSomeone waits.\n[QUESTION]\nWhat now?\n[CHOICES]\nRun\nHide\n"
+    
+    def test_matches_whole_reply(self):
+        """Test that any chunking parses like the whole reply"""
+        expected = parse_scene(self.REPLY)
+        self.assertEqual(list(expected["choices"]), ["Run", "Hide"])
+        self.assertTrue(all(target.endswith("_ai") for target in expected["choices"].values()))
+        self.assertNotEqual(parse_scene(self.REPLY)["choices"], expected["choices"])
+        for size in (1, 2, 5, 7, len(self.REPLY)):
+            parser = SceneStreamParser()
+            for i in range(0, len(self.REPLY), size):
+                parser.feed(self.REPLY[i:i + size])
+            self.assertEqual(without_targets(parser.scene()), without_targets(expected))
+    
+    def test_partial_state(self):
+        """Test that text streams early while choices wait for their section to end"""
+        parser = SceneStreamParser()
+        parser.feed("[SCENE]\nThe door cr")
+        self.assertEqual(parser.text, "The door cr")
+        parser.feed("eaks.\n[QUES")
+        self.assertEqual(parser.text, "The door creaks.")
+        parser.feed("TION]\nWhat now?\n[CHOICES]\nRun\n")
+        self.assertEqual(parser.question, "What now?")
+        self.assertIsNone(parser.choices)
+        parser.close()
+        self.assertEqual(parser.choices, ["Run"])
+    
+    @patch('streamlit.session_state', {})
+    def test_streaming_generation(self):
+        """Test that OpenAIManager feeds the parser and reports usage"""
+        manager = OpenAIManager()
+        manager.client = MagicMock()
+        manager.client.chat.completions.create.return_value = stream_chunks(self.REPLY)
+        parser = SceneStreamParser()
+        scene, tokens = manager.generate_scene_streaming({}, "s", "Open it", parser)
+        self.assertEqual(without_targets(scene), without_targets(parse_scene(self.REPLY)))
+        self.assertEqual((parser.text, tokens), ("The door creaks. Someone waits.", 42))
+        self.assertTrue(manager.client.chat.completions.create.call_args.kwargs["stream"])
+
+class TestSceneSchema(unittest.TestCase):
+    """Test structured (JSON) scene replies"""
+    
+    REPLY = '{"text": "The door \\"creaks\\".", "question": "What now?", "choices": ["Run", "Hide"], "mood": "tense"}'
+    
+    def test_repair(self):
+        """Test that fences, trailing commas and truncation are fixed locally"""
+        expected = load_scene(self.REPLY)
+        self.assertEqual(expected["text"], 'The door "creaks".')
+        self.assertEqual(load_scene("```json\n" + self.REPLY.replace(']', ',]') + "\n```"), expected)
+        cut = load_scene(self.REPLY[:-20])
+        self.assertEqual((cut["choices"], cut["mood"]), (["Run", "Hide"], None))
+        self.assertEqual(json.loads(repair_json('{"a": ["b", "c')), {"a": ["b", "c"]})
+    
+    def test_validation(self):
+        """Test that replies without text or enough choices are rejected"""
+        for reply in ("no json", '{"text": "", "choices": ["a", "b"]}', '{"text": "T", "choices": ["a", "a"]}',
+                      '{"text": "T", "choices": "a, b"}'):
+            with self.assertRaises(SceneFormatError):
+                load_scene(reply)
+    
+    def test_stream_parser(self):
+        """Test that the scene text streams out of the unfinished JSON"""
+        parser = JsonSceneStreamParser()
+        parser.feed('{"text": "The door \\"cr')
+        self.assertEqual(parser.text, 'The door "cr')
+        for i in range(25, len(self.REPLY), 4):
+            parser.feed(self.REPLY[i:i + 4])
+        self.assertIsNone(parser.choices)
+        scene = parser.scene()
+        self.assertEqual(list(scene["choices"]), ["Run", "Hide"])
+        self.assertTrue(all(target.endswith("_ai") for target in scene["choices"].values()))
+        self.assertEqual((scene["mood"], parser.question), ("tense", "What now?"))
+    
+    def test_stream_parser_any_chunking(self):
+        """Test that the streamed text only ever grows toward the final text, however it is split"""
+        reply = '{"mood": "tense", "text": "Caf\\u00e9 \\\\ \\"door\\"", "question": "Q", "choices": ["a", "b"]}'
+        final = 'Café \\ "door"'
+        for size in (1, 3, 8):
+            parser = JsonSceneStreamParser()
+            for i in range(0, len(reply), size):
+                parser.feed(reply[i:i + size])
+                self.assertTrue(final.startswith(parser.text), parser.text)
+            self.assertEqual(parser.text, final)
+            self.assertEqual(parser.scene()["text"], final)
+    
+    @patch('streamlit.session_state', {})
+    def test_one_call_and_retry(self):
+        """Test that a scene costs one call, and an unusable reply is retried but not cached"""
+        tmp = tempfile.TemporaryDirectory()
+        cache = GenerationCache(Path(tmp.name) / "cache.sqlite3")
+        manager = OpenAIManager(cache=cache, structured=True)
+        manager.client = MagicMock()
+        manager.client.chat.completions.create.side_effect = [
+            stream_chunks('{"text": "Nothing"}'), stream_chunks(self.REPLY)
+        ]
+        parser = manager.new_parser()
+        scene, tokens = manager.generate_scene_streaming({}, "s", "Open it", parser)
+        self.assertEqual((scene["mood"], tokens), ("tense", 84))
+        self.assertEqual(parser.choices, ["Run", "Hide"])
+        request = manager.client.chat.completions.create.call_args.kwargs
+        self.assertEqual(request["response_format"], {"type": "json_object"})
+        self.assertEqual(without_targets(manager.generate_scene({}, "s", "Open it")), without_targets(scene))
+        self.assertEqual(manager.client.chat.completions.create.call_count, 2)
+        cache.close()
+        tmp.cleanup()
+
+class TestStoryContext(unittest.TestCase):
+    """Test the path-following context builder"""
+    
+    def setUp(self):
+        """Set up a long chain of scenes with a side branch at every step"""
+        scenes = {}
+        for i in range(200):
+            scenes[f"s{i}"] = {"text": f"Scene {i} begins here. " + "More words follow. " * 10,
+                               "choices": {"on": f"s{i + 1}", "aside": f"side{i}"}}
+            scenes[f"side{i}"] = {"text": f"Side scene {i}."}
+        self.overlay = StoryOverlay({"title": "Chain", "scenes": scenes})
+        self.path = [(f"s{i}", "on") for i in range(199)]
+    
+    def test_estimate_tokens(self):
+        """Test the offline token estimate on plain prose"""
+        self.assertEqual(estimate_tokens("The door creaks."), 4)
+        self.assertEqual(estimate_tokens("Unbelievably"), 2)
+    
+    def test_follows_path_within_budget(self):
+        """Test that context is the reader's path, bounded by the budget"""
+        builder = ContextBuilder(max_tokens=300)
+        context = builder.build(self.overlay, self.path, "s199")
+        ids = [scene["id"] for scene in context["previous_scenes"]]
+        self.assertEqual(ids[-1], "s199")
+        self.assertEqual(ids[:-1], [scene_id for scene_id, _ in self.path[-len(ids) + 1:]])
+        self.assertFalse(any(scene_id.startswith("side") for scene_id in ids))
+        total = estimate_tokens(context["summary"]) + sum(
+            estimate_tokens(scene["text"]) for scene in context["previous_scenes"])
+        self.assertLessEqual(total, 300 + 5)
+        self.assertIn("The reader chose: on.", context["summary"])
+    
+    def test_summaries_roll_forward(self):
+        """Test that each click extends the cached summary by one step"""
+        builder = ContextBuilder(max_tokens=300)
+        builder.build(self.overlay, self.path[:100], "s100")
+        self.assertEqual(builder.get_stats()["misses"], 1)
+        summaries = builder.get_stats()["summaries"]
+        builder.build(self.overlay, self.path[:101], "s101")
+        self.assertEqual(builder.get_stats()["summaries"], summaries + 1)
+        builder.build(self.overlay, self.path[:101], "s101")
+        self.assertEqual(builder.get_stats()["hits"], 1)
+
+class TestGenerationCache(unittest.TestCase):
+    """Test the persistent cache of model replies"""
+    
+    def setUp(self):
+        """Set up a cache in a temporary directory"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "cache.sqlite3"
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_key_covers_request(self):
+        """Test that every request parameter changes the key"""
+        base = ("m", "system", "prompt", 0.7, 300)
+        keys = {cache_key(*base)}
+        for i, value in enumerate(("m2", "system2", "prompt2", 0.8, 200)):
+            keys.add(cache_key(*base[:i], value, *base[i + 1:]))
+        self.assertEqual(len(keys), 6)
+    
+    def test_lru_ttl_and_persistence(self):
+        """Test eviction of the least recently used, expiry and reopening"""
+        cache = GenerationCache(self.path, max_entries=3)
+        for key in "abc":
+            cache.put(key, key.upper(), 10)
+        self.assertEqual(cache.get("a"), ("A", 10))
+        cache.put("d", "D")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_stats()["evictions"], 2)
+        cache.close()
+        
+        reopened = GenerationCache(self.path, ttl=0)
+        self.assertEqual(reopened.get_stats()["entries"], 2)
+        self.assertIsNone(reopened.get("a"))
+        reopened.close()
+    
+    def test_variants_round_robin(self):
+        """Test that stored variants are served in turn once all are filled"""
+        cache = GenerationCache(self.path, variants=2)
+        cache.put("k", "one")
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", "two")
+        self.assertEqual([cache.get("k")[0] for _ in range(4)], ["one", "two", "one", "two"])
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (4, 1, 2))
+        cache.close()
+    
+    @patch('streamlit.session_state', {})
+    def test_manager_skips_api_on_hit(self):
+        """Test that identical requests reach the API once, streamed or not"""
+        cache = GenerationCache(self.path)
+        manager = OpenAIManager(cache=cache)
+        manager.client = MagicMock()
+        manager.client.chat.completions.create.return_value = stream_chunks(TestSceneStream.REPLY)
+        first = manager.generate_scene_streaming({}, "s", "Open it")
+        parser = SceneStreamParser()
+        second = manager.generate_scene_streaming({}, "s", "Open it", parser)
+        self.assertEqual(manager.client.chat.completions.create.call_count, 1)
+        self.assertEqual(without_targets(first[0]), without_targets(second[0]))
+        self.assertEqual((first[1], second[1]), (42, 0))
+        self.assertEqual(parser.text, "The door creaks. Someone waits.")
+        self.assertEqual(without_targets(manager.generate_scene({}, "s", "Open it")), without_targets(first[0]))
+        self.assertEqual(manager.client.chat.completions.create.call_count, 1)
+        cache.close()
+
+class TestSingleFlight(unittest.TestCase):
+    """Test coalescing of concurrent generation of the same branch"""
+    
+    def setUp(self):
+        """Set up a story file and a model that blocks until released"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.story_file = Path(self.tmp.name) / "story.json"
+        self.story_file.write_text(json.dumps({
+            "title": "Test", "start": "a",
+            "scenes": {"a": {"text": "A", "choices": {"go": "b_ai"}}}
+        }))
+        self.queue = GenerationQueue(max_workers=4)
+        self.release = threading.Event()
+        self.manager = MagicMock()
+        self.manager.build_extension_context.return_value = {}
+        self.manager.generate_scene_streaming.side_effect = (
+            lambda *args: self.release.wait(5) and ({"text": "B"}, 10)
+        )
+        self.manager.add_generated_scene.side_effect = partial(OpenAIManager.add_generated_scene, None)
+        self.registry = StoryRegistry()
+    
+    def tearDown(self):
+        self.release.set()
+        self.queue.shutdown(wait=True)
+        get_journal(self.story_file).close()
+        self.tmp.cleanup()
+    
+    def reader(self):
+        kuku = KukuBuddy(self.story_file, registry=self.registry, queue=self.queue)
+        kuku.enable_dynamic_generation(self.manager)
+        return kuku
+    
+    def test_readers_share_one_call(self):
+        """Test that concurrent readers of a branch share one call and one saved scene"""
+        readers = [self.reader() for _ in range(5)]
+        late = self.reader()
+        jobs = [kuku.request_next_scene("a", "go")[2] for kuku in readers]
+        
+        # One reader giving up does not cancel the call for the others
+        jobs[0].cancel()
+        self.release.set()
+        results = [kuku.finish_generation(job) for kuku, job in zip(readers[1:], jobs[1:]) if job.wait(5)]
+        
+        self.assertEqual(self.manager.generate_scene_streaming.call_count, 1)
+        self.assertEqual(len({scene_id for scene_id, _ in results}), 1)
+        self.assertEqual(self.queue.get_stats()["coalesced"], 4)
+        records, _ = read_records(journal_path(self.story_file))
+        self.assertEqual([r["op"] for r in records], ["scene", "choice"])
+        
+        # A session loaded before the save reuses the finished call's result
+        late_job = late.request_next_scene("a", "go")[2]
+        self.assertTrue(late_job.done())
+        self.assertEqual(late.finish_generation(late_job)[0], results[0][0])
+        # and one loaded after it finds the saved branch
+        self.assertEqual(self.reader().get_next_scene("a", "go")[0], results[0][0])
+        self.assertEqual(self.manager.generate_scene_streaming.call_count, 1)
+        self.assertEqual(len(read_records(journal_path(self.story_file))[0]), 2)
+    
+    def test_sessions_keep_own_copy(self):
+        """Test that rewiring a shared generated scene in one session leaves the other's alone"""
+        self.manager.generate_scene_streaming.side_effect = (
+            lambda *args: self.release.wait(5) and ({"text": "B", "choices": {"Left": "l_ai", "Right": "r_ai"}}, 10)
+        )
+        first, second = self.reader(), self.reader()
+        jobs = [kuku.request_next_scene("a", "go")[2] for kuku in (first, second)]
+        self.release.set()
+        self.assertTrue(all(job.wait(5) for job in jobs))
+        scene_id = first.finish_generation(jobs[0])[0]
+        self.assertEqual(second.finish_generation(jobs[1])[0], scene_id)
+        
+        first.overlay.set_choice(scene_id, "Left", "private_to_first_ai")
+        self.assertEqual(second.get_scene(scene_id)["choices"], {"Left": "l_ai", "Right": "r_ai"})
+        self.assertEqual(jobs[0].result()[0]["choices"]["Left"], "l_ai")
+        self.assertEqual(self.manager.generate_scene_streaming.call_count, 1)
+    
+    def test_scene_ids_unique(self):
+        """Test that ids allocated from many threads never collide"""
+        allocator = SceneIdAllocator()
+        ids = []
+        threads = [threading.Thread(target=lambda: ids.extend(allocator.allocate() for _ in range(500)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 4000)
+        self.assertTrue(all(scene_id.endswith("_ai") for scene_id in ids))
+        
+        taken = {f"scene_{allocator.node}_{n}_ai" for n in range(4001, 4004)}
+        self.assertNotIn(allocator.allocate(taken), taken)
+
+class FakeAPIError(Exception):
+    """Stand-in for an OpenAI status error"""
+    
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = MagicMock(headers={"retry-after": retry_after} if retry_after else {})
+
+class TestLLMScheduler(unittest.TestCase):
+    """Test rate limiting, retries and priorities for model calls"""
+    
+    def test_token_bucket(self):
+        """Test that the bucket refills at its per-minute rate"""
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(3), 3.0)
+        now[0] = 2.0
+        self.assertAlmostEqual(bucket.wait_time(3), 1.0)
+        now[0] = 500.0
+        self.assertEqual(bucket.wait_time(1000), 0.0)
+    
+    def test_retries_with_backoff(self):
+        """Test that 429 and 5xx are retried, honouring Retry-After, and others are not"""
+        delays = []
+        scheduler = LLMScheduler(max_retries=3, base_delay=1.0, sleep=delays.append)
+        outcomes = [FakeAPIError(429, retry_after="7"), FakeAPIError(503), "done"]
+        
+        def flaky():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        
+        self.assertEqual(scheduler.call(flaky), "done")
+        self.assertEqual(delays[0], 7.0)
+        self.assertTrue(0 <= delays[1] <= 2.0)
+        self.assertEqual(scheduler.get_stats()["retries"], 2)
+        
+        with self.assertRaises(FakeAPIError):
+            scheduler.call(MagicMock(side_effect=FakeAPIError(400)))
+        always_busy = MagicMock(side_effect=FakeAPIError(429))
+        with self.assertRaises(FakeAPIError):
+            scheduler.call(always_busy)
+        self.assertEqual(always_busy.call_count, 4)
+        self.assertEqual(scheduler.get_stats()["in_flight"], 0)
+    
+    def test_priority_order(self):
+        """Test that interactive calls overtake queued speculative ones"""
+        scheduler = LLMScheduler(max_in_flight=1)
+        release = threading.Event()
+        order = []
+        holder = threading.Thread(target=scheduler.call, args=(lambda: release.wait(5),))
+        holder.start()
+        while scheduler.get_stats()["in_flight"] == 0:
+            time.sleep(0.01)
+        
+        promoted = Priority(BATCH)
+        threads = []
+        for name, priority in (("batch", BATCH), ("prefetch", PREFETCH), ("promoted", promoted),
+                               ("click", INTERACTIVE)):
+            thread = threading.Thread(target=scheduler.call, args=(lambda name=name: order.append(name),),
+                                      kwargs={"priority": priority})
+            thread.start()
+            threads.append(thread)
+            while scheduler.get_stats()["waiting"] < len(threads):
+                time.sleep(0.01)
+        promoted.raise_to(INTERACTIVE)
+        release.set()
+        for thread in [holder, *threads]:
+            thread.join(5)
+        self.assertEqual(order, ["promoted", "click", "prefetch", "batch"])
+    
+    @patch('streamlit.session_state', {})
+    def test_interrupted_stream_not_retried(self):
+        """Test that a stream failing after text was shown is not replayed"""
+        delays = []
+        manager = OpenAIManager(scheduler=LLMScheduler(sleep=delays.append))
+        manager.client = MagicMock()
+        
+        def broken_stream():
+            yield stream_chunks("[SCENE]\nHalf")[0]
+            raise FakeAPIError(503)
+        
+        manager.client.chat.completions.create.return_value = broken_stream()
+        parser = SceneStreamParser()
+        self.assertEqual(manager.generate_scene_streaming({}, "s", "Go", parser), (None, 0))
+        self.assertEqual(manager.client.chat.completions.create.call_count, 1)
+        self.assertEqual(delays, [])
+
+class TestLLMMetrics(unittest.TestCase):
+    """Test per-call latency, token and cost instrumentation"""
+    
+    def test_rolling_percentiles(self):
+        """Test percentiles per model and call type, leaving cache hits out of the timings"""
+        metrics = LLMMetrics(window=100)
+        for i in range(200):
+            metrics.record("gpt-3.5-turbo", "scene", latency=i / 100, prompt_tokens=100, completion_tokens=50)
+        metrics.record("gpt-3.5-turbo", "scene", latency=0.0, cache="hit")
+        metrics.record("gpt-3.5-turbo", "choices", latency=0.5, outcome="APIError")
+        rows = {row["kind"]: row for row in metrics.summary()}
+        self.assertEqual((rows["scene"]["calls"], rows["scene"]["cache_hits"]), (201, 1))
+        self.assertAlmostEqual(rows["scene"]["latency_p50"], 1.5, places=2)
+        self.assertAlmostEqual(rows["scene"]["latency_p99"], 1.99, places=2)
+        self.assertEqual((rows["choices"]["errors"], rows["choices"]["latency_p50"]), (1, 0.0))
+        self.assertAlmostEqual(metrics.get_stats()["cost"], 200 * call_cost("gpt-3.5-turbo", 100, 50))
+        self.assertEqual(call_cost("gpt-4o-mini-2024-07-18", 1000, 0), 0.00015)
+    
+    @patch('streamlit.session_state', {})
+    def test_manager_records_calls(self):
+        """Test that OpenAIManager records streamed calls, retries and cache hits"""
+        metrics = LLMMetrics()
+        delays = []
+        tmp = tempfile.TemporaryDirectory()
+        cache = GenerationCache(Path(tmp.name) / "cache.sqlite3")
+        manager = OpenAIManager(cache=cache, metrics=metrics, scheduler=LLMScheduler(sleep=delays.append))
+        manager.client = MagicMock()
+        chunks = stream_chunks(TestSceneStream.REPLY)
+        chunks[-1].usage = MagicMock(total_tokens=150, prompt_tokens=100, completion_tokens=50)
+        manager.client.chat.completions.create.side_effect = [FakeAPIError(429), chunks]
+        manager.generate_scene_streaming({}, "s", "Open it")
+        manager.generate_scene_streaming({}, "s", "Open it")
+        row = metrics.summary()[0]
+        self.assertEqual((row["kind"], row["calls"], row["retries"], row["cache_hits"]), ("scene_stream", 2, 1, 1))
+        self.assertEqual((row["prompt_tokens"], row["completion_tokens"]), (100, 50))
+        self.assertGreater(row["ttft_p50"], 0)
+        self.assertAlmostEqual(manager.take_cost(), call_cost("gpt-3.5-turbo", 100, 50))
+        self.assertEqual(manager.take_cost(), 0.0)
+        metrics.record_story(0.01)
+        self.assertEqual(metrics.get_stats()["cost_per_story"], 0.01)
+        cache.close()
+        tmp.cleanup()
+
+class TestClientPool(unittest.TestCase):
+    """Test cases for the shared OpenAI client pool"""
+    
+    def setUp(self):
+        self.pool = ClientPool(max_connections=4, max_keepalive=2, idle_ttl=60)
+    
+    def tearDown(self):
+        self.pool.close_all()
+    
+    def test_clients_shared_per_key_and_url(self):
+        """Test that sessions with the same key and URL share one client"""
+        client = self.pool.get("key", "http://localhost:1/v1")
+        self.assertIs(self.pool.get("key", "http://localhost:1/v1"), client)
+        self.assertIsNot(self.pool.get("other", "http://localhost:1/v1"), client)
+        self.assertIsNot(self.pool.get("key", "http://localhost:2/v1"), client)
+        self.assertEqual(client.max_retries, 0)
+        self.assertEqual(self.pool.get_stats(), {"clients": 3, "created": 3, "reused": 1, "closed": 0})
+    
+    def test_idle_clients_closed(self):
+        """Test that clients unused for the idle TTL are closed and rebuilt"""
+        client = self.pool.get("key")
+        with patch('client_pool.time.monotonic', return_value=time.monotonic() + 61):
+            self.pool.close_idle()
+        self.assertTrue(client.is_closed())
+        self.assertEqual(self.pool.get_stats()["clients"], 0)
+        self.assertIsNot(self.pool.get("key"), client)
+    
+    @patch('streamlit.session_state', {})
+    def test_managers_share_client(self):
+        """Test that managers for the same key use the pooled client"""
+        first = OpenAIManager(api_key="key", base_url="http://localhost:1/v1", pool=self.pool)
+        second = OpenAIManager(api_key="key", base_url="http://localhost:1/v1", pool=self.pool)
+        self.assertIs(first.client, second.client)
+        self.assertEqual(self.pool.get_stats()["created"], 1)
+    
+    def test_streams_reuse_connection(self):
+        """Test that streams read through iter_chunks hand their connection back"""
+        with FakeOpenAIServer() as server:
+            for _ in range(5):
+                stream = self.pool.get("key", server.base_url).chat.completions.create(
+                    model="gpt-3.5-turbo", messages=[{"role": "user", "content": "Go"}],
+                    stream=True, stream_options={"include_usage": True})
+                chunks = list(iter_chunks(stream))
+            self.assertEqual(server.get_stats()["connections"], 1)
+        self.assertTrue(chunks[0].choices[0].delta.content)
+        self.assertGreater(chunks[-1].usage.completion_tokens, 0)
+
+class TestStoryExpander(unittest.TestCase):
+    """Test offline breadth-first expansion of missing branches"""
+    
+    STORY = {"title": "T", "start": "a", "scenes": {
+        "a": {"text": "A", "choices": {"left": "b", "right": "x_ai", "up": "x_ai"}},
+        "b": {"text": "B", "choices": {"on": "x_ai", "back": "a"}},
+    }}
+    
+    def setUp(self):
+        self.manager = MagicMock()
+        self.manager.build_extension_context.return_value = {}
+        self.manager.generate_scene_with_usage.side_effect = lambda context, scene_id, choice, priority: (
+            {"text": f"{scene_id}/{choice}", "choices": {"Go": f"{scene_id}_choice_1"}}, 10
+        )
+        self.manager.add_generated_scene.side_effect = partial(OpenAIManager.add_generated_scene, None)
+    
+    def test_breadth_first_with_shared_targets(self):
+        """Test that each level is written once per missing target"""
+        expander = StoryExpander(self.STORY, self.manager, max_depth=3, workers=2)
+        stats = expander.expand()
+        self.assertEqual((stats["generated"], stats["deduplicated"], stats["tokens"]), (3, 1, 30))
+        story = expander.story()
+        self.assertEqual(story["scenes"]["x_ai"]["text"], "a/right")
+        second = story["scenes"]["x_ai"]["choices"]["Go"]
+        self.assertEqual(story["scenes"][second]["text"], "x_ai/Go")
+        report = analyze(story)
+        self.assertEqual((report["dangling_edges"], report["pending_ai_edges"]), ([], 1))
+        self.assertEqual(self.manager.generate_scene_with_usage.call_args.args[3], BATCH)
+    
+    def test_budget_checkpoint_and_resume(self):
+        """Test that a capped run checkpoints and a resumed run finishes the job"""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "expanded.json"
+            stats = expand_file(self.STORY, output, self.manager, max_depth=3, workers=1, max_scenes=1)
+            self.assertEqual(stats["generated"], 1)
+            with open(progress_path(output)) as f:
+                self.assertEqual(json.load(f)["generated"], 1)
+            stats = expand_file(self.STORY, output, self.manager, resume=True, max_depth=3, workers=1)
+            self.assertEqual(stats["generated"], 3)
+            self.assertEqual(self.manager.generate_scene_with_usage.call_count, 3)
+    
+    def test_checkpoints_append_to_journal(self):
+        """Test that checkpoints append to the output's journal, which is compacted at the end"""
+        generate = self.manager.generate_scene_with_usage.side_effect
+        calls = []
+        
+        def crash_on_third(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("interrupted")
+            return generate(*args)
+        
+        self.manager.generate_scene_with_usage.side_effect = crash_on_third
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "expanded.json"
+            with self.assertRaises(RuntimeError):
+                expand_file(self.STORY, output, self.manager, max_depth=3, workers=1, checkpoint_every=1)
+            # The snapshot was written once; the scenes since are in the journal
+            with open(output) as f:
+                self.assertEqual(set(json.load(f)["scenes"]), {"a", "b"})
+            records, _ = read_records(journal_path(output))
+            self.assertEqual(sum(record["op"] == "scene" for record in records), 2)
+            
+            stats = expand_file(self.STORY, output, self.manager, resume=True, max_depth=3, workers=1)
+            self.assertEqual(stats["generated"], 3)
+            self.assertEqual(os.path.getsize(journal_path(output)), 0)
+            with open(output) as f:
+                self.assertEqual(len(json.load(f)["scenes"]), 5)
+
+class TestFakeServer(unittest.TestCase):
+    """Test the local OpenAI-compatible stand-in server"""
+    
+    def test_replies_are_deterministic(self):
+        """Test that a prompt always gets the same well-formed scene"""
+        reply = scene_reply("prompt")
+        self.assertEqual(reply, scene_reply("prompt"))
+        self.assertNotEqual(reply, scene_reply("other prompt"))
+        self.assertGreaterEqual(len(parse_scene(reply)["choices"]), 2)
+        structured = load_scene(scene_reply("prompt", structured=True))
+        self.assertEqual(set(structured), {"text", "question", "choices", "mood"})
+    
+    @patch('streamlit.session_state', {})
+    def test_manager_against_server(self):
+        """Test streamed and plain generation through 429 bursts via the base URL"""
+        config = FakeServerConfig(burst_every=4, burst_length=1, retry_after=0)
+        with FakeOpenAIServer(config) as server:
+            manager = OpenAIManager(api_key="fake", base_url=server.base_url, pool=ClientPool(),
+                                    scheduler=LLMScheduler(sleep=lambda delay: None))
+            parser = SceneStreamParser()
+            streamed, tokens = manager.generate_scene_streaming({}, "s", "Go", parser)
+            self.assertGreater(tokens, 0)
+            self.assertEqual(parser.text, streamed["text"])
+            self.assertEqual(without_targets(manager.generate_scene({}, "s", "Go")), without_targets(streamed))
+            manager.structured = True
+            self.assertIn("mood", manager.generate_scene({}, "s", "Go"))
+            stats = server.get_stats()
+            manager.pool.close_all()
+        self.assertEqual((stats["requests"], stats["rate_limited"]), (4, 1))
+        self.assertEqual(manager.scheduler.get_stats()["retries"], 1)
+
+class TestModelRouter(unittest.TestCase):
+    """Test latency-aware routing of call types to models and endpoints"""
+    
+    def test_routes_and_downgrades(self):
+        """Test route fallbacks, SLO downgrades, cooldowns and per-session model choice"""
+        now = [0.0]
+        health = RouteHealth(min_samples=3, cooldown=30, clock=lambda: now[0])
+        router = ModelRouter.from_config({
+            "default": {"models": ["gpt-4o-mini"]},
+            "scene": {"models": ["gpt-4o", "gpt-4o-mini"], "slo_p95": 2.0},
+            "prefetch": {"models": ["gpt-4o-mini"]},
+        }, health)
+        self.assertEqual(router.route_name("scene_stream"), "scene")
+        self.assertEqual(router.route_name("scene", PREFETCH), "prefetch")
+        self.assertEqual(router.route_name("scene", BATCH), "scene")
+        self.assertEqual(router.route_name("choices"), "default")
+        
+        fast, slow = Endpoint("gpt-4o-mini"), Endpoint("gpt-4o")
+        for latency in (1.0, 3.0, 4.0):
+            self.assertEqual(router.choose("scene"), slow)
+            router.observe("scene", slow, latency)
+        self.assertEqual(router.choose("scene"), fast)
+        self.assertEqual(router.choose("scene", exclude=[fast]), slow)
+        self.assertTrue(health.get_stats()[0]["down"])
+        now[0] = 31
+        self.assertEqual(router.choose("scene"), slow)
+        
+        session = router.with_model("gpt-4o")
+        self.assertEqual((session.default_model, router.default_model), ("gpt-4o", "gpt-4o-mini"))
+        self.assertIs(session.health, health)
+    
+    @patch('streamlit.session_state', {})
+    def test_failover_between_stand_in_servers(self):
+        """Test moving to a faster endpoint over its SLO and failing over on errors"""
+        slow = FakeOpenAIServer(FakeServerConfig(latency_ms=150)).start()
+        fast = FakeOpenAIServer().start()
+        broken = FakeOpenAIServer(FakeServerConfig(error_rate=1.0)).start()
+        try:
+            router = ModelRouter.from_config({
+                "scene": {"models": [{"model": "gpt-4o", "base_url": slow.base_url},
+                                     {"model": "gpt-4o-mini", "base_url": fast.base_url}], "slo_p95": 0.1},
+                "choices": {"models": [{"model": "gpt-4o", "base_url": broken.base_url},
+                                       {"model": "gpt-4o-mini", "base_url": fast.base_url}]},
+            }, RouteHealth(min_samples=2))
+            manager = OpenAIManager(api_key="fake", pool=ClientPool(), router=router,
+                                    scheduler=LLMScheduler(sleep=lambda delay: None))
+            for _ in range(4):
+                scene, _ = manager.generate_scene_with_usage({}, "s", "Go")
+                self.assertIsNotNone(scene)
+            self.assertEqual((slow.get_stats()["requests"], fast.get_stats()["requests"]), (2, 2))
+            
+            choices = manager.generate_choices({}, "s", "A dark corridor.")
+            self.assertNotIn("Try again", choices)
+            self.assertEqual(broken.get_stats()["errors"], 1)
+            manager.pool.close_all()
+        finally:
+            for server in (slow, fast, broken):
+                server.stop()
+
+class TestHedging(unittest.TestCase):
+    """Test hedged requests, scene deadlines and falling back to written scenes"""
+    
+    def test_race_first_token_wins(self):
+        """Test that the first attempt to claim wins and the other's response is closed"""
+        race = HedgeRace()
+        slow_response = MagicMock()
+        started = threading.Event()
+        
+        def slow(entrant):
+            race.register(entrant, slow_response)
+            started.set()
+            time.sleep(0.2)
+            return "slow" if race.claim(entrant) else None
+        
+        race.run(slow)
+        started.wait(1)
+        race.run(lambda entrant: "fast" if race.claim(entrant) else None)
+        self.assertEqual(race.result(1), "fast")
+        slow_response.close.assert_called_once()
+    
+    @patch('streamlit.session_state', {})
+    def test_hedge_against_stand_in_servers(self):
+        """Test that a call slower than the recent p90 is duplicated and the faster reply used"""
+        slow = FakeOpenAIServer(FakeServerConfig(latency_ms=1000)).start()
+        fast = FakeOpenAIServer().start()
+        try:
+            metrics = LLMMetrics()
+            for _ in range(20):
+                metrics.record("gpt-4o", "scene_stream", latency=0.05, ttft=0.02)
+            router = ModelRouter.from_config({"scene": {"models": [
+                {"model": "gpt-4o", "base_url": slow.base_url}, {"model": "gpt-4o-mini", "base_url": fast.base_url}
+            ]}}, RouteHealth())
+            manager = OpenAIManager(api_key="fake", pool=ClientPool(), router=router, metrics=metrics,
+                                    scheduler=LLMScheduler(sleep=lambda delay: None))
+            parser = SceneStreamParser()
+            started = time.monotonic()
+            scene, tokens = manager.generate_scene_streaming({}, "s", "Go", parser)
+            self.assertLess(time.monotonic() - started, 0.9)
+            self.assertEqual(parser.text, scene["text"])
+            stats = metrics.get_stats()
+            self.assertEqual((stats["hedges_fired"], stats["hedges_won"]), (1, 1))
+            self.assertEqual(metrics.summary()[-1]["model"], "gpt-4o-mini")
+            
+            # Past the deadline without a token the call gives up
+            manager.hedging = False
+            manager.scene_deadline = 0.2
+            started = time.monotonic()
+            self.assertEqual(manager.generate_scene_streaming({}, "s", "Wait"), (None, 0))
+            self.assertLess(time.monotonic() - started, 0.9)
+            manager.pool.close_all()
+        finally:
+            slow.stop()
+            fast.stop()
+    
+    @patch('streamlit.session_state', {})
+    def test_losing_attempt_closed(self):
+        """Test that a non-streamed call's losing attempt holds its own slot only until it is closed"""
+        # The slow endpoint would take about ten seconds to send its whole reply
+        slow = FakeOpenAIServer(FakeServerConfig(latency_ms=300, tokens_per_second=10)).start()
+        fast = FakeOpenAIServer().start()
+        try:
+            metrics = LLMMetrics()
+            for _ in range(20):
+                metrics.record("gpt-4o", "scene", latency=0.05, ttft=0.02)
+            router = ModelRouter.from_config({"scene": {"models": [
+                {"model": "gpt-4o", "base_url": slow.base_url}, {"model": "gpt-4o-mini", "base_url": fast.base_url}
+            ]}}, RouteHealth())
+            scheduler = LLMScheduler(max_in_flight=2, sleep=lambda delay: None)
+            manager = OpenAIManager(api_key="fake", pool=ClientPool(), router=router, metrics=metrics,
+                                    scheduler=scheduler)
+            scene, tokens = manager.generate_scene_with_usage({}, "s", "Go")
+            self.assertIn("choices", scene)
+            self.assertEqual(metrics.get_stats()["hedges_won"], 1)
+            # Both attempts took a slot of their own; the loser gives its back once its reply starts
+            self.assertEqual(scheduler.get_stats()["in_flight"], 1)
+            started = time.monotonic()
+            while scheduler.get_stats()["in_flight"] and time.monotonic() - started < 2:
+                time.sleep(0.01)
+            self.assertEqual(scheduler.get_stats()["in_flight"], 0)
+            manager.pool.close_all()
+        finally:
+            slow.stop()
+            fast.stop()
+    
+    def test_late_scene_falls_back(self):
+        """Test that a reader past the deadline continues at the nearest written scene"""
+        release = threading.Event()
+        manager = MagicMock()
+        manager.build_extension_context.return_value = {}
+        manager.new_parser.return_value = SceneStreamParser()
+        manager.generate_scene_streaming.side_effect = lambda *args: release.wait(5) and None
+        story = {"start": "a", "scenes": {
+            "a": {"text": "A", "choices": {"x": "x_ai", "y": "y_ai"}},
+            "y_ai": {"text": "Y", "choices": {"on": "b"}},
+            "b": {"text": "B", "choices": {}},
+        }}
+        queue = GenerationQueue(max_workers=1)
+        kuku = KukuBuddy(store=MemoryStoryStore(story), queue=queue)
+        kuku.enable_dynamic_generation(manager)
+        kuku.scene_deadline = 0.1
+        self.assertEqual(kuku.get_next_scene("a", "x"), ("b", story["scenes"]["b"]))
+        self.assertEqual((kuku.fallbacks, kuku.jobs), (1, {}))
+        release.set()
+        queue.shutdown(wait=True)
+
+class TestBridgePool(unittest.TestCase):
+    """Test the pool of pre-written bridge scenes"""
+    
+    def bridge_manager(self):
+        manager = MagicMock()
+        manager.build_extension_context.return_value = {}
+        manager.new_parser.return_value = SceneStreamParser()
+        manager.add_generated_scene.side_effect = partial(OpenAIManager.add_generated_scene, None)
+        manager.generate_bridge_scene.side_effect = lambda context, mood, priority: (
+            {"text": f"A {mood} pause.", "question": "Now?", "choices": {"On": "x", "Back": "y"}, "mood": mood}, 30
+        )
+        return manager
+    
+    def test_take_prefers_mood(self):
+        """Test filling per mood, mood matching and the pool's counters"""
+        pool = BridgePool(size=1, moods=("tense", "peaceful"), idle=lambda manager: True)
+        pool.register("story", {"title": "T"}, self.bridge_manager(), start=False)
+        self.assertEqual([pool.fill_once() for _ in range(3)], [True, True, False])
+        self.assertEqual(pool.take("story", "tense")["mood"], "tense")
+        self.assertEqual(pool.take("story", "tense")["mood"], "peaceful")
+        self.assertIsNone(pool.take("story", "tense"))
+        stats = pool.get_stats()
+        self.assertEqual((stats["hits"], stats["mismatched"], stats["misses"], stats["depleted"]), (2, 1, 1, 2))
+        self.assertEqual((stats["size"], stats["capacity"], stats["tokens"]), (0, 2, 60))
+    
+    @patch('streamlit.session_state', {})
+    def test_manager_writes_bridge(self):
+        """Test that bridge scenes are parsed, mood-tagged and rejected without choices"""
+        manager = OpenAIManager(cache=None)
+        manager.client = MagicMock()
+        reply = lambda content: MagicMock(choices=[MagicMock(message=MagicMock(content=content))],
+                                          usage=MagicMock(total_tokens=40))
+        manager.client.chat.completions.create.side_effect = [
+            reply(TestSceneStream.REPLY), reply("[SCENE]\nJust text.")
+        ]
+        scene, tokens = manager.generate_bridge_scene({"title": "T"}, "tense")
+        self.assertEqual((scene["mood"], list(scene["choices"]), tokens), ("tense", ["Run", "Hide"], 40))
+        self.assertEqual(manager.generate_bridge_scene({"title": "T"}, "tense"), (None, 40))
+    
+    def test_late_scene_gets_bridge(self):
+        """Test splicing a bridge into a late branch and refilling the pool in the background"""
+        release = threading.Event()
+        manager = self.bridge_manager()
+        manager.generate_scene_streaming.side_effect = lambda *args: release.wait(5) and None
+        story = {"start": "a", "scenes": {"a": {"text": "A danger to escape.", "choices": {"x": "x_ai"}}}}
+        queue = GenerationQueue(max_workers=1)
+        pool = BridgePool(size=1, moods=("tense",), idle=lambda manager: True, interval=0.05)
+        kuku = KukuBuddy(store=MemoryStoryStore(story), queue=queue)
+        kuku.enable_dynamic_generation(manager)
+        kuku.enable_bridges(pool)
+        kuku.scene_deadline = 0.1
+        try:
+            for _ in range(100):
+                if pool.get_stats()["size"]:
+                    break
+                time.sleep(0.02)
+            bridge_id, bridge = kuku.get_next_scene("a", "x")
+            self.assertEqual(bridge["text"], "A tense pause.")
+            self.assertTrue(all(target.endswith("_ai") for target in bridge["choices"].values()))
+            self.assertEqual(kuku.overlay.next_scene_id("a", "x"), bridge_id)
+            for _ in range(100):
+                if pool.get_stats()["generated"] == 2:
+                    break
+                time.sleep(0.02)
+            self.assertEqual((pool.get_stats()["hits"], pool.get_stats()["size"]), (1, 1))
+        finally:
+            pool.stop()
+            release.set()
+            queue.shutdown(wait=True)
+
+class TestChoiceIndex(unittest.TestCase):
+    """Test near-duplicate choice matching"""
+    
+    def test_rewordings_match(self):
+        """Test that rewordings match within a scene, and opposites and other scenes do not"""
+        index = ChoiceIndex(threshold=0.65)
+        index.add("a", "Check in to the motel", "motel_ai")
+        index.add("a", "Open the door", "door_ai")
+        index.add("b", "Follow the stranger", "follow_ai")
+        self.assertEqual(index.find("a", "Check into the motel for the night")[2], "motel_ai")
+        self.assertEqual(index.find("a", "open the door!")[2], "door_ai")
+        self.assertIsNone(index.find("a", "Close the door"))
+        self.assertIsNone(index.find("a", "Don't open the door"))
+        self.assertIsNone(index.find("a", "Follow the stranger"))
+        self.assertIsNone(index.find("b", "Follow the strange noise"))
+        stats = index.get_stats()
+        self.assertEqual((stats["branches"], stats["lookups"], stats["matches"]), (3, 6, 2))
+    
+    def test_least_recent_scenes_evicted(self):
+        """Test that the index keeps a bounded number of scenes, dropping the least recently used"""
+        index = ChoiceIndex(max_scenes=2)
+        index.add("a", "Open the door", "door_ai")
+        index.add_scene("b", {"Follow the stranger": "follow_ai", "Run": "run_ai"}, {"follow_ai": {}})
+        self.assertEqual(index.find("a", "open the door!")[2], "door_ai")
+        index.add("c", "Climb the ridge", "ridge_ai")
+        # "b" was used least recently
+        self.assertIsNone(index.find("b", "Follow that stranger"))
+        self.assertEqual(index.find("a", "open the door!")[2], "door_ai")
+        stats = index.get_stats()
+        self.assertEqual((len(index), stats["scenes"], stats["evictions"]), (2, 2, 1))
+        self.assertEqual(stats["buckets"], 2 * BANDS)
+        # An evicted scene is indexed again when a reader comes back to it
+        index.add_scene("b", {"Follow the stranger": "follow_ai"}, {"follow_ai": {}})
+        self.assertEqual(index.find("b", "Follow that stranger")[2], "follow_ai")
+    
+    def test_reader_reuses_branch(self):
+        """Test that a reworded choice is pointed at the written branch instead of generating"""
+        story = {"start": "a", "scenes": {
+            "a": {"text": "A motel.", "choices": {"Check in to the motel": "m_ai", "Check into the motel": "n_ai"}},
+            "m_ai": {"text": "The room.", "choices": {}},
+        }}
+        manager = MagicMock()
+        kuku = KukuBuddy(store=MemoryStoryStore(story), choice_index=ChoiceIndex())
+        kuku.enable_dynamic_generation(manager)
+        self.assertEqual(kuku.get_next_scene("a", "Check into the motel")[0], "m_ai")
+        self.assertEqual(kuku.overlay.next_scene_id("a", "Check into the motel"), "m_ai")
+        self.assertEqual(kuku.generate_choice_scene("a", "check in at the motel"), "m_ai")
+        manager.generate_scene_streaming.assert_not_called()
+        manager.generate_scene_with_usage.assert_not_called()
 
 def run_tests():
     """Run all tests"""
@@ -122,6 +1517,30 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestKukuBuddy))
     suite.addTests(loader.loadTestsFromTestCase(TestOpenAIManager))
     suite.addTests(loader.loadTestsFromTestCase(TestMemoryManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryRegistry))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryGraph))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryOverlay))
+    suite.addTests(loader.loadTestsFromTestCase(TestSceneJournal))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryStores))
+    suite.addTests(loader.loadTestsFromTestCase(TestBinaryStory))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryAnalyzer))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryGenerator))
+    suite.addTests(loader.loadTestsFromTestCase(TestGenerationJobs))
+    suite.addTests(loader.loadTestsFromTestCase(TestPrefetch))
+    suite.addTests(loader.loadTestsFromTestCase(TestSceneStream))
+    suite.addTests(loader.loadTestsFromTestCase(TestSceneSchema))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryContext))
+    suite.addTests(loader.loadTestsFromTestCase(TestGenerationCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestSingleFlight))
+    suite.addTests(loader.loadTestsFromTestCase(TestLLMScheduler))
+    suite.addTests(loader.loadTestsFromTestCase(TestLLMMetrics))
+    suite.addTests(loader.loadTestsFromTestCase(TestClientPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestModelRouter))
+    suite.addTests(loader.loadTestsFromTestCase(TestHedging))
+    suite.addTests(loader.loadTestsFromTestCase(TestBridgePool))
+    suite.addTests(loader.loadTestsFromTestCase(TestChoiceIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestStoryExpander))
+    suite.addTests(loader.loadTestsFromTestCase(TestFakeServer))
     
     # Run tests
     runner = unittest.TextTestRunner(verbosity=2)
@@ -1,5 +1,22 @@
 # utils.py
 
+MOOD_KEYWORDS = {
+    "tense": ["sudden", "quickly", "danger", "scared", "rush", "chase", "escape", "hurry"],
+    "mysterious": ["strange", "curious", "wonder", "mystery", "unknown", "suspicious", "clue"],
+    "peaceful": ["calm", "quiet", "gentle", "safe", "peaceful", "steady", "careful"],
+    "dramatic": ["dramatic", "intense", "shocking", "reveal", "twist", "surprise", "discover"]
+}
+
+def detect_mood(text):
+    """
+    Detects the mood of a scene from keyword matches in its text.
+    Falls back to "mysterious" when no keyword is found.
+    """
+    text = text.lower()
+    mood_scores = {mood: sum(1 for word in words if word in text)
+                   for mood, words in MOOD_KEYWORDS.items()}
+    return max(mood_scores.items(), key=lambda x: x[1])[0] if any(mood_scores.values()) else "mysterious"
+
 def assign_badge(path):
     """
     Assigns a badge based on the choices made in the story path.